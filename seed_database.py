@@ -9,6 +9,8 @@ from dotenv import load_dotenv
 from sqlalchemy import create_engine, text
 from sqlalchemy.orm import Session
 
+from src.db_helper import run_migrations
+
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
@@ -20,10 +22,14 @@ try:
     print("Connected to database")
 
 
-    # Create tables if they don't exist
+    # Recreate tables from src/schema.sql so the schema has a single source
     with engine.connect() as conn:
         print("Clearing existing tables")
         for cmd in [
+            "DROP TABLE IF EXISTS tag_version CASCADE",
+            "DROP TABLE IF EXISTS doi_jobs CASCADE",
+            "DROP TABLE IF EXISTS doi_cache CASCADE",
+            "DROP TABLE IF EXISTS deleted_references CASCADE",
             "DROP TABLE IF EXISTS user_ref CASCADE",
             "DROP TABLE IF EXISTS reference_tags CASCADE",
             "DROP TABLE IF EXISTS reference_values CASCADE",
@@ -32,79 +38,16 @@ try:
             "DROP TABLE IF EXISTS fields CASCADE",
             "DROP TABLE IF EXISTS tags CASCADE",
             "DROP TABLE IF EXISTS users CASCADE",
-            "TRUNCATE TABLE reference_types RESTART IDENTITY CASCADE"
+            "DROP TABLE IF EXISTS reference_types CASCADE",
+            "DROP TABLE IF EXISTS schema_migrations CASCADE"
         ]:
             conn.execute(text(cmd))
 
-        conn.execute(text("""
-            CREATE TABLE IF NOT EXISTS reference_types (
-                id SERIAL PRIMARY KEY,
-                name VARCHAR(50) UNIQUE NOT NULL
-            )
-        """))
-        conn.execute(text("""
-            CREATE TABLE IF NOT EXISTS fields (
-                id SERIAL PRIMARY KEY,
-                key_name VARCHAR(50) NOT NULL,
-                data_type VARCHAR(20) NOT NULL,
-                input_type VARCHAR(20),
-                additional BOOLEAN DEFAULT FALSE
-            )
-        """))
-        conn.execute(text("""
-            CREATE TABLE IF NOT EXISTS reference_type_fields (
-                reference_type_id INT NOT NULL REFERENCES reference_types(id),
-                field_id INT NOT NULL REFERENCES fields(id),
-                required BOOLEAN DEFAULT FALSE,
-                PRIMARY KEY(reference_type_id, field_id)
-            )
-        """))
-        conn.execute(text("""
-            CREATE TABLE IF NOT EXISTS tags (
-                id SERIAL PRIMARY KEY,
-                name VARCHAR(100) UNIQUE NOT NULL
-            )
-        """))
-        conn.execute(text("""
-            CREATE TABLE IF NOT EXISTS single_reference (
-                id SERIAL PRIMARY KEY,
-                reference_type_id INT NOT NULL REFERENCES reference_types(id),
-                bib_key VARCHAR(100) UNIQUE NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                is_public BOOLEAN DEFAULT TRUE
-            )
-        """))
-        conn.execute(text("""
-            CREATE TABLE IF NOT EXISTS reference_tags (
-                reference_id INT NOT NULL REFERENCES single_reference(id) ON DELETE CASCADE,
-                tag_id INT NOT NULL REFERENCES tags(id) ON DELETE CASCADE,
-                PRIMARY KEY(reference_id, tag_id)
-            )
-        """))
-        conn.execute(text("""
-            CREATE TABLE IF NOT EXISTS reference_values (
-                id SERIAL PRIMARY KEY,
-                reference_id INT NOT NULL REFERENCES single_reference(id) ON DELETE CASCADE,
-                field_id INT NOT NULL REFERENCES fields(id),
-                value TEXT
-            )
-        """))
-        conn.execute(text("""
-            CREATE TABLE IF NOT EXISTS users (
-                id SERIAL PRIMARY KEY,
-                username VARCHAR(50) UNIQUE NOT NULL,
-                password_hash VARCHAR(255) NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """))
-        conn.execute(text("""
-            CREATE TABLE IF NOT EXISTS user_ref (
-                user_id INT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
-                reference_id INT NOT NULL REFERENCES single_reference(id) ON DELETE CASCADE,
-                PRIMARY KEY(user_id, reference_id)
-            )
-        """))
+        schema_path = os.path.join(os.path.dirname(__file__), "src", "schema.sql")
+        with open(schema_path, "r", encoding="utf-8") as f:
+            conn.execute(text(f.read().strip()))
         conn.commit()
+    run_migrations(engine)
     print("Ensured database tables exist")
 
     with open('form-fields.json', 'r') as f:
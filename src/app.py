@@ -1,7 +1,9 @@
 """Flask application routes and initialization."""
 
+import io
 import re
 from functools import wraps
+from itertools import chain
 
 from flask import (
     Response,
@@ -13,6 +15,7 @@ from flask import (
     render_template,
     request,
     session,
+    stream_with_context,
     url_for,
 )
 
@@ -20,31 +23,49 @@ from src.config import app, test_env
 from src.db_helper import reset_db
 from src.util import (
     FormFieldsError,
-    UtilError,
-    format_bibtex_entry,
-    get_doi_data_from_api,
+    get_field_index,
     get_fields_for_type,
+    iter_bibtex_chunks,
+    render_bibtex_entry,
 )
 from src.utils import references
+from src.utils.bibtex_import import BibtexImportError, import_bibtex
+from src.utils.changes import (
+    DEFAULT_CHANGE_LIMIT,
+    MAX_CHANGE_LIMIT,
+    get_reference_changes,
+)
+from src.utils.doi_batch import normalize_dois, split_dois
+from src.utils.doi_jobs import get_doi_job, submit_doi_batch_job, submit_doi_job
 from src.utils.references import (
+    DEFAULT_FUZZY_THRESHOLD,
+    DEFAULT_PAGE_SIZE,
+    KEYSET_SORTS,
+    MAX_PAGE_SIZE,
+    PAGE_SIZE_OPTIONS,
     DatabaseError,
+    count_user_references,
     delete_reference_by_bib_key,
-    filter_and_sort_search_results,
+    delete_references_by_bib_keys,
+    find_references_with_facets,
+    get_added_references_page,
     get_reference_by_bib_key,
-    get_references_filtered_sorted,
-    search_reference_by_query,
+    get_references_by_bib_keys,
+    iter_added_references,
+    make_page,
     get_reference_visibility,
-    get_all_added_references,
+    set_references_visibility,
 )
 from src.utils.tags import (
     TagError,
     TagExistsError,
-    add_tag,
     add_tag_to_reference,
     delete_tag_from_reference,
+    get_or_create_tag,
     get_tag_by_reference,
-    get_tag_id_by_name,
     get_tags,
+    tag_references,
+    untag_references,
 )
 from src.utils.users import (
     AuthenticationError,
@@ -98,6 +119,40 @@ def require_login():
         return redirect(url_for("login", next=request.path))
 
 
+def parse_page_size(value) -> int:
+    """Parse a page size request parameter, clamped to 1..MAX_PAGE_SIZE."""
+    try:
+        page_size = int(value)
+    except (TypeError, ValueError):
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(page_size, MAX_PAGE_SIZE))
+
+
+def parse_threshold(value) -> float:
+    """Parse a fuzzy search similarity threshold, clamped to 0.05..1.0."""
+    try:
+        threshold = float(value)
+    except (TypeError, ValueError):
+        return DEFAULT_FUZZY_THRESHOLD
+    return max(0.05, min(threshold, 1.0))
+
+
+def bibtex_download(references, filename: str) -> Response:
+    """Stream references as a BibTeX file download.
+
+    The references iterable is consumed while the response is sent, inside
+    the request context, so a server-side cursor can feed it row by row.
+    """
+    return Response(
+        stream_with_context(iter_bibtex_chunks(references)),
+        mimetype="application/x-bibtex",
+        headers={
+            "Content-Disposition": f"attachment; filename={filename}",
+            "Content-Type": "application/x-bibtex; charset=utf-8",
+        },
+    )
+
+
 def login_user(user: dict):
     """Persist user info into the session."""
     session["user_id"] = user["id"]
@@ -234,18 +289,31 @@ def add():
 
 @app.route("/all")
 def all_references():
-    """See all added references listed on one page."""
+    """See all added references, one page at a time."""
+    page_size = parse_page_size(request.args.get("page_size"))
+    cursor = request.args.get("cursor") or None
     try:
-        data = references.get_all_added_references(user_id=None)
+        page = get_added_references_page(
+            user_id=None, page_size=page_size, cursor=cursor
+        )
     except DatabaseError as e:
         flash(f"Database error: {str(e)}", "error")
         data = []
         return render_template("all.html", data=data, session=session)
 
+    data = page["references"]
     for reference in data:
         timestamp = reference["created_at"]
         reference["created_at"] = timestamp.strftime("%H:%M, %m.%d.%y")
-    return render_template("all.html", data=data, session=session)
+    return render_template(
+        "all.html",
+        data=data,
+        session=session,
+        cursor=cursor,
+        next_cursor=page["next_cursor"],
+        page_size=page_size,
+        page_size_options=PAGE_SIZE_OPTIONS,
+    )
 
 
 @app.route("/edit/<bib_key>")
@@ -365,6 +433,109 @@ def delete_reference(bib_key):
         return redirect(request.referrer or "/all")
 
 
+def _selected_bib_keys() -> list:
+    """Return the distinct bib_keys selected on the user page, in order."""
+    keys = (key.strip() for key in request.form.getlist("bib_keys"))
+    return list(dict.fromkeys(key for key in keys if key))
+
+
+def _remove_from_group(bib_keys) -> None:
+    """Remove bib_keys from the session group."""
+    removed = set(bib_keys)
+    group = session["group"]["references"]
+    if removed.intersection(group):
+        session["group"]["references"] = [key for key in group if key not in removed]
+        session.modified = True
+
+
+@app.route("/references/bulk-delete", methods=["POST"])
+@login_required
+def bulk_delete_references():
+    """Delete the references selected on the user page."""
+    bib_keys = _selected_bib_keys()
+    if not bib_keys:
+        flash("Valitse poistettavat viitteet.", "error")
+        return redirect(request.referrer or url_for("user_page"))
+
+    try:
+        deleted = delete_references_by_bib_keys(bib_keys, session["user_id"])
+    except DatabaseError as e:
+        flash(f"Database error while deleting: {str(e)}", "error")
+        return redirect(request.referrer or url_for("user_page"))
+
+    _remove_from_group(deleted)
+    flash(f"{len(deleted)} viitettä poistettu", "success")
+    if len(deleted) < len(bib_keys):
+        flash(
+            f"{len(bib_keys) - len(deleted)} viitettä ei löytynyt tai sinulla ei "
+            "ole oikeuksia poistaa niitä",
+            "error",
+        )
+    return redirect(request.referrer or url_for("user_page"))
+
+
+@app.route("/references/bulk-visibility", methods=["POST"])
+@login_required
+def bulk_set_visibility():
+    """Make the references selected on the user page public or private."""
+    bib_keys = _selected_bib_keys()
+    visibility = request.form.get("visibility")
+    if not bib_keys or visibility not in ("public", "private"):
+        flash("Valitse viitteet ja näkyvyys.", "error")
+        return redirect(request.referrer or url_for("user_page"))
+
+    is_public = visibility == "public"
+    try:
+        updated = set_references_visibility(bib_keys, session["user_id"], is_public)
+    except DatabaseError as e:
+        flash(f"Database error: {str(e)}", "error")
+        return redirect(request.referrer or url_for("user_page"))
+
+    # Ryhmään voi kuulua vain julkisia viitteitä
+    if not is_public:
+        _remove_from_group(updated)
+    label = "julkisiksi" if is_public else "yksityisiksi"
+    flash(f"{len(updated)} viitettä muutettu {label}", "success")
+    if len(updated) < len(bib_keys):
+        flash(
+            f"{len(bib_keys) - len(updated)} viitettä ei löytynyt tai sinulla ei "
+            "ole oikeuksia muokata niitä",
+            "error",
+        )
+    return redirect(request.referrer or url_for("user_page"))
+
+
+@app.route("/references/bulk-tag", methods=["POST"])
+@login_required
+def bulk_tag_references():
+    """Set or remove the tag of the references selected on the user page."""
+    bib_keys = _selected_bib_keys()
+    tag_value = request.form.get("tag", "").strip()
+    if not bib_keys:
+        flash("Valitse viitteet.", "error")
+        return redirect(request.referrer or url_for("user_page"))
+
+    try:
+        owned = get_references_by_bib_keys(bib_keys, user_id=session["user_id"])
+        reference_ids = [reference["id"] for reference in owned]
+        if tag_value:
+            changed = tag_references(int(tag_value), reference_ids)
+        else:
+            changed = untag_references(reference_ids)
+    except (DatabaseError, TagError, ValueError) as e:
+        flash(f"Error updating tags: {str(e)}", "error")
+        return redirect(request.referrer or url_for("user_page"))
+
+    flash(f"Avainsana päivitetty {changed} viitteeseen", "success")
+    if len(owned) < len(bib_keys):
+        flash(
+            f"{len(bib_keys) - len(owned)} viitettä ei löytynyt tai sinulla ei "
+            "ole oikeuksia muokata niitä",
+            "error",
+        )
+    return redirect(request.referrer or url_for("user_page"))
+
+
 def _save_or_edit_reference(editing: bool):
     """Shared logic for saving and editing references.
 
@@ -415,10 +586,12 @@ def _save_or_edit_reference(editing: bool):
 
     # Hae dynaamiset kentät
     try:
-        fields = get_fields_for_type(reference_type)
+        field_index = get_field_index(reference_type)
     except FormFieldsError as e:
         flash(f"Error loading form fields: {str(e)}", "error")
         return redirect(f"/add?form={reference_type}")
+    fields = field_index["fields"] if field_index is not None else []
+    required_keys = field_index["required"] if field_index is not None else ()
 
     # Käsittele tagit
     new_tag_name = request.form.get("new_tag", "").strip()
@@ -426,27 +599,21 @@ def _save_or_edit_reference(editing: bool):
 
     if new_tag_name:
         try:
-            selected_tag_id = add_tag(new_tag_name)
-            flash(f"Uusi avainsana '{new_tag_name}' lisätty", "success")
-        except TagExistsError:
-            try:
-                selected_tag_id = get_tag_id_by_name(new_tag_name)
-            except TagError as e:
-                flash(f"Error fetching existing tag: {str(e)}", "error")
-                return redirect(f"/add?form={reference_type}")
+            selected_tag_id, created = get_or_create_tag(new_tag_name)
         except TagError as e:
             flash(f"Error adding tag: {str(e)}", "error")
             return redirect(f"/add?form={reference_type}")
+        if created:
+            flash(f"Uusi avainsana '{new_tag_name}' lisätty", "success")
 
     # Validoi kentät
     errors = []
     for field in fields:
         name = field["key"]
         label = field.get("label", name)
-        required = field.get("required", False)
         value = request.form.get(name, "").strip()
 
-        if required and not value:
+        if name in required_keys and not value:
             errors.append(f"Field '{label}' is required")
 
         form_data[name] = value or None
@@ -521,36 +688,24 @@ def export_bibtex():
     try:
         type_param = request.args.get("type", "all").strip()
         if type_param == "group" and len(session["group"]["references"]) > 0:
-            data = []
-            for bib_key in session["group"]["references"]:
-                ref = get_reference_by_bib_key(bib_key, user_id=None)
-                if ref:
-                    data.append(ref)
+            data = iter(
+                get_references_by_bib_keys(session["group"]["references"], user_id=None)
+            )
         else:
-            data = get_all_added_references(user_id=None)
+            data = iter_added_references(user_id=None)
 
-        if not data:
+        # Ensimmäinen viite haetaan heti, jotta tyhjä vienti ja tietokantavirheet
+        # käsitellään ennen vastauksen aloittamista
+        first = next(data, None)
+        if first is None:
             return (
                 "% No references found\n",
                 200,
                 {"Content-Type": "text/plain; charset=utf-8"},
             )
-        # Muodosta BibTeX-sisältö
-        bibtex_content = ""
-        for ref in data:
-            bibtex_entry = format_bibtex_entry(ref)
-            bibtex_content += bibtex_entry + "\n\n"
-
-        # Palauta BibTeX-tiedosto ladattavaksi
-        response = app.response_class(
-            bibtex_content,
-            mimetype="application/x-bibtex",
-            headers={
-                "Content-Disposition": "attachment; filename=references.bib",
-                "Content-Type": "application/x-bibtex; charset=utf-8",
-            },
-        )
-        return response
+
+        # Loput viitteet muotoillaan sitä mukaa kun vastausta lähetetään
+        return bibtex_download(chain([first], data), "references.bib")
 
     except DatabaseError as e:
         flash(f"Database error during BibTeX export: {str(e)}", "error")
@@ -574,28 +729,14 @@ def export_user_bibtex():
             return redirect(url_for("login"))
 
         # Hae käyttäjän KAIKKI viitteet (julkiset + yksityiset)
-        data = get_all_added_references(user_id=user_id)
+        data = iter_added_references(user_id=user_id)
 
-        if not data:
+        first = next(data, None)
+        if first is None:
             flash("You have no references to export", "info")
             return redirect(url_for("user_page"))
 
-        # Muodosta BibTeX-sisältö
-        bibtex_content = ""
-        for ref in data:
-            bibtex_entry = format_bibtex_entry(ref)
-            bibtex_content += bibtex_entry + "\n\n"
-
-        # Palauta BibTeX-tiedosto ladattavaksi
-        response = app.response_class(
-            bibtex_content,
-            mimetype="application/x-bibtex",
-            headers={
-                "Content-Disposition": "attachment; filename=my_references.bib",
-                "Content-Type": "application/x-bibtex; charset=utf-8",
-            },
-        )
-        return response
+        return bibtex_download(chain([first], data), "my_references.bib")
 
     except DatabaseError as e:
         flash(f"Database error during BibTeX export: {str(e)}", "error")
@@ -608,37 +749,194 @@ def export_user_bibtex():
         return redirect(url_for("user_page"))
 
 
+@app.route("/export/user_bibtex/changes")
+@login_required
+def export_user_bibtex_changes():
+    """Return the current user's references changed or deleted since a cursor.
+
+    Query parameters: cursor (next_cursor of the previous call, omitted on
+    the first sync) and limit. Changes are returned oldest first as BibTeX
+    entries or deleted bib_keys; keep calling while has_more is true. The
+    first sync also lists references deleted before it, which a new client
+    can skip.
+    """
+    try:
+        limit = int(request.args.get("limit", DEFAULT_CHANGE_LIMIT))
+    except ValueError:
+        limit = DEFAULT_CHANGE_LIMIT
+    limit = max(1, min(limit, MAX_CHANGE_LIMIT))
+
+    try:
+        feed = get_reference_changes(
+            session["user_id"], request.args.get("cursor") or None, limit
+        )
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except DatabaseError as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+    changes = []
+    for change in feed["changes"]:
+        item = {
+            "action": change["action"],
+            "bib_key": change["bib_key"],
+            "changed_at": change["changed_at"].isoformat(),
+        }
+        if change["action"] == "upsert":
+            item["bibtex"] = render_bibtex_entry(change)
+        changes.append(item)
+
+    return jsonify(
+        {
+            "success": True,
+            "changes": changes,
+            "next_cursor": feed["next_cursor"],
+            "has_more": feed["has_more"],
+        }
+    )
+
+
+@app.route("/import/bibtex", methods=["POST"])
+@login_required
+def import_bibtex_file():
+    """Import the references of an uploaded .bib file for the current user."""
+    upload = request.files.get("bib-file")
+    if upload is None or not upload.filename:
+        flash("Valitse tuotava .bib-tiedosto.", "error")
+        return redirect(url_for("user_page"))
+
+    try:
+        report = import_bibtex(
+            io.TextIOWrapper(upload.stream, encoding="utf-8", errors="replace"),
+            session["user_id"],
+            tag_name=request.form.get("tag"),
+            is_public=not request.form.get("private"),
+        )
+    except BibtexImportError as e:
+        flash(str(e), "error")
+        return redirect(url_for("user_page"))
+
+    flash(f"Tuotiin {report['imported']} viitettä.", "success")
+    skipped = report["existing"] + report["duplicates"]
+    if skipped:
+        flash(f"Ohitettiin olemassa olevat avaimet: {', '.join(skipped)}", "warning")
+    if report["unknown_types"]:
+        types = sorted({item["entry_type"] for item in report["unknown_types"]})
+        flash(
+            f"Ohitettiin {len(report['unknown_types'])} viitettä tuntemattomista "
+            f"tyypeistä: {', '.join(types)}",
+            "warning",
+        )
+    if report["unknown_fields"]:
+        flash(
+            f"Tuntemattomat kentät jätettiin pois: "
+            f"{', '.join(report['unknown_fields'])}",
+            "warning",
+        )
+    for error in report["errors"]:
+        flash(f"Rivi {error['line']}: {error['message']}", "error")
+    return redirect(url_for("user_page"))
+
+
+def _doi_error(message: str, as_json: bool, status: int = 400):
+    """Answer a failed DOI request as JSON or on the front page."""
+    if as_json:
+        return jsonify({"success": False, "error": message}), status
+    flash(message, "error")
+    return render_template("index.html")
+
+
 @app.route("/get-doi", methods=["POST"])
 @login_required
 def get_doi_data():
     """
     Haetaan doi:n tiedot api-rajapinnan kautta.
+
+    The lookup runs as a background job, so the request returns at once:
+    forms are redirected to the job page, which reloads until the result
+    is there; a JSON body {"doi": ...} gets 202 with the job id and the
+    URL to poll.
+    """
+    as_json = request.is_json
+    if as_json:
+        payload = request.get_json(silent=True)
+        if not isinstance(payload, dict):
+            return _doi_error("Expected a JSON object", as_json)
+        doi = str(payload.get("doi") or "").strip()
+    else:
+        doi = (request.form.get("doi-value") or "").strip()
+
+    if not doi:
+        return _doi_error("DOI value is required.", as_json)
+    if not re.match(r"^10\.\d{4,}/\S+$", doi):
+        return _doi_error("Invalid DOI format.", as_json)
+
+    try:
+        job_id = submit_doi_job(session["user_id"], doi)
+    except DatabaseError as e:
+        return _doi_error(f"An unexpected error occurred: {str(e)}", as_json, 500)
+
+    if as_json:
+        return (
+            jsonify(
+                {
+                    "success": True,
+                    "job_id": job_id,
+                    "status_url": url_for("get_doi_job_status", job_id=job_id),
+                }
+            ),
+            202,
+        )
+    return redirect(url_for("get_doi_job_page", job_id=job_id))
+
+
+@app.route("/get-doi/jobs/<int:job_id>/status")
+@login_required
+def get_doi_job_status(job_id):
+    """Return the state of a DOI lookup job as JSON.
+
+    status is "queued", "running", "done" or "failed"; result holds the
+    parsed DOI data once done.
     """
     try:
-        doi = request.form.get("doi-value")
-        if not doi:
-            flash("DOI value is required.", "error")
-            return render_template("index.html")
-        if not re.match(r"^10\.\d{4,}/\S+$", doi):
-            flash("Invalid DOI format.", "error")
-            return render_template("index.html")
+        job = get_doi_job(job_id, session["user_id"])
+    except DatabaseError as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+    if job is None:
+        return jsonify({"success": False, "error": "DOI lookup not found"}), 404
+    return jsonify({"success": True, **job})
+
+
+@app.route("/get-doi/jobs/<int:job_id>")
+@login_required
+def get_doi_job_page(job_id):
+    """Show the prefilled reference form once the DOI lookup has finished."""
+    try:
+        job = get_doi_job(job_id, session["user_id"])
+    except DatabaseError as e:
+        flash(f"An unexpected error occurred: {str(e)}", "error")
+        return redirect("/")
+    if job is None:
+        flash("DOI lookup not found.", "error")
+        return redirect("/")
+    if job["status"] == "failed":
+        flash(job["error"], "error")
+        return render_template("index.html")
+    if job["status"] != "done":
+        return render_template("doi_job.html", job=job)
+    if job["kind"] == "batch":
+        return _doi_batch_result_page(job)
 
-        parsed_doi = get_doi_data_from_api(doi)
+    parsed_doi = job["result"]
+    try:
         # Hae valitun tyypin kentät form-fields.json:sta
         fields = get_fields_for_type(parsed_doi["type"])
     except FormFieldsError as e:
         flash(f"Error loading form fields: {str(e)}", "error")
-        fields = []
-        return render_template("index.html")
-    except UtilError as e:
-        flash(f"Error fetching DOI data: {str(e)}", "error")
         return render_template("index.html")
     except KeyError as e:
         flash(f"Missing expected data: {str(e)}", "error")
         return render_template("index.html")
-    except Exception as e:
-        flash(f"An unexpected error occurred: {str(e)}", "error")
-        return render_template("index.html")
     flash("DOI data fetched successfully.", "success")
     return render_template(
         "/add_reference.html",
@@ -648,6 +946,76 @@ def get_doi_data():
     )
 
 
+def _doi_batch_result_page(job):
+    """Show the outcome of a finished batch job.
+
+    Only the counts are flashed, since flashes are kept in the session
+    cookie; failed DOIs are listed on the page itself.
+    """
+    results = job["result"]
+    failed = [result for result in results if result["error"]]
+    added = [result for result in results if result.get("bib_key")]
+    flash(f"Lisättiin {len(added)} viitettä", "success")
+    if not failed:
+        return redirect(url_for("user_page"))
+    flash(f"{len(failed)} DOI:ta epäonnistui", "error")
+    return render_template("doi_job.html", job=job, failed=failed)
+
+
+@app.route("/get-doi/batch", methods=["POST"])
+@login_required
+def get_doi_batch():
+    """Resolve many DOIs at once in a background job.
+
+    A JSON body {"dois": [...], "add": bool, "is_public": bool} gets 202
+    with the job id and the URL to poll; the finished job holds the result
+    of every DOI, and with "add" the resolved DOIs are also added as
+    references of the current user. The form on the front page always adds
+    them and is redirected to the job page.
+    """
+    as_json = request.is_json
+    if as_json:
+        payload = request.get_json(silent=True)
+        if not isinstance(payload, dict):
+            return _doi_error("Expected a JSON object", as_json)
+        dois = payload.get("dois") or []
+        if isinstance(dois, str):
+            dois = split_dois(dois)
+        if not isinstance(dois, list) or not all(isinstance(d, str) for d in dois):
+            return _doi_error("dois must be a list of strings", as_json)
+        add = bool(payload.get("add"))
+        is_public = payload.get("is_public", True) is not False
+    else:
+        dois = split_dois(request.form.get("dois", ""))
+        add = True
+        is_public = not request.form.get("private")
+
+    try:
+        dois = normalize_dois(dois)
+    except ValueError as e:
+        return _doi_error(str(e), as_json)
+    if not dois:
+        return _doi_error("DOI value is required.", as_json)
+
+    try:
+        job_id = submit_doi_batch_job(session["user_id"], dois, add, is_public)
+    except DatabaseError as e:
+        return _doi_error(f"An unexpected error occurred: {str(e)}", as_json, 500)
+
+    if as_json:
+        return (
+            jsonify(
+                {
+                    "success": True,
+                    "job_id": job_id,
+                    "status_url": url_for("get_doi_job_status", job_id=job_id),
+                }
+            ),
+            202,
+        )
+    return redirect(url_for("get_doi_job_page", job_id=job_id))
+
+
 @app.route("/add-group/<bib_key>", methods=["POST"])
 def add_group(bib_key):
     """Add a reference to a group."""
@@ -695,30 +1063,46 @@ def search():
 
     if request.method == "GET":
         return render_template(
-            "search.html", tags=tags, reference_types=reference_types
+            "search.html",
+            tags=tags,
+            reference_types=reference_types,
+            page_size=DEFAULT_PAGE_SIZE,
+            page_size_options=PAGE_SIZE_OPTIONS,
+            threshold=DEFAULT_FUZZY_THRESHOLD,
         )
 
     query = request.form.get("search-query", "").strip()
     filter_type = request.form.get("filter-type", "").strip()
     tag_filter = request.form.get("tag-filter", "").strip()
-    sort_by = request.form.get("sort-by", "newest")
+    sort_by = request.form.get("sort-by", "relevance")
+    page_size = parse_page_size(request.form.get("page-size"))
+    cursor = request.form.get("cursor") or None
+    fuzzy = request.form.get("fuzzy") == "on"
+    threshold = parse_threshold(request.form.get("similarity-threshold"))
+
+    # Osuvuusjärjestys on mahdollinen vain hakusanan kanssa
+    if sort_by not in KEYSET_SORTS or (sort_by == "relevance" and not query):
+        sort_by = "newest"
 
     try:
-        if query:
-            results = search_reference_by_query(query, user_id=None)
-            results = filter_and_sort_search_results(
-                results,
-                ref_type_filter=filter_type,
-                tag_filter=tag_filter,
-                sort_by=sort_by,
-            )
-        else:
-            results = get_references_filtered_sorted(
-                ref_type_filter=filter_type,
-                tag_filter=tag_filter,
-                sort_by=sort_by,
-                user_id=None,
-            )
+        # Haku, suodattimet, järjestys, sivutus ja fasetit yhdellä SQL-kyselyllä
+        search_result = find_references_with_facets(
+            query=query,
+            ref_type_filter=filter_type,
+            tag_filter=tag_filter,
+            sort_by=sort_by,
+            limit=page_size + 1,
+            cursor=cursor,
+            fuzzy=fuzzy,
+            threshold=threshold,
+        )
+        page = make_page(search_result["references"], page_size, sort_by)
+        results, next_cursor = page["references"], page["next_cursor"]
+        facets = search_result["facets"]
+        facet_counts = {
+            name: {item["value"]: item["count"] for item in items}
+            for name, items in facets.items()
+        }
 
         return render_template(
             "search.html",
@@ -729,6 +1113,14 @@ def search():
             sort_by=sort_by,
             tags=tags,
             reference_types=reference_types,
+            cursor=cursor,
+            next_cursor=next_cursor,
+            page_size=page_size,
+            page_size_options=PAGE_SIZE_OPTIONS,
+            fuzzy=fuzzy,
+            threshold=threshold,
+            facets=facets,
+            facet_counts=facet_counts,
         )
     except DatabaseError as e:
         flash(f"Virhe haettaessa viitteitä: {e}", "error")
@@ -775,11 +1167,7 @@ def remove_group(bib_key):
 def view_group():
     """View references in the group."""
     try:
-        data = []
-        for bib_key in session["group"]["references"]:
-            ref = get_reference_by_bib_key(bib_key, user_id=None)
-            if ref:
-                data.append(ref)
+        data = get_references_by_bib_keys(session["group"]["references"], user_id=None)
     except DatabaseError as e:
         flash(f"Database error: {str(e)}", "error")
         data = []
@@ -796,14 +1184,30 @@ def user_page():
         flash("Kirjaudu sisään", "error")
         return redirect("/login")
 
+    page_size = parse_page_size(request.args.get("page_size"))
+    cursor = request.args.get("cursor") or None
+
     try:
         user = get_user_by_id(user_id)
 
-        # Hae kaikki käyttäjän viitteet (julkiset + yksityiset)
-        references = get_all_added_references(user_id=user_id)
+        # Hae sivullinen käyttäjän viitteitä (julkiset + yksityiset)
+        page = get_added_references_page(
+            user_id=user_id, page_size=page_size, cursor=cursor
+        )
+        total = count_user_references(user_id)
 
-        return render_template("user.html", user=user, references=references)
-    except DatabaseError as e:
+        return render_template(
+            "user.html",
+            user=user,
+            tags=get_tags(),
+            references=page["references"],
+            total=total,
+            cursor=cursor,
+            next_cursor=page["next_cursor"],
+            page_size=page_size,
+            page_size_options=PAGE_SIZE_OPTIONS,
+        )
+    except (DatabaseError, TagError) as e:
         flash(f"Virhe haettaessa tietoja: {str(e)}", "error")
         return redirect("/")
 
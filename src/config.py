@@ -1,4 +1,5 @@
 """Flask application configuration and database setup."""
+
 from os import getenv
 from pathlib import Path
 
@@ -1,15 +1,212 @@
 """Database helper functions for managing schema and data."""
 
 import os
+import re
+import sys
 
 from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
 
 from src.config import app, db
+from src.utils.changes import backfill_change_columns
+from src.utils.metadata import clear_registry
+from src.utils.references import (
+    refresh_missing_documents,
+    refresh_stale_bibtex,
+    trigram_search_available,
+)
+from src.utils.tags import clear_tag_cache
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(__file__), "migrations")
+
+# Migraatiotiedoston ensimmäinen rivi, jos sitä ei voi ajaa transaktiossa
+# (esim. CREATE INDEX CONCURRENTLY)
+NO_TRANSACTION_MARKER = "-- migrate: no-transaction"
+
+# Lauseen edellä oleva rivi, jos lauseen epäonnistuminen ei keskeytä migraatiota
+# (esim. laajennus, jota palvelimelle ei ole asennettu)
+OPTIONAL_MARKER = "-- migrate: optional"
+
+_CONCURRENT_INDEX = re.compile(
+    r"CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+IF\s+NOT\s+EXISTS\s+(\w+)",
+    re.IGNORECASE,
+)
+
+# pg_advisory_lock-avain, joka estää kahta prosessia ajamasta migraatioita yhtä aikaa
+MIGRATION_LOCK_ID = 7_420_001
+
+
+def migration_files() -> list:
+    """Return the migration files in version order.
+
+    Migrations live in src/migrations and are named "<version>_<name>.sql",
+    e.g. "000_search_vector.sql".
+
+    Returns:
+        list: (version, name, path) tuples sorted by version.
+    """
+    migrations = []
+    for filename in os.listdir(MIGRATIONS_DIR):
+        if not filename.endswith(".sql"):
+            continue
+        version, _, name = filename[: -len(".sql")].partition("_")
+        migrations.append((int(version), name, os.path.join(MIGRATIONS_DIR, filename)))
+    return sorted(migrations)
+
+
+def _parse_statements(sql: str) -> list:
+    """Split a no-transaction migration into (statement, optional) pairs.
+
+    Such migrations may only contain plain statements separated by
+    semicolons (no function bodies), and full-line "--" comments. A
+    statement preceded by an OPTIONAL_MARKER line is optional.
+    """
+    statements = []
+    for chunk in sql.split(";"):
+        lines = chunk.splitlines()
+        statement = "\n".join(
+            line for line in lines if not line.strip().startswith("--")
+        ).strip()
+        if statement:
+            optional = any(line.strip() == OPTIONAL_MARKER for line in lines)
+            statements.append((statement, optional))
+    return statements
+
+
+def _split_statements(sql: str) -> list:
+    """Split a no-transaction migration into statements."""
+    return [statement for statement, _ in _parse_statements(sql)]
+
+
+def _drop_invalid_index(conn, statement: str) -> None:
+    """Drop the leftover of a failed CREATE INDEX CONCURRENTLY.
+
+    A failed concurrent build leaves an INVALID index behind, which
+    IF NOT EXISTS would then skip, so it is dropped before the retry.
+    """
+    match = _CONCURRENT_INDEX.search(statement)
+    if not match:
+        return
+    invalid = conn.execute(
+        text(
+            """
+            SELECT c.relname
+            FROM pg_index i
+            JOIN pg_class c ON c.oid = i.indexrelid
+            WHERE c.relname = :name
+              AND c.relnamespace = current_schema()::regnamespace
+              AND NOT i.indisvalid
+            """
+        ),
+        {"name": match.group(1)},
+    ).scalar()
+    if invalid:
+        print(f"Dropping invalid index {invalid}")
+        conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {invalid}"))
+
+
+def _run_statement(conn, statement: str, optional: bool) -> None:
+    """Run one statement of a no-transaction migration in autocommit mode."""
+    _drop_invalid_index(conn, statement)
+    try:
+        conn.execute(text(statement))
+    except DBAPIError as e:
+        if not optional:
+            raise
+        conn.rollback()
+        print(f"Skipped optional statement: {e.orig}".strip())
+
+
+def run_migrations(engine) -> list:
+    """Apply pending migrations from src/migrations to a live database.
+
+    Applied versions are recorded in the schema_migrations table, so each
+    migration runs once. A migration normally runs in one transaction
+    together with its version row. Migrations starting with
+    NO_TRANSACTION_MARKER are run statement by statement in autocommit
+    mode, which CREATE INDEX CONCURRENTLY requires. Such a migration is
+    recorded only after all of its statements succeeded, so a failed run
+    is retried from the start: write its statements with IF NOT EXISTS.
+    An INVALID index left by a failed concurrent build is dropped before
+    the index is created again. Statements marked with OPTIONAL_MARKER
+    may fail without stopping the migration.
+
+    Args:
+        engine: SQLAlchemy engine of the target database.
+
+    Returns:
+        list: Versions applied by this call.
+    """
+    applied_now = []
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as lock:
+        lock.execute(text("SELECT pg_advisory_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+        try:
+            lock.execute(
+                text(
+                    """
+                    CREATE TABLE IF NOT EXISTS schema_migrations (
+                        version INT PRIMARY KEY,
+                        name TEXT NOT NULL,
+                        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                    """
+                )
+            )
+            applied = {
+                row[0]
+                for row in lock.execute(text("SELECT version FROM schema_migrations"))
+            }
+
+            record = text(
+                "INSERT INTO schema_migrations (version, name) VALUES (:version, :name)"
+            )
+            for version, name, path in migration_files():
+                if version in applied:
+                    continue
+                print(f"Applying migration {version:03d}_{name}")
+                with open(path, "r", encoding="utf-8") as f:
+                    sql = f.read().strip()
+
+                if sql.startswith(NO_TRANSACTION_MARKER):
+                    for statement, optional in _parse_statements(sql):
+                        _run_statement(lock, statement, optional)
+                    lock.execute(record, {"version": version, "name": name})
+                else:
+                    with engine.begin() as conn:
+                        conn.execute(text(sql))
+                        conn.execute(record, {"version": version, "name": name})
+                applied_now.append(version)
+        finally:
+            lock.execute(
+                text("SELECT pg_advisory_unlock(:id)"), {"id": MIGRATION_LOCK_ID}
+            )
+    return applied_now
+
+
+def migrate():
+    """Apply pending migrations to the application database.
+
+    References stored before their search, document and change feed columns
+    existed are filled in afterwards, and stored BibTeX entries made with an
+    older format version are formatted again.
+    """
+    db.session.commit()
+    applied = run_migrations(db.engine)
+    # Migraatio voi asentaa pg_trgm:n; tarkistetaan se uudelleen
+    trigram_search_available.cache_clear()
+    refresh_missing_documents()
+    backfill_change_columns()
+    refresh_stale_bibtex()
+    return applied
 
 
 def reset_db():
     """Drop all tables created by the schema to fully reset the database."""
     tables_to_drop = [
+        "tag_version",
+        "doi_jobs",
+        "doi_cache",
+        "deleted_references",
         "user_ref",
         "reference_tags",
         "reference_values",
@@ -19,6 +216,7 @@ def reset_db():
         "tags",
         "users",
         "reference_types",
+        "schema_migrations",
     ]
 
     for table in tables_to_drop:
@@ -26,6 +224,8 @@ def reset_db():
         sql = text(f"DROP TABLE IF EXISTS {table} CASCADE")
         db.session.execute(sql)
         db.session.commit()
+    clear_registry()
+    clear_tag_cache()
 
 
 def tables():
@@ -42,9 +242,10 @@ def tables():
 
 
 def setup_db():
-    """Create the database schema.
+    """Create the database schema and apply all migrations.
 
     If database tables already exist, those are dropped before the creation.
+    Use migrate() to update an existing database without losing data.
     """
     tables_in_db = tables()
     if len(tables_in_db) > 0:
@@ -64,8 +265,16 @@ def setup_db():
     sql = text(schema_sql)
     db.session.execute(sql)
     db.session.commit()
+    clear_registry()
+    clear_tag_cache()
+
+    migrate()
 
 
 if __name__ == "__main__":
     with app.app_context():
-        setup_db()
+        # "python -m src.db_helper migrate" päivittää olemassa olevan kannan
+        if sys.argv[1:] == ["migrate"]:
+            migrate()
+        else:
+            setup_db()
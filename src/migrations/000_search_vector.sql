@@ -0,0 +1,10 @@
+-- migrate: no-transaction
+-- Viitteiden tekstihakuindeksi. Baseline-skeemasta se puuttuu, joten
+-- olemassa oleva kanta saa sen tästä. Olemassa olevien viitteiden arvot
+-- täyttää db_helper.migrate() (ks. refresh_missing_documents).
+
+-- Hakuindeksi: bib_key, kaikki kenttäarvot ja tagi (ks. refresh_reference_documents)
+ALTER TABLE single_reference ADD COLUMN IF NOT EXISTS search_vector TSVECTOR;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_single_reference_search
+    ON single_reference USING GIN (search_vector);
@@ -0,0 +1,15 @@
+-- migrate: no-transaction
+-- Sumean haun tekstisarake. Olemassa olevien viitteiden arvot täyttää
+-- db_helper.migrate() (ks. refresh_missing_documents).
+
+-- Sama teksti kuin search_vectorissa trigrammihakua varten
+ALTER TABLE single_reference ADD COLUMN IF NOT EXISTS search_text TEXT;
+
+-- Sumea haku (pg_trgm). Jos laajennusta ei voi asentaa, molemmat lauseet
+-- ohitetaan ja haku toimii ILIKE:llä.
+-- migrate: optional
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- migrate: optional
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_single_reference_search_text_trgm
+    ON single_reference USING GIN (search_text gin_trgm_ops);
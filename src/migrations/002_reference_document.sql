@@ -0,0 +1,3 @@
+-- Kenttäarvot ja tagi yhtenä dokumenttina lukemista varten. Olemassa olevien
+-- viitteiden dokumentit rakentaa db_helper.migrate() (ks. refresh_missing_documents).
+ALTER TABLE single_reference ADD COLUMN IF NOT EXISTS document JSONB;
@@ -0,0 +1,10 @@
+-- migrate: no-transaction
+-- Normalisoidut järjestysavaimet (ks. normalize_sort_key). Olemassa olevien
+-- viitteiden avaimet laskee db_helper.migrate() (ks. refresh_missing_documents).
+ALTER TABLE single_reference ADD COLUMN IF NOT EXISTS title_sort TEXT;
+ALTER TABLE single_reference ADD COLUMN IF NOT EXISTS author_sort TEXT;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_single_reference_title_sort
+    ON single_reference (title_sort, id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_single_reference_author_sort
+    ON single_reference (author_sort, id);
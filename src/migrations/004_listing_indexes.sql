@@ -0,0 +1,19 @@
+-- migrate: no-transaction
+-- Listaus- ja liitoskyselyjen indeksit. CONCURRENTLY ei lukitse tauluja
+-- kirjoituksilta, joten migraation voi ajaa käynnissä olevaan kantaan.
+
+-- Viitteen kenttäarvot (haku, dokumentin päivitys, muokkaus)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_reference_values_reference_field
+    ON reference_values (reference_id, field_id);
+
+-- Viitteen omistajat (user_ref:n pääavain alkaa user_id:llä)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_user_ref_reference
+    ON user_ref (reference_id);
+
+-- Avainsanan viitteet (reference_tags:n pääavain alkaa reference_id:llä)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_reference_tags_tag
+    ON reference_tags (tag_id);
+
+-- Julkiset viitteet uusin/vanhin ensin, id keyset-sivutuksen tasapelejä varten
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_single_reference_public_created
+    ON single_reference (is_public, created_at, id);
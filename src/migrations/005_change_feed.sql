@@ -0,0 +1,26 @@
+-- Muutossyöte: viitteen muutosaika ja -transaktio sekä poistettujen viitteiden
+-- hautakivet. change_xid järjestää muutokset commit-turvallisesti, ks.
+-- src/utils/changes.py.
+
+-- Sarakkeet lisätään ilman oletusarvoa, jolloin taulua ei kirjoiteta uudelleen.
+-- Oletus koskee vain uusia rivejä; vanhat täytetään erissä
+-- (backfill_change_columns()) ja indeksi rakennetaan migraatiossa 010.
+ALTER TABLE single_reference ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP;
+ALTER TABLE single_reference
+    ALTER COLUMN updated_at SET DEFAULT CURRENT_TIMESTAMP;
+
+ALTER TABLE single_reference ADD COLUMN IF NOT EXISTS change_xid XID8;
+ALTER TABLE single_reference
+    ALTER COLUMN change_xid SET DEFAULT pg_current_xact_id();
+
+-- Yksi rivi jokaiselle omistajalle, jonka listalta viite poistui
+CREATE TABLE IF NOT EXISTS deleted_references (
+    id BIGSERIAL PRIMARY KEY,
+    bib_key VARCHAR(100) NOT NULL,
+    user_id INT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    deleted_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    change_xid XID8 NOT NULL DEFAULT pg_current_xact_id()
+);
+
+CREATE INDEX IF NOT EXISTS idx_deleted_references_user_change
+    ON deleted_references (user_id, change_xid, id);
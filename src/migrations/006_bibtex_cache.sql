@@ -0,0 +1,6 @@
+-- Valmiiksi muotoiltu BibTeX-merkintä vientejä varten. bibtex_version kertoo,
+-- millä src.util.BIBTEX_FORMAT_VERSION-versiolla merkintä on muotoiltu;
+-- db_helper.migrate() muotoilee vanhentuneet merkinnät uudelleen.
+
+ALTER TABLE single_reference ADD COLUMN IF NOT EXISTS bibtex TEXT;
+ALTER TABLE single_reference ADD COLUMN IF NOT EXISTS bibtex_version INT;
@@ -0,0 +1,11 @@
+-- DOI-palvelun vastausten välimuisti, ks. src/utils/doi_cache.py. Avaimena
+-- normalisoitu DOI. status 200 tarkoittaa tallennettua metadataa, muut
+-- tilakoodit (404, 400, 410) lyhytikäisiä negatiivisia merkintöjä.
+
+CREATE TABLE IF NOT EXISTS doi_cache (
+    doi TEXT PRIMARY KEY,
+    status SMALLINT NOT NULL,
+    metadata JSONB,
+    fetched_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    expires_at TIMESTAMP NOT NULL
+);
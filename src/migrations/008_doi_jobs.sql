@@ -0,0 +1,17 @@
+-- Taustalla ajettavat DOI-haut, ks. src/utils/doi_jobs.py. Pyyntö lisää
+-- rivin ja palaa heti; säiepoolin työ kirjoittaa tuloksen (parse_doi()) tai
+-- virheen riville, jota selain kyselee.
+
+CREATE TABLE IF NOT EXISTS doi_jobs (
+    id BIGSERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    doi TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued'
+        CHECK (status IN ('queued', 'running', 'done', 'failed')),
+    result JSONB,
+    error TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_doi_jobs_created_at ON doi_jobs (created_at);
@@ -0,0 +1,10 @@
+-- Tagilistan versio kaikille sovellusprosesseille, ks. src/utils/tags.py.
+-- Tagien kirjoitukset kasvattavat sitä samassa transaktiossa; prosessi lataa
+-- välimuistissa olevan tagilistan uudelleen, kun versio on muuttunut.
+
+CREATE TABLE IF NOT EXISTS tag_version (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    version BIGINT NOT NULL DEFAULT 0
+);
+
+INSERT INTO tag_version (id) VALUES (TRUE) ON CONFLICT (id) DO NOTHING;
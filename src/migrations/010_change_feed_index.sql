@@ -0,0 +1,5 @@
+-- migrate: no-transaction
+-- Muutossyötteen indeksi viitteille (ks. 005_change_feed.sql). CONCURRENTLY ei
+-- lukitse single_referenceä kirjoituksilta.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_single_reference_change
+    ON single_reference (change_xid, id);
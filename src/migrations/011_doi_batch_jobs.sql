@@ -0,0 +1,10 @@
+-- Monen DOI:n haut ajetaan taustatöinä samassa taulussa kuin yksittäiset, ks.
+-- src/utils/doi_jobs.py. Erätyön DOI:t ja asetukset ovat params-sarakkeessa,
+-- ja result on lista DOI-kohtaisia tuloksia. progress kertoo haettujen määrän.
+
+ALTER TABLE doi_jobs
+    ADD COLUMN IF NOT EXISTS kind TEXT NOT NULL DEFAULT 'doi'
+        CHECK (kind IN ('doi', 'batch'));
+ALTER TABLE doi_jobs ADD COLUMN IF NOT EXISTS params JSONB;
+ALTER TABLE doi_jobs ADD COLUMN IF NOT EXISTS progress INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE doi_jobs ALTER COLUMN doi DROP NOT NULL;
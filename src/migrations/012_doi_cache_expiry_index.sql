@@ -0,0 +1,5 @@
+-- migrate: no-transaction
+-- Vanhentuneiden DOI-välimuistirivien poisto (ks. src/utils/doi_cache.py)
+-- hakee rivit expires_at-järjestyksessä. CONCURRENTLY ei lukitse taulua.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_doi_cache_expires_at
+    ON doi_cache (expires_at);
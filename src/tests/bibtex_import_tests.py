@@ -0,0 +1,237 @@
+"""Tests for src/utils/bibtex_import.py module."""
+
+import io
+
+import pytest
+from sqlalchemy import text
+
+from src.utils.bibtex_import import BibtexImportError, import_bibtex, parse_bibtex
+from src.utils.references import (
+    add_reference,
+    count_user_references,
+    get_reference_by_bib_key,
+    get_reference_visibility,
+)
+from src.utils.tags import get_tag_by_reference, get_tags
+from src.utils.users import create_user, link_reference_to_user
+
+BIB = r"""
+% Kommentit ja muu teksti ohitetaan
+@string{jv = "Journal of Values"}
+
+@Article{First2024,
+  author = {Meikäläinen, Matti and Virtanen, Ville},
+  title  = {The {BibTeX} Import \{escaped\}},
+  journal = jv # " Letters",
+  year = 2024,
+  month = jan,
+  pages = "1--10",
+}
+
+@article{Second2024, title={Second}, author={B}, journal={J}, year={2023}}
+
+@book{Book2024,
+  title = {A Book},
+  author = {Kirjailija},
+  year = {2020},
+  publisher = {Otava}
+}
+"""
+
+
+def _lines(text):
+    return io.StringIO(text)
+
+
+class TestParseBibtex:
+    """Tests for the streaming BibTeX parser."""
+
+    def test_parses_entries_macros_and_values(self):
+        """Test braces, quotes, numbers, macros and concatenation."""
+        entries = list(parse_bibtex(_lines(BIB)))
+
+        assert [e["bib_key"] for e in entries] == [
+            "First2024",
+            "Second2024",
+            "Book2024",
+        ]
+        first = entries[0]
+        assert first["entry_type"] == "article"
+        assert first["line"] == 5
+        assert first["fields"] == {
+            "author": "Meikäläinen, Matti and Virtanen, Ville",
+            "title": "The {BibTeX} Import {escaped}",
+            "journal": "Journal of Values Letters",
+            "year": "2024",
+            "month": "January",
+            "pages": "1--10",
+        }
+
+    def test_malformed_entries_are_reported_and_skipped(self):
+        """Test that a broken entry does not stop the rest of the file."""
+        errors = []
+        text = "@article{Bad, title = }\n@article{Good, title = {Ok}}\n@book{Open,\n"
+        entries = list(parse_bibtex(_lines(text), errors))
+
+        assert [e["bib_key"] for e in entries] == ["Good"]
+        assert [error["line"] for error in errors] == [1, 3]
+
+    def test_braces_in_quoted_values_do_not_end_entries(self):
+        """Test that an unbalanced brace in a quoted value only fails its entry."""
+        errors = []
+        text = (
+            '@article{Open, title = "An { unbalanced title"}\n'
+            '@article{Close, title = "A } stray brace", year = 2020}\n'
+            '@article{Next, title = "Still {parsed}"}\n'
+        )
+        entries = list(parse_bibtex(_lines(text), errors))
+
+        assert [e["bib_key"] for e in entries] == ["Next"]
+        assert entries[0]["fields"] == {"title": "Still {parsed}"}
+        assert [error["line"] for error in errors] == [1, 2]
+
+    def test_first_duplicate_field_wins_and_comments_are_skipped(self):
+        """Test duplicate fields and @comment/@preamble entries."""
+        text = (
+            "@comment{ignored, title = {x}}\n"
+            '@preamble{"\\newcommand"}\n'
+            "@ARTICLE{Dup, TITLE = {One}, title = {Two}}\n"
+        )
+        entries = list(parse_bibtex(_lines(text)))
+
+        assert entries == [
+            {
+                "line": 3,
+                "entry_type": "article",
+                "bib_key": "Dup",
+                "fields": {"title": "One"},
+            }
+        ]
+
+
+class TestImportBibtex:
+    """Integration tests for import_bibtex()."""
+
+    def test_imports_values_owner_and_sort_keys(self, app, db_session):
+        """Test that imported references match references added by hand."""
+        with app.app_context():
+            user = create_user("importer", "testpass123")
+            report = import_bibtex(_lines(BIB), user["id"])
+
+            assert report["imported"] == 3
+            # Testikannan kirjatyypillä ei ole publisher-kenttää
+            assert report["unknown_fields"] == {"month": 1, "publisher": 1}
+
+            first = get_reference_by_bib_key("First2024")
+            assert first["reference_type"] == "article"
+            assert first["fields"]["title"] == "The {BibTeX} Import {escaped}"
+            assert first["fields"]["journal"] == "Journal of Values Letters"
+            assert "month" not in first["fields"]
+            assert get_reference_by_bib_key("Book2024")["fields"] == {
+                "title": "A Book",
+                "author": "Kirjailija",
+                "year": "2020",
+            }
+
+            assert count_user_references(user["id"]) == 3
+
+            sort_key = db_session.session.execute(
+                text(
+                    "SELECT title_sort FROM single_reference WHERE bib_key = 'Book2024'"
+                )
+            ).scalar()
+            assert sort_key == "book"
+
+    def test_existing_duplicate_and_unknown_types_are_reported(self, app, db_session):
+        """Test that nothing existing is overwritten."""
+        with app.app_context():
+            user = create_user("importer", "testpass123")
+            ref_id = add_reference(
+                "article", {"bib_key": "Second2024", "title": "Kept"}
+            )
+            link_reference_to_user(user["id"], ref_id)
+            bib = BIB + "@article{First2024, title={Again}}\n@misc{Misc1, title={M}}\n"
+
+            report = import_bibtex(_lines(bib), user["id"])
+
+            assert report["imported"] == 2
+            assert report["existing"] == ["Second2024"]
+            assert report["duplicates"] == ["First2024"]
+            assert report["unknown_types"] == [
+                {"bib_key": "Misc1", "entry_type": "misc"}
+            ]
+            assert get_reference_by_bib_key("Second2024")["fields"]["title"] == "Kept"
+            assert get_reference_by_bib_key("First2024")["fields"]["title"] != "Again"
+
+    def test_key_of_unknown_type_entry_stays_free(self, app, db_session):
+        """Test that a later valid entry is imported after a rejected one."""
+        with app.app_context():
+            user = create_user("importer", "testpass123")
+            bib = "@misc{Later, title={M}}\n@article{Later, title={Real}}\n"
+
+            report = import_bibtex(_lines(bib), user["id"])
+
+            assert report["imported"] == 1
+            assert report["duplicates"] == []
+            assert report["unknown_types"] == [
+                {"bib_key": "Later", "entry_type": "misc"}
+            ]
+            assert get_reference_by_bib_key("Later")["fields"]["title"] == "Real"
+
+    def test_tag_and_visibility_apply_to_every_reference(self, app, db_session):
+        """Test the optional tag (created on demand) and private import."""
+        with app.app_context():
+            user = create_user("importer", "testpass123")
+            get_tags()
+
+            import_bibtex(_lines(BIB), user["id"], tag_name="tuodut", is_public=False)
+
+            assert "tuodut" in [tag["name"] for tag in get_tags()]
+            for bib_key in ("First2024", "Second2024", "Book2024"):
+                ref_id = get_reference_by_bib_key(bib_key, user["id"])["id"]
+                assert get_tag_by_reference(ref_id)["name"] == "tuodut"
+                assert get_reference_visibility(bib_key) is False
+
+    def test_failure_imports_nothing(self, app, db_session):
+        """Test that an error rolls the whole import back."""
+        with app.app_context():
+            user = create_user("importer", "testpass123")
+            with pytest.raises(BibtexImportError):
+                import_bibtex(_lines(BIB), user["id"] + 1000)
+
+            assert get_reference_by_bib_key("First2024") is None
+
+
+class TestImportEndpoint:
+    """Tests for the /import/bibtex route."""
+
+    def test_upload_imports_for_current_user(self, app, client, db_session):
+        """Test that an uploaded file is imported and summarised."""
+        with app.app_context():
+            user = create_user("importer", "testpass123")
+
+        with client.session_transaction() as sess:
+            sess["user_id"] = user["id"]
+            sess["username"] = user["username"]
+
+        response = client.post(
+            "/import/bibtex",
+            data={"bib-file": (io.BytesIO(BIB.encode("utf-8")), "refs.bib")},
+            content_type="multipart/form-data",
+            follow_redirects=True,
+        )
+        assert response.status_code == 200
+        assert "Tuotiin 3 viitettä." in response.get_data(as_text=True)
+
+        with app.app_context():
+            assert count_user_references(user["id"]) == 3
+
+    def test_requires_login(self, client, db_session):
+        """Test that anonymous uploads are redirected to login."""
+        response = client.post(
+            "/import/bibtex",
+            data={"bib-file": (io.BytesIO(BIB.encode("utf-8")), "refs.bib")},
+            content_type="multipart/form-data",
+        )
+        assert response.status_code == 302
+        assert "/login" in response.headers["Location"]
@@ -0,0 +1,228 @@
+"""Integration tests for src/utils/changes.py module."""
+
+import pytest
+from sqlalchemy import text
+
+from src.config import db
+from src.utils.changes import backfill_change_columns, get_reference_changes
+from src.utils.references import (
+    DatabaseError,
+    add_reference,
+    delete_reference_by_bib_key,
+)
+from src.utils.tags import add_tag, add_tag_to_reference
+from src.utils.users import (
+    create_user,
+    link_reference_to_user,
+    unlink_reference_from_user,
+)
+
+
+def _actions(feed):
+    return [(change["action"], change["bib_key"]) for change in feed["changes"]]
+
+
+class TestReferenceChanges:
+    """Tests for the updated_at/tombstone change feed."""
+
+    def test_initial_sync_returns_current_references(
+        self, app, db_session, make_reference
+    ):
+        """Test that syncing without a cursor lists every own reference."""
+        with app.app_context():
+            user = create_user("syncuser", "testpass123")
+            other = create_user("otheruser", "testpass123")
+            make_reference("Mine1", owner=user["id"])
+            make_reference("Mine2", owner=user["id"])
+            make_reference("Theirs", owner=other["id"])
+
+            feed = get_reference_changes(user["id"])
+            assert _actions(feed) == [("upsert", "Mine1"), ("upsert", "Mine2")]
+            assert feed["changes"][0]["fields"]["title"] == "Title"
+            assert feed["has_more"] is False
+
+            again = get_reference_changes(user["id"], feed["next_cursor"])
+            assert again["changes"] == []
+            assert again["next_cursor"] == feed["next_cursor"]
+
+    def test_edits_and_tags_are_returned_after_cursor(
+        self, app, db_session, make_reference
+    ):
+        """Test that add_reference edits and tag changes update the reference."""
+        with app.app_context():
+            user = create_user("syncuser", "testpass123")
+            ref_id = make_reference("Edit1", owner=user["id"])
+            make_reference("Same1", owner=user["id"])
+            cursor = get_reference_changes(user["id"])["next_cursor"]
+
+            add_reference(
+                "article",
+                {"bib_key": "Edit1", "old_bib_key": "Edit1", "title": "New"},
+                editing=True,
+            )
+            feed = get_reference_changes(user["id"], cursor)
+            assert _actions(feed) == [("upsert", "Edit1")]
+            assert feed["changes"][0]["fields"]["title"] == "New"
+
+            add_tag_to_reference(add_tag("synced"), ref_id)
+            feed = get_reference_changes(user["id"], feed["next_cursor"])
+            assert _actions(feed) == [("upsert", "Edit1")]
+            assert feed["changes"][0]["tag"]["name"] == "synced"
+
+    def test_delete_and_rename_write_tombstones(self, app, db_session, make_reference):
+        """Test that deleted and renamed keys are reported as deletions."""
+        with app.app_context():
+            user = create_user("syncuser", "testpass123")
+            make_reference("Gone1", owner=user["id"])
+            make_reference("Old1", owner=user["id"])
+            cursor = get_reference_changes(user["id"])["next_cursor"]
+
+            delete_reference_by_bib_key("Gone1", user["id"])
+            add_reference(
+                "article",
+                {"bib_key": "New1", "old_bib_key": "Old1", "title": "Renamed"},
+                editing=True,
+            )
+
+            feed = get_reference_changes(user["id"], cursor)
+            assert _actions(feed) == [
+                ("delete", "Gone1"),
+                ("delete", "Old1"),
+                ("upsert", "New1"),
+            ]
+
+    def test_unlink_is_a_deletion_for_that_user_only(
+        self, app, db_session, make_reference
+    ):
+        """Test that unlinking removes the reference from one user's feed."""
+        with app.app_context():
+            user = create_user("syncuser", "testpass123")
+            other = create_user("otheruser", "testpass123")
+            ref_id = make_reference("Shared1", owner=user["id"])
+            link_reference_to_user(other["id"], ref_id)
+            user_cursor = get_reference_changes(user["id"])["next_cursor"]
+            other_cursor = get_reference_changes(other["id"])["next_cursor"]
+
+            unlink_reference_from_user(user["id"], ref_id)
+
+            user_feed = get_reference_changes(user["id"], user_cursor)
+            assert _actions(user_feed) == [("delete", "Shared1")]
+            assert get_reference_changes(other["id"], other_cursor)["changes"] == []
+
+    def test_limit_pages_through_every_change_once(
+        self, app, db_session, make_reference
+    ):
+        """Test that has_more/next_cursor return each change exactly once."""
+        with app.app_context():
+            user = create_user("syncuser", "testpass123")
+            for i in range(5):
+                make_reference(f"Page{i}", owner=user["id"])
+            delete_reference_by_bib_key("Page0", user["id"])
+
+            seen = []
+            cursor = None
+            while True:
+                feed = get_reference_changes(user["id"], cursor, limit=2)
+                seen.extend(_actions(feed))
+                cursor = feed["next_cursor"]
+                if not feed["has_more"]:
+                    break
+
+            assert seen == [("upsert", f"Page{i}") for i in range(1, 5)] + [
+                ("delete", "Page0")
+            ]
+
+    def test_malformed_cursor_raises(self, app, db_session):
+        """Test that a broken cursor is rejected."""
+        with app.app_context():
+            user = create_user("syncuser", "testpass123")
+            for cursor in (
+                "not-a-cursor",
+                "a_b",
+                "1_1",
+                "99999999999999999999_1_1",
+                "1_1_9223372036854775808",
+                "-1_1_1",
+                "1_2_1",
+            ):
+                with pytest.raises(ValueError, match="Invalid change cursor"):
+                    get_reference_changes(user["id"], cursor)
+
+    def test_database_error_rolls_back(self, app, db_session, monkeypatch):
+        """Test that the session is usable after a failed feed query."""
+        with app.app_context():
+            user = create_user("syncuser", "testpass123")
+            monkeypatch.setattr(
+                "src.utils.changes._after_id", lambda kind, position: "not-an-id"
+            )
+            with pytest.raises(DatabaseError):
+                get_reference_changes(user["id"])
+            monkeypatch.undo()
+
+            assert get_reference_changes(user["id"])["changes"] == []
+
+    def test_backfill_adds_old_references_to_feed(
+        self, app, db_session, make_reference
+    ):
+        """Test that references without change columns are filled in batches."""
+        with app.app_context():
+            user = create_user("syncuser", "testpass123")
+            for i in range(3):
+                make_reference(f"Old{i}", owner=user["id"])
+            # Migraatiota 005 edeltänyt rivi
+            db.session.execute(
+                text("UPDATE single_reference SET updated_at = NULL, change_xid = NULL")
+            )
+            db.session.commit()
+            assert get_reference_changes(user["id"])["changes"] == []
+
+            assert backfill_change_columns(batch_size=2) == 3
+
+            feed = get_reference_changes(user["id"])
+            assert _actions(feed) == [("upsert", f"Old{i}") for i in range(3)]
+            assert feed["changes"][0]["changed_at"] is not None
+            assert backfill_change_columns() == 0
+
+
+class TestChangesEndpoint:
+    """Tests for /export/user_bibtex/changes."""
+
+    def test_returns_bibtex_and_deletions(
+        self, app, client, db_session, make_reference
+    ):
+        """Test the JSON shape of the change feed endpoint."""
+        with app.app_context():
+            user = create_user("syncuser", "testpass123")
+            make_reference("Api1", owner=user["id"])
+            make_reference("Api2", owner=user["id"])
+            delete_reference_by_bib_key("Api2", user["id"])
+
+        with client.session_transaction() as sess:
+            sess["user_id"] = user["id"]
+            sess["username"] = user["username"]
+
+        data = client.get("/export/user_bibtex/changes").get_json()
+        assert data["success"] is True
+        assert [c["action"] for c in data["changes"]] == ["upsert", "delete"]
+        assert data["changes"][0]["bibtex"].startswith("@article{Api1,")
+        assert "bibtex" not in data["changes"][1]
+
+        later = client.get(
+            "/export/user_bibtex/changes", query_string={"cursor": data["next_cursor"]}
+        ).get_json()
+        assert later["changes"] == []
+
+    def test_bad_cursor_is_400(self, app, client, db_session):
+        """Test that a malformed cursor is a client error."""
+        with app.app_context():
+            user = create_user("syncuser", "testpass123")
+
+        with client.session_transaction() as sess:
+            sess["user_id"] = user["id"]
+            sess["username"] = user["username"]
+
+        for cursor in ("x_y", "99999999999999999999_1_1"):
+            response = client.get(
+                "/export/user_bibtex/changes", query_string={"cursor": cursor}
+            )
+            assert response.status_code == 400
@@ -142,6 +142,38 @@ def sample_reference_data():
     }
 
 
+@pytest.fixture
+def make_reference(db_session):
+    """Factory fixture that adds a reference and returns its id.
+
+    The returned function takes the bib_key and optionally the reference
+    type, field values (merged over a default title), owner user id,
+    visibility and a tag name, which is created if it does not exist.
+    """
+    from src.utils.references import add_reference
+    from src.utils.tags import add_tag_to_reference, get_or_create_tag
+    from src.utils.users import link_reference_to_user
+
+    def make(
+        bib_key,
+        reference_type="article",
+        fields=None,
+        owner=None,
+        is_public=True,
+        tag=None,
+    ):
+        data = {"bib_key": bib_key, "title": "Title", "is_public": is_public}
+        data.update(fields or {})
+        ref_id = add_reference(reference_type, data)
+        if owner is not None:
+            link_reference_to_user(owner, ref_id)
+        if tag is not None:
+            add_tag_to_reference(get_or_create_tag(tag)[0], ref_id)
+        return ref_id
+
+    return make
+
+
 def pytest_sessionfinish(session, exitstatus):
     """Run seed_database.py after all tests are completed."""
     # Change to project root directory
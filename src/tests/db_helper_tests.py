@@ -0,0 +1,245 @@
+"""Integration tests for the migration runner in src/db_helper.py."""
+
+import os
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+from src import db_helper
+from src.config import db
+from src.db_helper import (
+    _parse_statements,
+    _split_statements,
+    migrate,
+    migration_files,
+    run_migrations,
+)
+from src.utils.metadata import clear_registry
+from src.utils.references import (
+    get_added_references_page,
+    get_reference_by_bib_key,
+    trigram_search_available,
+)
+
+
+def _load_baseline_schema():
+    """Rebuild the database from schema.sql alone, holding one reference.
+
+    This is a database as deployed before any migration existed.
+    """
+    for table in db_helper.tables():
+        db.session.execute(text(f"DROP TABLE {table} CASCADE"))
+    schema_path = os.path.join(os.path.dirname(db_helper.__file__), "schema.sql")
+    with open(schema_path, "r", encoding="utf-8") as f:
+        db.session.execute(text(f.read()))
+    db.session.execute(
+        text(
+            """
+            INSERT INTO reference_types (name) VALUES ('article');
+            INSERT INTO fields (key_name, data_type, input_type)
+            VALUES ('title', 'str', 'text'), ('author', 'str', 'text');
+            INSERT INTO reference_type_fields (reference_type_id, field_id)
+            SELECT rt.id, f.id FROM reference_types rt CROSS JOIN fields f;
+            INSERT INTO single_reference (reference_type_id, bib_key)
+            SELECT id, 'Base2001' FROM reference_types;
+            INSERT INTO reference_values (reference_id, field_id, value)
+            SELECT sr.id, f.id,
+                   CASE f.key_name WHEN 'title' THEN 'An Old Paper' ELSE 'Ada' END
+            FROM single_reference sr CROSS JOIN fields f;
+            INSERT INTO users (username, password_hash) VALUES ('legacy', 'x');
+            INSERT INTO user_ref (user_id, reference_id)
+            SELECT u.id, sr.id FROM users u CROSS JOIN single_reference sr;
+            """
+        )
+    )
+    db.session.commit()
+    clear_registry()
+
+
+def _index_valid(name):
+    return db.session.execute(
+        text(
+            "SELECT i.indisvalid FROM pg_index i "
+            "JOIN pg_class c ON c.oid = i.indexrelid WHERE c.relname = :name"
+        ),
+        {"name": name},
+    ).scalar()
+
+
+class TestMigrations:
+    """Tests for versioned migrations."""
+
+    def test_migration_files_are_ordered_by_version(self):
+        """Test that migration files are listed in version order."""
+        versions = [version for version, _, _ in migration_files()]
+        assert versions == sorted(versions)
+        assert versions[0] == 0
+
+    def test_split_statements_skips_comments(self):
+        """Test that comment lines and empty statements are dropped."""
+        sql = "-- migrate: no-transaction\n-- comment\nSELECT 1;\n\nSELECT 2;\n"
+        assert _split_statements(sql) == ["SELECT 1", "SELECT 2"]
+
+    def test_optional_marker_applies_to_next_statement(self):
+        """Test that only the statement after the marker is optional."""
+        sql = "-- migrate: optional\nSELECT 1;\n-- note\nSELECT 2;\n"
+        assert _parse_statements(sql) == [("SELECT 1", True), ("SELECT 2", False)]
+
+    def test_optional_statement_failure_is_skipped(
+        self, app, db_session, tmp_path, monkeypatch
+    ):
+        """Test that a failing optional statement does not stop the migration."""
+        (tmp_path / "900_probe.sql").write_text(
+            "-- migrate: no-transaction\n"
+            "-- migrate: optional\n"
+            "CREATE EXTENSION IF NOT EXISTS no_such_extension;\n"
+            "CREATE TABLE IF NOT EXISTS migration_probe (x INT);\n"
+        )
+        monkeypatch.setattr(db_helper, "MIGRATIONS_DIR", str(tmp_path))
+        with app.app_context():
+            db.session.commit()
+            try:
+                assert run_migrations(db.engine) == [900]
+                assert "migration_probe" in db_helper.tables()
+            finally:
+                db.session.rollback()
+                db.session.execute(text("DROP TABLE IF EXISTS migration_probe"))
+                db.session.execute(
+                    text("DELETE FROM schema_migrations WHERE version = 900")
+                )
+                db.session.commit()
+
+    def test_failed_concurrent_index_is_rebuilt(
+        self, app, db_session, tmp_path, monkeypatch
+    ):
+        """Test that a retry replaces the INVALID index of a failed run."""
+        (tmp_path / "900_probe_index.sql").write_text(
+            "-- migrate: no-transaction\n"
+            "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS idx_migration_probe\n"
+            "    ON migration_probe (x);\n"
+        )
+        monkeypatch.setattr(db_helper, "MIGRATIONS_DIR", str(tmp_path))
+        with app.app_context():
+            db.session.execute(text("CREATE TABLE migration_probe (x INT)"))
+            db.session.execute(text("INSERT INTO migration_probe VALUES (1), (1)"))
+            db.session.commit()
+            try:
+                with pytest.raises(DBAPIError):
+                    run_migrations(db.engine)
+                assert _index_valid("idx_migration_probe") is False
+
+                db.session.execute(text("DELETE FROM migration_probe"))
+                db.session.commit()
+                assert run_migrations(db.engine) == [900]
+                assert _index_valid("idx_migration_probe") is True
+            finally:
+                db.session.rollback()
+                db.session.execute(text("DROP TABLE migration_probe"))
+                db.session.execute(
+                    text("DELETE FROM schema_migrations WHERE version = 900")
+                )
+                db.session.commit()
+
+    def test_setup_db_records_all_migrations(self, app, db_session):
+        """Test that setup_db applies and records every migration."""
+        with app.app_context():
+            recorded = db.session.execute(
+                text("SELECT version FROM schema_migrations ORDER BY version")
+            ).scalars()
+            assert list(recorded) == [v for v, _, _ in migration_files()]
+
+    def test_listing_indexes_exist(self, app, db_session):
+        """Test that the concurrently built indexes of migrations 004 and 010 exist."""
+        with app.app_context():
+            indexes = set(
+                db.session.execute(
+                    text("SELECT indexname FROM pg_indexes WHERE schemaname = 'public'")
+                ).scalars()
+            )
+            assert {
+                "idx_reference_values_reference_field",
+                "idx_user_ref_reference",
+                "idx_reference_tags_tag",
+                "idx_single_reference_public_created",
+                "idx_single_reference_change",
+            } <= indexes
+
+    def test_rerun_applies_nothing(self, app, db_session):
+        """Test that already applied migrations are not run again."""
+        with app.app_context():
+            db.session.commit()
+            assert run_migrations(db.engine) == []
+
+    def test_migrate_fills_search_columns_of_old_rows(self, app, db_session):
+        """Test that references stored without search columns are backfilled."""
+        with app.app_context():
+            ref_id = db.session.execute(
+                text(
+                    """
+                    INSERT INTO single_reference (bib_key, reference_type_id)
+                    SELECT 'Old2001', id FROM reference_types WHERE name = 'article'
+                    RETURNING id
+                    """
+                )
+            ).scalar()
+            db.session.execute(
+                text(
+                    """
+                    INSERT INTO reference_values (reference_id, field_id, value)
+                    SELECT :id, id, 'The Legacy Title' FROM fields WHERE key_name = 'title'
+                    """
+                ),
+                {"id": ref_id},
+            )
+            db.session.commit()
+
+            migrate()
+
+            row = db.session.execute(
+                text(
+                    "SELECT search_vector @@ to_tsquery('simple', 'legacy') AS found, "
+                    "search_text, document, title_sort "
+                    "FROM single_reference WHERE id = :id"
+                ),
+                {"id": ref_id},
+            ).one()
+            assert row.found
+            assert "The Legacy Title" in row.search_text
+            assert row.document == {
+                "fields": {"title": "The Legacy Title"},
+                "tag": None,
+            }
+            assert row.title_sort == "legacy title"
+
+    def test_migrate_rechecks_trigram_support(self, app, db_session):
+        """Test that a cached pg_trgm check does not outlive a migration."""
+        with app.app_context():
+            trigram_search_available()
+            assert trigram_search_available.cache_info().currsize == 1
+
+            migrate()
+
+            assert trigram_search_available.cache_info().currsize == 0
+
+    def test_migrate_updates_baseline_database(self, app, db_session):
+        """Test that a baseline database is migrated in place and stays readable."""
+        with app.app_context():
+            _load_baseline_schema()
+
+            assert migrate() == [v for v, _, _ in migration_files()]
+
+            reference = get_reference_by_bib_key("Base2001")
+            assert reference["fields"] == {"author": "Ada", "title": "An Old Paper"}
+            page = get_added_references_page()
+            assert [ref["bib_key"] for ref in page["references"]] == ["Base2001"]
+            row = db.session.execute(
+                text(
+                    "SELECT bibtex, title_sort, author_sort, updated_at, change_xid "
+                    "FROM single_reference"
+                )
+            ).one()
+            assert "An Old Paper" in row.bibtex
+            assert (row.title_sort, row.author_sort) == ("old paper", "ada")
+            assert row.updated_at is not None and row.change_xid is not None
+            assert run_migrations(db.engine) == []
@@ -0,0 +1,263 @@
+"""Tests for src/utils/doi_batch.py module."""
+
+import threading
+import time
+from unittest.mock import patch
+
+import requests
+
+from src.utils.doi_batch import (
+    MAX_BATCH_DOIS,
+    add_resolved_references,
+    make_bib_key_base,
+    resolve_dois,
+    split_dois,
+)
+from src.utils.doi_client import RateLimiter
+from src.utils.doi_jobs import get_doi_job
+from src.utils.references import (
+    add_reference,
+    count_user_references,
+    get_reference_by_bib_key,
+)
+from src.utils.users import create_user
+
+
+def _metadata(doi):
+    return {
+        "type": "journal-article",
+        "title": f"Paper {doi[-1]}",
+        "author": [{"given": "Jane", "family": "Doe"}],
+        "container-title": "Journal",
+        "issued": {"date-parts": [[2020]]},
+        "DOI": doi,
+    }
+
+
+def _fake_lookup(delay=0.0, missing=()):
+    calls = []
+    lock = threading.Lock()
+
+    def lookup(doi):
+        with lock:
+            calls.append(doi)
+        time.sleep(delay)
+        if doi in missing:
+            raise requests.exceptions.HTTPError("404 Not Found")
+        return _metadata(doi)
+
+    lookup.calls = calls
+    return lookup
+
+
+def _wait_for(app, job_id, user_id, timeout=5.0):
+    """Poll a job until it has finished."""
+    deadline = time.monotonic() + timeout
+    while True:
+        with app.app_context():
+            job = get_doi_job(job_id, user_id)
+        if job["status"] in ("done", "failed") or time.monotonic() > deadline:
+            return job
+        time.sleep(0.02)
+
+
+def _job_id(response):
+    return int(response.headers["Location"].rstrip("/").rsplit("/", 1)[1])
+
+
+class TestRateLimiter:
+    """Tests for the token bucket of the DOI client."""
+
+    def test_burst_then_spaced(self):
+        """Test that calls beyond the burst wait for their slot."""
+        now = [0.0]
+        waits = []
+        limiter = RateLimiter(10, burst=2, clock=lambda: now[0], sleep=waits.append)
+
+        assert [limiter.acquire() for _ in range(4)] == [0.0, 0.0, 0.1, 0.2]
+        now[0] = 1.0
+        assert limiter.acquire() == 0.0
+
+    def test_zero_rate_is_unlimited(self):
+        """Test that the limiter can be switched off."""
+        limiter = RateLimiter(0)
+        assert all(limiter.acquire() == 0.0 for _ in range(100))
+
+
+class TestResolveDois:
+    """Tests for concurrent DOI resolution."""
+
+    def test_lookups_run_concurrently(self, app, db_session):
+        """Test that total time is close to one lookup, not the sum."""
+        lookup = _fake_lookup(delay=0.2)
+        dois = [f"10.1000/p{i}" for i in range(8)]
+        with app.app_context(), patch("src.util.get_doi_metadata", lookup):
+            started = time.monotonic()
+            results = resolve_dois(dois)
+            elapsed = time.monotonic() - started
+
+        assert elapsed < 0.8
+        assert [r["doi"] for r in results] == dois
+        assert all(r["error"] is None for r in results)
+        assert results[0]["data"]["title"] == "Paper 0"
+
+    def test_errors_are_isolated_and_duplicates_merged(self, app, db_session):
+        """Test per-DOI errors, invalid input and duplicate DOIs."""
+        lookup = _fake_lookup(missing={"10.1000/gone"})
+        dois = ["10.1000/ok", "https://doi.org/10.1000/OK", "10.1000/gone", "nodoi"]
+        with app.app_context(), patch("src.util.get_doi_metadata", lookup):
+            results = resolve_dois(dois)
+
+        assert [r["doi"] for r in results] == ["10.1000/ok", "10.1000/gone", "nodoi"]
+        assert results[0]["error"] is None
+        assert "404" in results[1]["error"]
+        assert results[2]["error"] == "Invalid DOI format"
+        assert sorted(lookup.calls) == ["10.1000/gone", "10.1000/ok"]
+
+    def test_split_dois(self):
+        """Test splitting pasted lists."""
+        assert split_dois("10.1/a\n 10.1/b,10.1/c\n\n") == [
+            "10.1/a",
+            "10.1/b",
+            "10.1/c",
+        ]
+
+
+class TestAddResolvedReferences:
+    """Tests for adding resolved DOIs as references."""
+
+    def test_bib_keys_are_generated_and_unique(self, app, db_session):
+        """Test generated keys avoid existing and batch-internal clashes."""
+        lookup = _fake_lookup()
+        with app.app_context(), patch("src.util.get_doi_metadata", lookup):
+            user = create_user("batchuser", "testpass123")
+            add_reference("article", {"bib_key": "Doe2020", "title": "Old"})
+
+            results = resolve_dois(["10.1000/p1", "10.1000/p2"])
+            add_resolved_references(results, user["id"])
+
+            assert [r["bib_key"] for r in results] == ["Doe2020a", "Doe2020b"]
+            assert count_user_references(user["id"]) == 2
+            added = get_reference_by_bib_key("Doe2020a", user["id"])
+            assert added["fields"]["title"] == "Paper 1"
+            assert added["fields"]["author"] == "Jane Doe"
+
+    def test_make_bib_key_base(self):
+        """Test key stems from author, title and year."""
+        assert make_bib_key_base({"author": "Jörg Müller, A B", "year": 2019}) == (
+            "Muller2019"
+        )
+        assert make_bib_key_base({"title": "deep nets"}) == "Deep"
+        assert make_bib_key_base({}) == "Ref"
+
+
+class TestDoiBatchEndpoint:
+    """Tests for /get-doi/batch."""
+
+    def test_json_results_without_adding(self, app, client, db_session):
+        """Test that a JSON batch runs as a job whose result lists every DOI."""
+        with app.app_context():
+            user = create_user("batchuser", "testpass123")
+
+        with client.session_transaction() as sess:
+            sess["user_id"] = user["id"]
+            sess["username"] = user["username"]
+
+        lookup = _fake_lookup(missing={"10.1000/gone"})
+        with patch("src.util.get_doi_metadata", lookup):
+            response = client.post(
+                "/get-doi/batch", json={"dois": ["10.1000/ok", "10.1000/gone"]}
+            )
+            assert response.status_code == 202
+            data = response.get_json()
+            _wait_for(app, data["job_id"], user["id"])
+
+        job = client.get(data["status_url"]).get_json()
+        assert job["status"] == "done"
+        assert (job["kind"], job["total"]) == ("batch", 2)
+        assert [r["error"] is None for r in job["result"]] == [True, False]
+        with app.app_context():
+            assert count_user_references(user["id"]) == 0
+
+    def test_form_adds_references(self, app, client, db_session):
+        """Test that the front page form adds the resolved references."""
+        with app.app_context():
+            user = create_user("batchuser", "testpass123")
+
+        with client.session_transaction() as sess:
+            sess["user_id"] = user["id"]
+            sess["username"] = user["username"]
+
+        with patch("src.util.get_doi_metadata", _fake_lookup()):
+            response = client.post(
+                "/get-doi/batch", data={"dois": "10.1000/p1\n10.1000/p2"}
+            )
+            assert response.status_code == 302
+            _wait_for(app, _job_id(response), user["id"])
+
+        page = client.get(response.headers["Location"])
+        assert page.status_code == 302
+        assert page.headers["Location"].endswith("/user")
+        with app.app_context():
+            assert count_user_references(user["id"]) == 2
+
+    def test_failures_are_listed_not_flashed(self, app, client, db_session):
+        """Test that failed DOIs get one summary flash and are shown on the page."""
+        with app.app_context():
+            user = create_user("batchuser", "testpass123")
+
+        with client.session_transaction() as sess:
+            sess["user_id"] = user["id"]
+            sess["username"] = user["username"]
+
+        missing = {f"10.1000/gone{i}" for i in range(20)}
+        with patch("src.util.get_doi_metadata", _fake_lookup(missing=missing)):
+            response = client.post(
+                "/get-doi/batch", data={"dois": "\n".join(sorted(missing))}
+            )
+            _wait_for(app, _job_id(response), user["id"])
+
+        page = client.get(response.headers["Location"]).get_data(as_text=True)
+        assert 'id="doi-job-failed"' in page
+        assert all(doi in page for doi in missing)
+        assert page.count('id="alert-error"') == 1
+        assert "20 DOI:ta epäonnistui" in page
+
+    def test_too_many_dois_are_rejected(self, app, client, db_session):
+        """Test that an oversized batch is refused before a job is queued."""
+        with app.app_context():
+            user = create_user("batchuser", "testpass123")
+
+        with client.session_transaction() as sess:
+            sess["user_id"] = user["id"]
+            sess["username"] = user["username"]
+
+        dois = [f"10.1000/p{i}" for i in range(MAX_BATCH_DOIS + 1)]
+        response = client.post("/get-doi/batch", json={"dois": dois})
+        assert response.status_code == 400
+
+    def test_empty_list_is_rejected(self, app, client, db_session):
+        """Test that an empty JSON list is a client error."""
+        with app.app_context():
+            user = create_user("batchuser", "testpass123")
+
+        with client.session_transaction() as sess:
+            sess["user_id"] = user["id"]
+            sess["username"] = user["username"]
+
+        response = client.post("/get-doi/batch", json={"dois": []})
+        assert response.status_code == 400
+
+    def test_malformed_json_is_rejected(self, app, client, db_session):
+        """Test that bodies other than an object with a list of strings are 400."""
+        with app.app_context():
+            user = create_user("batchuser", "testpass123")
+
+        with client.session_transaction() as sess:
+            sess["user_id"] = user["id"]
+            sess["username"] = user["username"]
+
+        for body in ("10.1/x", ["10.1/x"], {"dois": [123]}, {"dois": {"a": 1}}):
+            response = client.post("/get-doi/batch", json=body)
+            assert response.status_code == 400
+            assert response.get_json()["success"] is False
@@ -0,0 +1,139 @@
+"""Integration tests for src/utils/doi_cache.py module."""
+
+from unittest.mock import patch
+
+import pytest
+import requests
+from sqlalchemy import text
+
+from src.config import db
+from src.util import UtilError, get_doi_data_from_api
+from src.utils.doi_cache import (
+    DoiNotFoundError,
+    get_doi_metadata,
+    normalize_doi,
+    purge_expired_doi_cache,
+)
+
+METADATA = {
+    "type": "article-journal",
+    "title": "Cached",
+    "author": [{"given": "A", "family": "B"}],
+    "container-title": "J",
+    "issued": {"date-parts": [[2021]]},
+}
+
+
+def _http_error(status):
+    response = requests.Response()
+    response.status_code = status
+    return requests.exceptions.HTTPError(f"{status} error", response=response)
+
+
+def _expire_all():
+    db.session.execute(
+        text("UPDATE doi_cache SET expires_at = CURRENT_TIMESTAMP - INTERVAL '1 s'")
+    )
+    db.session.commit()
+
+
+class TestNormalizeDoi:
+    """Tests for normalize_doi()."""
+
+    def test_prefixes_and_case_are_removed(self):
+        """Test that equivalent spellings share one key."""
+        assert normalize_doi(" 10.1145/ABC ") == "10.1145/abc"
+        assert normalize_doi("https://doi.org/10.1145/Abc") == "10.1145/abc"
+        assert normalize_doi("doi:10.1145/abc") == "10.1145/abc"
+
+
+class TestDoiCache:
+    """Tests for the read-through DOI cache."""
+
+    @patch("src.utils.doi_cache.fetch_doi_metadata")
+    def test_second_lookup_is_served_from_cache(self, fetch, app, db_session):
+        """Test that the service is called once per normalized DOI."""
+        fetch.return_value = METADATA
+        with app.app_context():
+            assert get_doi_metadata("10.1145/ABC") == METADATA
+            assert get_doi_metadata("https://doi.org/10.1145/abc") == METADATA
+            assert get_doi_data_from_api("10.1145/abc")["title"] == "Cached"
+
+        fetch.assert_called_once_with("10.1145/abc")
+
+    @patch("src.utils.doi_cache.fetch_doi_metadata")
+    def test_expired_entry_is_refreshed(self, fetch, app, db_session):
+        """Test that an entry past its TTL is fetched and stored again."""
+        fetch.side_effect = [METADATA, {**METADATA, "title": "Fresh"}]
+        with app.app_context():
+            get_doi_metadata("10.1145/abc")
+            _expire_all()
+
+            assert get_doi_metadata("10.1145/abc")["title"] == "Fresh"
+            assert get_doi_metadata("10.1145/abc")["title"] == "Fresh"
+            assert (
+                db.session.execute(text("SELECT count(*) FROM doi_cache")).scalar() == 1
+            )
+
+        assert fetch.call_count == 2
+
+    @patch("src.utils.doi_cache.fetch_doi_metadata")
+    def test_not_found_is_cached_briefly(self, fetch, app, db_session, monkeypatch):
+        """Test negative caching of unknown DOIs."""
+        monkeypatch.setenv("DOI_NEGATIVE_TTL", "60")
+        fetch.side_effect = _http_error(404)
+        with app.app_context():
+            for _ in range(2):
+                with pytest.raises(DoiNotFoundError):
+                    get_doi_metadata("10.1145/missing")
+            with pytest.raises(UtilError):
+                get_doi_data_from_api("10.1145/missing")
+
+            ttl = db.session.execute(
+                text(
+                    "SELECT extract(epoch FROM expires_at - fetched_at) "
+                    "FROM doi_cache WHERE doi = '10.1145/missing'"
+                )
+            ).scalar()
+            assert ttl == 60
+
+        fetch.assert_called_once()
+
+    @patch("src.utils.doi_cache.fetch_doi_metadata")
+    def test_server_errors_are_not_cached(self, fetch, app, db_session):
+        """Test that an unavailable service is asked again next time."""
+        fetch.side_effect = [_http_error(503), METADATA]
+        with app.app_context():
+            with pytest.raises(requests.exceptions.HTTPError):
+                get_doi_metadata("10.1145/abc")
+            assert get_doi_metadata("10.1145/abc") == METADATA
+
+        assert fetch.call_count == 2
+
+    def test_purge_deletes_only_expired_rows(self, app, db_session):
+        """Test that expired metadata and negative rows are deleted."""
+        with app.app_context():
+            db.session.execute(
+                text(
+                    """
+                    INSERT INTO doi_cache (doi, status, metadata, expires_at)
+                    VALUES
+                        ('10.1/fresh', 200, '{}',
+                         CURRENT_TIMESTAMP + INTERVAL '1 hour'),
+                        ('10.1/old', 200, '{}',
+                         CURRENT_TIMESTAMP - INTERVAL '1 s'),
+                        ('10.1/gone', 404, NULL,
+                         CURRENT_TIMESTAMP - INTERVAL '1 s'),
+                        ('10.1/gone2', 404, NULL,
+                         CURRENT_TIMESTAMP - INTERVAL '2 s')
+                    """
+                )
+            )
+            db.session.commit()
+
+            assert purge_expired_doi_cache(limit=2) == 2
+            assert purge_expired_doi_cache() == 1
+            db.session.commit()
+
+            remaining = db.session.execute(text("SELECT doi FROM doi_cache")).scalars()
+            assert list(remaining) == ["10.1/fresh"]
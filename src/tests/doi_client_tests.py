@@ -0,0 +1,236 @@
+"""Tests for src/utils/doi_client.py against a local stub HTTP server."""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from src.utils import doi_client
+from src.utils.doi_client import (
+    CircuitBreaker,
+    CircuitOpenError,
+    DoiClient,
+    parse_retry_after,
+)
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append(self.path)
+        server.ports.add(self.client_address[1])
+        status, delay, *headers = (
+            server.responses.pop(0) if server.responses else (200, 0)
+        )
+        if delay:
+            time.sleep(delay)
+        body = json.dumps({"title": "Stub", "path": self.path}).encode()
+        self.send_response(status)
+        for name, value in (headers[0] if headers else {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    """Run a stub DOI service; queue (status, delay[, headers]) in .responses."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+    server.daemon_threads = True
+    server.requests = []
+    server.ports = set()
+    server.responses = []
+    server.url = f"http://127.0.0.1:{server.server_port}/metadata"
+    thread = threading.Thread(
+        target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True
+    )
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _client(server, **kwargs):
+    options = {"max_retries": 2, "backoff_factor": 0.01, "read_timeout": 2.0}
+    options.update(kwargs)
+    return DoiClient(api_url=server.url, **options)
+
+
+class TestDoiClient:
+    """Tests for the pooled, retrying client."""
+
+    def test_reuses_connection(self, stub_server):
+        """Test that consecutive lookups share one kept-alive connection."""
+        client = _client(stub_server)
+        for _ in range(3):
+            assert client.get_metadata("10.1000/x")["title"] == "Stub"
+        client.close()
+
+        assert len(stub_server.requests) == 3
+        assert "doi=10.1000%2Fx" in stub_server.requests[0]
+        assert len(stub_server.ports) == 1
+
+    def test_retries_transient_errors(self, stub_server):
+        """Test that 503 responses are retried until one succeeds."""
+        stub_server.responses = [(503, 0), (503, 0), (200, 0)]
+        client = _client(stub_server)
+
+        assert client.get_metadata("10.1000/x")["title"] == "Stub"
+        assert len(stub_server.requests) == 3
+        assert client.breaker.state == "closed"
+
+    def test_gives_up_after_max_retries(self, stub_server):
+        """Test that retries are bounded."""
+        stub_server.responses = [(503, 0)] * 5
+        client = _client(stub_server, max_retries=1)
+
+        with pytest.raises(requests.exceptions.HTTPError):
+            client.get_metadata("10.1000/x")
+        assert len(stub_server.requests) == 2
+
+    def test_not_found_is_not_retried(self, stub_server):
+        """Test that a client error fails at once and keeps the circuit closed."""
+        stub_server.responses = [(404, 0)]
+        client = _client(stub_server, breaker=CircuitBreaker(1, 60))
+
+        with pytest.raises(requests.exceptions.HTTPError):
+            client.get_metadata("10.1000/missing")
+        assert len(stub_server.requests) == 1
+        assert client.breaker.state == "closed"
+
+    def test_read_timeout(self, stub_server):
+        """Test that a slow response is abandoned after the read timeout."""
+        stub_server.responses = [(200, 1.0)]
+        client = _client(stub_server, read_timeout=0.2, max_retries=0)
+
+        started = time.monotonic()
+        with pytest.raises(requests.exceptions.Timeout):
+            client.get_metadata("10.1000/slow")
+        assert time.monotonic() - started < 1.0
+
+    def test_total_timeout_bounds_retries(self, stub_server):
+        """Test that slow attempts stop at the lookup's time budget."""
+        stub_server.responses = [(200, 1.0)] * 5
+        client = _client(
+            stub_server, read_timeout=0.3, max_retries=5, total_timeout=0.5
+        )
+
+        started = time.monotonic()
+        with pytest.raises(requests.exceptions.Timeout):
+            client.get_metadata("10.1000/slow")
+        assert time.monotonic() - started < 0.9
+        assert len(stub_server.requests) <= 2
+
+    def test_long_retry_after_gives_up_at_once(self, stub_server):
+        """Test that a Retry-After beyond the budget is not waited for."""
+        stub_server.responses = [(429, 0, {"Retry-After": "3600"})]
+        waits = []
+        client = _client(stub_server, total_timeout=5.0, sleep=waits.append)
+
+        with pytest.raises(requests.exceptions.HTTPError):
+            client.get_metadata("10.1000/x")
+        assert waits == []
+        assert len(stub_server.requests) == 1
+
+    def test_short_retry_after_is_respected(self, stub_server):
+        """Test that a Retry-After within the budget is the wait before retrying."""
+        stub_server.responses = [(503, 0, {"Retry-After": "2"}), (200, 0)]
+        waits = []
+        client = _client(stub_server, total_timeout=5.0, sleep=waits.append)
+
+        assert client.get_metadata("10.1000/x")["title"] == "Stub"
+        assert waits == [2.0]
+
+    def test_parse_retry_after(self):
+        """Test the seconds and HTTP date forms of Retry-After."""
+        assert parse_retry_after("120") == 120.0
+        assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+        assert parse_retry_after("soon") is None
+        assert parse_retry_after(None) is None
+
+    def test_circuit_opens_and_recovers(self, stub_server):
+        """Test fail-fast while open and a successful half-open trial."""
+        now = [0.0]
+        breaker = CircuitBreaker(2, 30, clock=lambda: now[0])
+        client = _client(stub_server, max_retries=0, breaker=breaker)
+        stub_server.responses = [(503, 0), (503, 0)]
+
+        for _ in range(2):
+            with pytest.raises(requests.exceptions.HTTPError):
+                client.get_metadata("10.1000/x")
+        assert breaker.state == "open"
+
+        with pytest.raises(CircuitOpenError):
+            client.get_metadata("10.1000/x")
+        assert len(stub_server.requests) == 2
+
+        now[0] = 31.0
+        assert breaker.state == "half-open"
+        assert client.get_metadata("10.1000/x")["title"] == "Stub"
+        assert breaker.state == "closed"
+
+    def test_failed_trial_reopens_circuit(self):
+        """Test that one failure in half-open state opens the circuit again."""
+        now = [0.0]
+        breaker = CircuitBreaker(3, 10, clock=lambda: now[0])
+        for _ in range(3):
+            breaker.before_call()
+            breaker.record_failure()
+        now[0] = 11.0
+
+        breaker.before_call()
+        with pytest.raises(CircuitOpenError):
+            # Vain yksi koekutsu kerrallaan
+            breaker.before_call()
+        breaker.record_failure()
+        assert breaker.state == "open"
+
+    def test_unexpected_error_ends_trial(self, stub_server, monkeypatch):
+        """Test that a non-HTTP error in the trial call does not block later calls."""
+        now = [0.0]
+        breaker = CircuitBreaker(1, 10, clock=lambda: now[0])
+        client = _client(stub_server, max_retries=0, breaker=breaker)
+        breaker.before_call()
+        breaker.record_failure()
+        now[0] = 11.0
+
+        def broken_get(*args, **kwargs):
+            raise ValueError("unexpected")
+
+        monkeypatch.setattr(client.session, "get", broken_get)
+        with pytest.raises(ValueError):
+            client.get_metadata("10.1000/x")
+        monkeypatch.undo()
+
+        assert breaker.state == "half-open"
+        assert client.get_metadata("10.1000/x")["title"] == "Stub"
+        assert breaker.state == "closed"
+
+
+class TestClientConfiguration:
+    """Tests for the process-wide client."""
+
+    def test_client_is_built_from_environment(self, monkeypatch, stub_server):
+        """Test that the shared client reads its settings from the environment."""
+        monkeypatch.setenv("DOI_API_URL", stub_server.url)
+        monkeypatch.setenv("DOI_READ_TIMEOUT", "4")
+        monkeypatch.setenv("DOI_BREAKER_FAILURES", "7")
+        doi_client.set_client(None)
+        try:
+            client = doi_client.get_client()
+            assert client is doi_client.get_client()
+            assert client.timeout == (3.05, 4.0)
+            assert client.breaker.failure_threshold == 7
+            assert doi_client.fetch_doi_metadata("10.1000/x")["title"] == "Stub"
+        finally:
+            doi_client.set_client(None)
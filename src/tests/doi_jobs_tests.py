@@ -0,0 +1,317 @@
+"""Tests for src/utils/doi_jobs.py module and the DOI job routes."""
+
+import threading
+import time
+from unittest.mock import patch
+
+import requests
+from sqlalchemy import text
+
+from src.config import db
+from src.utils import doi_batch, doi_client
+from src.utils.doi_jobs import (
+    get_doi_job,
+    run_doi_job,
+    submit_doi_batch_job,
+    submit_doi_job,
+)
+from src.utils.users import create_user
+
+METADATA = {
+    "type": "journal-article",
+    "title": "Background lookup",
+    "author": [{"given": "Jane", "family": "Doe"}],
+    "container-title": "Journal",
+    "issued": {"date-parts": [[2020]]},
+    "DOI": "10.1000/job",
+}
+
+
+def _wait_for(job_id, user_id, timeout=5.0):
+    """Poll a job until it has finished."""
+    deadline = time.monotonic() + timeout
+    while True:
+        job = get_doi_job(job_id, user_id)
+        if job["status"] in ("done", "failed") or time.monotonic() > deadline:
+            return job
+        time.sleep(0.02)
+
+
+def _login(app, client):
+    with app.app_context():
+        user = create_user("jobuser", "testpass123")
+    with client.session_transaction() as sess:
+        sess["user_id"] = user["id"]
+        sess["username"] = user["username"]
+    return user
+
+
+class TestDoiJobs:
+    """Tests for queuing and running DOI lookups in the background."""
+
+    def test_submit_returns_before_lookup_finishes(self, app, db_session):
+        """Test that a slow upstream does not block the submitting caller."""
+        release = threading.Event()
+
+        def slow_lookup(doi):
+            release.wait(5)
+            return METADATA
+
+        with app.app_context(), patch("src.util.get_doi_metadata", slow_lookup):
+            user = create_user("jobuser", "testpass123")
+            started = time.monotonic()
+            job_id = submit_doi_job(user["id"], "10.1000/job")
+            assert time.monotonic() - started < 0.5
+            assert get_doi_job(job_id, user["id"])["status"] in ("queued", "running")
+
+            release.set()
+            job = _wait_for(job_id, user["id"])
+
+        assert job["status"] == "done"
+        assert job["error"] is None
+        assert job["result"]["title"] == "Background lookup"
+        assert job["result"]["author"] == "Jane Doe"
+
+    def test_lookup_error_is_stored(self, app, db_session):
+        """Test that a failed lookup ends the job with its error."""
+
+        def failing_lookup(doi):
+            raise requests.exceptions.HTTPError("404 Not Found")
+
+        with app.app_context(), patch("src.util.get_doi_metadata", failing_lookup):
+            user = create_user("jobuser", "testpass123")
+            job = _wait_for(submit_doi_job(user["id"], "10.1000/gone"), user["id"])
+
+        assert job["status"] == "failed"
+        assert "404" in job["error"]
+        assert job["result"] is None
+
+    def test_jobs_are_private_and_run_once(self, app, db_session):
+        """Test that other users cannot see a job and it is not run twice."""
+        lookup_calls = []
+
+        def lookup(doi):
+            lookup_calls.append(doi)
+            return METADATA
+
+        with app.app_context(), patch("src.util.get_doi_metadata", lookup):
+            owner = create_user("jobuser", "testpass123")
+            other = create_user("otheruser", "testpass123")
+            job_id = submit_doi_job(owner["id"], "10.1000/job")
+            _wait_for(job_id, owner["id"])
+
+            run_doi_job(job_id)
+            assert get_doi_job(job_id, other["id"]) is None
+
+        assert lookup_calls == ["10.1000/job"]
+
+    def test_batch_heartbeat_while_adding(self, app, db_session, monkeypatch):
+        """Test that a batch keeps updating its row while it adds references."""
+        monkeypatch.setattr("src.utils.doi_jobs.PROGRESS_INTERVAL", 0)
+        seen = []
+        link = doi_batch.link_reference_to_user
+
+        def slow_link(user_id, reference_id):
+            with db.engine.connect() as conn:
+                seen.append(
+                    conn.execute(text("SELECT updated_at FROM doi_jobs")).scalar()
+                )
+            time.sleep(0.05)
+            link(user_id, reference_id)
+
+        monkeypatch.setattr("src.utils.doi_batch.link_reference_to_user", slow_link)
+        dois = ["10.1000/a", "10.1000/b", "10.1000/c"]
+        with (
+            app.app_context(),
+            patch("src.util.get_doi_metadata", lambda doi: {**METADATA, "DOI": doi}),
+        ):
+            user = create_user("jobuser", "testpass123")
+            job = _wait_for(submit_doi_batch_job(user["id"], dois), user["id"])
+
+        assert job["status"] == "done"
+        assert len(seen) == 3
+        assert seen == sorted(set(seen))
+
+    def test_lost_job_is_reported_failed(self, app, db_session, monkeypatch):
+        """Test that a job left unfinished past the timeout counts as failed."""
+        monkeypatch.setenv("DOI_JOB_TIMEOUT", "60")
+        with app.app_context():
+            user = create_user("jobuser", "testpass123")
+            job_id = db.session.execute(
+                text(
+                    "INSERT INTO doi_jobs (user_id, doi, status, updated_at) "
+                    "VALUES (:user_id, '10.1000/lost', 'running', "
+                    "CURRENT_TIMESTAMP - INTERVAL '2 minutes') RETURNING id"
+                ),
+                {"user_id": user["id"]},
+            ).scalar()
+            db.session.commit()
+
+            job = get_doi_job(job_id, user["id"])
+
+        assert job["status"] == "failed"
+        assert job["error"] == "DOI lookup timed out"
+
+    def test_lookup_budget_bounds_lost_timeout(self, app, db_session, monkeypatch):
+        """Test that a job within the lookup's time budget is not reported lost."""
+        monkeypatch.setenv("DOI_JOB_TIMEOUT", "1")
+        monkeypatch.setenv("DOI_TOTAL_TIMEOUT", "30")
+        doi_client.set_client(None)
+        try:
+            with app.app_context():
+                user = create_user("jobuser", "testpass123")
+                ids = (
+                    db.session.execute(
+                        text(
+                            """
+                            INSERT INTO doi_jobs (user_id, doi, status, updated_at)
+                            VALUES
+                                (:user_id, '10.1000/slow', 'running',
+                                 CURRENT_TIMESTAMP - INTERVAL '20 seconds'),
+                                (:user_id, '10.1000/lost', 'running',
+                                 CURRENT_TIMESTAMP - INTERVAL '1 minute')
+                            RETURNING id
+                            """
+                        ),
+                        {"user_id": user["id"]},
+                    )
+                    .scalars()
+                    .all()
+                )
+                db.session.commit()
+
+                statuses = [get_doi_job(job_id, user["id"])["status"] for job_id in ids]
+        finally:
+            doi_client.set_client(None)
+
+        assert statuses == ["running", "failed"]
+
+    def test_cleanup_keeps_unfinished_jobs(self, app, db_session, monkeypatch):
+        """Test that finished or lost jobs and expired cache rows are deleted."""
+        monkeypatch.setenv("DOI_JOB_RETENTION", "60")
+        monkeypatch.setenv("DOI_JOB_TIMEOUT", "600")
+        with (
+            app.app_context(),
+            patch("src.util.get_doi_metadata", return_value=METADATA),
+        ):
+            user = create_user("jobuser", "testpass123")
+            db.session.execute(
+                text(
+                    """
+                    INSERT INTO doi_jobs (user_id, doi, status, created_at, updated_at)
+                    VALUES
+                        (:user_id, '10.1000/old-done', 'done',
+                         CURRENT_TIMESTAMP - INTERVAL '1 hour',
+                         CURRENT_TIMESTAMP - INTERVAL '1 hour'),
+                        (:user_id, '10.1000/old-queued', 'queued',
+                         CURRENT_TIMESTAMP - INTERVAL '2 minutes',
+                         CURRENT_TIMESTAMP - INTERVAL '2 minutes'),
+                        (:user_id, '10.1000/lost', 'running',
+                         CURRENT_TIMESTAMP - INTERVAL '1 hour',
+                         CURRENT_TIMESTAMP - INTERVAL '1 hour')
+                    """
+                ),
+                {"user_id": user["id"]},
+            )
+            db.session.execute(
+                text(
+                    "INSERT INTO doi_cache (doi, status, expires_at) "
+                    "VALUES ('10.1000/expired', 404, CURRENT_TIMESTAMP)"
+                )
+            )
+            db.session.commit()
+
+            _wait_for(submit_doi_job(user["id"], "10.1000/job"), user["id"])
+            assert (
+                db.session.execute(
+                    text("SELECT count(*) FROM doi_cache WHERE doi = '10.1000/expired'")
+                ).scalar()
+                == 0
+            )
+
+            remaining = db.session.execute(
+                text("SELECT doi FROM doi_jobs ORDER BY doi")
+            ).scalars()
+            assert list(remaining) == ["10.1000/job", "10.1000/old-queued"]
+
+
+class TestDoiJobRoutes:
+    """Tests for /get-doi and the job polling routes."""
+
+    def test_json_submit_and_poll(self, app, client, db_session):
+        """Test that /get-doi answers 202 with a job id to poll."""
+        _login(app, client)
+        with patch("src.util.get_doi_metadata", return_value=METADATA):
+            response = client.post("/get-doi", json={"doi": "10.1000/job"})
+            assert response.status_code == 202
+            status_url = response.get_json()["status_url"]
+
+            deadline = time.monotonic() + 5
+            data = client.get(status_url).get_json()
+            while data["status"] not in ("done", "failed"):
+                assert time.monotonic() < deadline
+                time.sleep(0.02)
+                data = client.get(status_url).get_json()
+
+        assert data["success"] is True
+        assert data["status"] == "done"
+        assert data["result"]["title"] == "Background lookup"
+
+    def test_form_redirects_to_prefilled_form(self, app, client, db_session):
+        """Test the page flow from the front page form to the prefilled form."""
+        user = _login(app, client)
+        with patch("src.util.get_doi_metadata", return_value=METADATA):
+            response = client.post("/get-doi", data={"doi-value": "10.1000/job"})
+            assert response.status_code == 302
+            job_url = response.headers["Location"]
+            job_id = int(job_url.rstrip("/").rsplit("/", 1)[1])
+            with app.app_context():
+                _wait_for(job_id, user["id"])
+
+        page = client.get(job_url).get_data(as_text=True)
+        assert 'id="add-reference-form"' in page
+        assert "Background lookup" in page
+
+    def test_pending_job_page_reloads(self, app, client, db_session):
+        """Test that an unfinished job shows the waiting page."""
+        user = _login(app, client)
+        with app.app_context():
+            job_id = db.session.execute(
+                text(
+                    "INSERT INTO doi_jobs (user_id, doi) "
+                    "VALUES (:user_id, '10.1000/wait') RETURNING id"
+                ),
+                {"user_id": user["id"]},
+            ).scalar()
+            db.session.commit()
+
+        page = client.get(f"/get-doi/jobs/{job_id}").get_data(as_text=True)
+        assert 'http-equiv="refresh"' in page
+        assert "10.1000/wait" in page
+
+    def test_invalid_doi_is_rejected_without_job(self, app, client, db_session):
+        """Test that malformed DOIs are rejected in the request."""
+        _login(app, client)
+        response = client.post("/get-doi", json={"doi": "invalid_doi_12345"})
+        assert response.status_code == 400
+
+        page = client.post("/get-doi", data={"doi-value": "invalid_doi_12345"})
+        assert 'id="alert-error"' in page.get_data(as_text=True)
+        with app.app_context():
+            count = db.session.execute(text("SELECT count(*) FROM doi_jobs")).scalar()
+        assert count == 0
+
+    def test_non_object_json_is_rejected(self, app, client, db_session):
+        """Test that a JSON body other than an object is a client error."""
+        _login(app, client)
+        for body in ('"10.1000/job"', '["10.1000/job"]', "null", "{"):
+            response = client.post(
+                "/get-doi", data=body, content_type="application/json"
+            )
+            assert response.status_code == 400
+            assert response.get_json()["success"] is False
+
+    def test_unknown_job_is_not_found(self, app, client, db_session):
+        """Test polling a job id that does not exist."""
+        _login(app, client)
+        assert client.get("/get-doi/jobs/999999/status").status_code == 404
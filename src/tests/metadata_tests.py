@@ -0,0 +1,53 @@
+"""Integration tests for src/utils/metadata.py module."""
+
+from sqlalchemy import text
+
+from src.config import db
+from src.utils import metadata
+
+
+class TestMetadataRegistry:
+    """Tests for the reference type and field registry."""
+
+    def test_registry_lists_types_in_id_order(self, app, db_session):
+        """Test that the seeded reference types are loaded."""
+        with app.app_context():
+            names = [t["name"] for t in metadata.get_reference_types()]
+            assert names == ["article", "book", "inproceedings"]
+
+    def test_field_ids_follow_type_membership(self, app, db_session):
+        """Test that only the fields of a type are returned for it."""
+        with app.app_context():
+            book_id = metadata.get_type_id("book")
+            book_fields = metadata.get_field_ids(book_id)
+            # Testikannan fields-taulussa ei ole publisher-kenttää
+            assert set(book_fields) == {"author", "title", "year"}
+
+            title_id = db.session.execute(
+                text("SELECT id FROM fields WHERE key_name = 'title'")
+            ).scalar()
+            assert book_fields["title"] == title_id
+
+    def test_registry_is_not_reloaded_between_lookups(self, app, db_session):
+        """Test that lookups share one loaded registry."""
+        with app.app_context():
+            assert metadata.get_registry() is metadata.get_registry()
+
+    def test_unknown_type_triggers_reload(self, app, db_session):
+        """Test that a type added after loading is found."""
+        with app.app_context():
+            metadata.get_registry()
+            db.session.execute(
+                text("INSERT INTO reference_types (name) VALUES ('misc')")
+            )
+            db.session.commit()
+
+            assert metadata.get_type_id("misc") is not None
+            assert metadata.get_type_id("nope") is None
+
+    def test_clear_registry_forces_reload(self, app, db_session):
+        """Test that clear_registry drops the loaded data."""
+        with app.app_context():
+            first = metadata.get_registry()
+            metadata.clear_registry()
+            assert metadata.get_registry() is not first
@@ -1,19 +1,34 @@
 """Integration tests for src/utils/references.py module."""
 
+from unittest.mock import patch
+
 import pytest
 
 from src.utils.references import (
     DatabaseError,
     add_reference,
+    build_reference_query,
     delete_reference_by_bib_key,
+    encode_cursor,
+    find_references,
+    find_references_with_facets,
     get_all_added_references,
+    get_added_references_page,
     get_all_references,
     get_reference_by_bib_key,
     get_reference_visibility,
+    get_references_by_bib_keys,
+    iter_added_references,
+    normalize_sort_key,
+    refresh_stale_bibtex,
+    search_reference_by_query,
+    trigram_search_available,
 )
+from src.util import BIBTEX_FORMAT_VERSION, format_bibtex_entry, iter_bibtex_chunks
+from src.utils.tags import add_tag, add_tag_to_reference
 from src.utils.users import create_user, link_reference_to_user
 
-from sqlalchemy import text
+from sqlalchemy import event, text
 from src.config import db
 
 
@@ -185,6 +200,42 @@ class TestAddReference:
             types = {ref["reference_type"] for ref in result}
             assert types == {"article", "book"}
 
+    def test_statement_count_does_not_grow_with_fields(self, app, db_session):
+        """Test that all field values are written with one statement."""
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        with app.app_context():
+            few = {"bib_key": "Few2020", "title": "Few"}
+            many = {
+                "bib_key": "Many2020",
+                "author": "A",
+                "title": "Many",
+                "journal": "J",
+                "year": 2020,
+                "volume": 1,
+                "number": 2,
+                "pages": "1-2",
+                "doi": "10.1/x",
+            }
+            # Rekisterin lataus ei kuulu vertailuun
+            add_reference("article", {"bib_key": "Warm2020", "title": "Warm"})
+            counts = []
+            for data in (few, many):
+                statements.clear()
+                event.listen(db.engine, "before_cursor_execute", record)
+                try:
+                    add_reference("article", data)
+                finally:
+                    event.remove(db.engine, "before_cursor_execute", record)
+                counts.append(len(statements))
+                inserts = [s for s in statements if "INTO reference_values" in s]
+                assert len(inserts) == 1
+
+            assert counts[0] == counts[1]
+
     def test_add_reference_with_special_characters(self, app, db_session, test_user):
         """Test adding reference with special characters."""
         with app.app_context():
@@ -306,6 +357,601 @@ class TestGetAllAddedReferences:
             assert isinstance(result[0]["created_at"], datetime)
 
 
+class TestIterAddedReferences:
+    """Tests for the streaming iter_added_references generator."""
+
+    def test_yields_same_references_as_list(
+        self, app, db_session, test_user, make_reference
+    ):
+        """Test that streaming in small batches returns every reference."""
+        with app.app_context():
+            _add_articles(make_reference, test_user["id"], 5, prefix="Stream")
+
+            streamed = list(iter_added_references(batch_size=2))
+            assert streamed == get_all_added_references()
+            assert [r["bib_key"] for r in streamed][:2] == ["Stream4", "Stream3"]
+
+    def test_user_stream_includes_private_references(
+        self, app, db_session, test_user, make_reference
+    ):
+        """Test that a user's stream contains their private references."""
+        with app.app_context():
+            make_reference("Hidden", owner=test_user["id"], is_public=False)
+
+            assert list(iter_added_references()) == []
+            keys = [r["bib_key"] for r in iter_added_references(test_user["id"])]
+            assert keys == ["Hidden"]
+
+
+def _add_articles(make_reference, user_id, count, prefix="Page"):
+    """Add count public articles for user_id, oldest first."""
+    for i in range(count):
+        fields = {"author": f"Author {i}", "title": f"Title {i}", "year": 2020}
+        make_reference(f"{prefix}{i}", fields=fields, owner=user_id)
+
+
+class TestPagination:
+    """Tests for keyset pagination of reference listings."""
+
+    def test_first_page_has_next_cursor(
+        self, app, db_session, test_user, make_reference
+    ):
+        """Test that a full first page returns a cursor to the next page."""
+        with app.app_context():
+            _add_articles(make_reference, test_user["id"], 5)
+
+            page = get_added_references_page(user_id=test_user["id"], page_size=2)
+            assert [r["bib_key"] for r in page["references"]] == ["Page4", "Page3"]
+            assert page["next_cursor"] is not None
+
+    def test_pages_cover_all_references_without_overlap(
+        self, app, db_session, test_user, make_reference
+    ):
+        """Test that following cursors walks through every reference once."""
+        with app.app_context():
+            _add_articles(make_reference, test_user["id"], 5)
+
+            seen = []
+            cursor = None
+            while True:
+                page = get_added_references_page(
+                    user_id=None, page_size=2, cursor=cursor
+                )
+                seen.extend(r["bib_key"] for r in page["references"])
+                cursor = page["next_cursor"]
+                if cursor is None:
+                    break
+
+            assert seen == ["Page4", "Page3", "Page2", "Page1", "Page0"]
+
+    def test_last_page_has_no_cursor(self, app, db_session, test_user, make_reference):
+        """Test that a page containing the rest of the rows ends pagination."""
+        with app.app_context():
+            _add_articles(make_reference, test_user["id"], 2)
+
+            page = get_added_references_page(user_id=test_user["id"], page_size=2)
+            assert len(page["references"]) == 2
+            assert page["next_cursor"] is None
+
+    def test_invalid_cursor_returns_first_page(
+        self, app, db_session, test_user, make_reference
+    ):
+        """Test that a malformed cursor is ignored."""
+        with app.app_context():
+            _add_articles(make_reference, test_user["id"], 3)
+
+            page = get_added_references_page(
+                user_id=test_user["id"], page_size=2, cursor="not-a-cursor"
+            )
+            assert page["references"][0]["bib_key"] == "Page2"
+
+    def test_shared_reference_is_listed_once(
+        self, app, db_session, test_user, make_reference
+    ):
+        """Test that a reference linked to two users fills one slot of a page."""
+        with app.app_context():
+            _add_articles(make_reference, test_user["id"], 2)
+            other = create_user("otheruser", "testpass123")
+            shared_id = get_reference_by_bib_key("Page1")["id"]
+            link_reference_to_user(other["id"], shared_id)
+
+            page = get_added_references_page(user_id=None, page_size=2)
+            assert [r["bib_key"] for r in page["references"]] == ["Page1", "Page0"]
+            assert page["next_cursor"] is None
+
+            own = get_all_added_references(user_id=other["id"])
+            assert [r["owner_id"] for r in own] == [other["id"]]
+
+    def test_user_page_past_last_row_shows_end_of_list(
+        self, app, client, db_session, test_user, make_reference
+    ):
+        """Test that a cursor past the end is not shown as an empty account."""
+        with app.app_context():
+            _add_articles(make_reference, test_user["id"], 2)
+            last = get_added_references_page(user_id=test_user["id"], page_size=2)
+            cursor = encode_cursor(last["references"][-1])
+
+        with client.session_transaction() as sess:
+            sess["user_id"] = test_user["id"]
+            sess["username"] = test_user["username"]
+
+        page = client.get(
+            "/user", query_string={"page_size": 10, "cursor": cursor}
+        ).get_data(as_text=True)
+        assert 'id="end-of-list"' in page
+        assert 'id="first-page-button"' in page
+        assert "Et ole vielä lisännyt" not in page
+
+    def test_search_oldest_first_with_limit_and_cursor(
+        self, app, db_session, test_user, make_reference
+    ):
+        """Test that search results can be paged in oldest first order."""
+        with app.app_context():
+            _add_articles(make_reference, test_user["id"], 4)
+
+            first = search_reference_by_query("Title", sort_by="oldest", limit=2)
+            assert [r["bib_key"] for r in first] == ["Page0", "Page1"]
+
+            cursor = f"{first[-1]['created_at'].isoformat()}_{first[-1]['id']}"
+            second = search_reference_by_query(
+                "Title", sort_by="oldest", limit=2, cursor=cursor
+            )
+            assert [r["bib_key"] for r in second] == ["Page2", "Page3"]
+
+
+class TestStoredBibtex:
+    """Tests for the BibTeX entry stored with each reference."""
+
+    def _stored(self, bib_key):
+        return db.session.execute(
+            text(
+                "SELECT bibtex, bibtex_version FROM single_reference "
+                "WHERE bib_key = :bib_key"
+            ),
+            {"bib_key": bib_key},
+        ).one()
+
+    def test_add_and_edit_store_formatted_entry(self, app, db_session, test_user):
+        """Test that writes store exactly what format_bibtex_entry produces."""
+        with app.app_context():
+            data = {"bib_key": "Stored1", "title": "A {braced} title", "year": 2024}
+            link_reference_to_user(test_user["id"], add_reference("article", data))
+
+            reference = get_reference_by_bib_key("Stored1")
+            bibtex, version = self._stored("Stored1")
+            assert bibtex == format_bibtex_entry(reference)
+            assert version == BIBTEX_FORMAT_VERSION
+
+            add_reference(
+                "article",
+                {"bib_key": "Stored2", "old_bib_key": "Stored1", "title": "New"},
+                editing=True,
+            )
+            bibtex, _ = self._stored("Stored2")
+            assert bibtex == "@article{Stored2,\n    title = {New}\n}"
+
+    def test_export_uses_stored_entries(
+        self, app, db_session, test_user, make_reference
+    ):
+        """Test that exporting does not format entries again."""
+        with app.app_context():
+            _add_articles(make_reference, test_user["id"], 3, prefix="Cached")
+            expected = "".join(
+                format_bibtex_entry(r) + "\n\n" for r in get_all_added_references()
+            )
+
+            with patch("src.util.format_bibtex_entry", side_effect=AssertionError):
+                exported = "".join(iter_bibtex_chunks(iter_added_references()))
+            assert exported == expected
+
+    def test_refresh_stale_bibtex(self, app, db_session, test_user, make_reference):
+        """Test that entries of another format version are formatted again."""
+        with app.app_context():
+            _add_articles(make_reference, test_user["id"], 3, prefix="Stale")
+            db.session.execute(
+                text(
+                    "UPDATE single_reference SET bibtex = 'old', bibtex_version = NULL "
+                    "WHERE bib_key <> 'Stale0'"
+                )
+            )
+            db.session.commit()
+
+            assert refresh_stale_bibtex(batch_size=1) == 2
+            bibtex, version = self._stored("Stale1")
+            assert bibtex.startswith("@article{Stale1,")
+            assert version == BIBTEX_FORMAT_VERSION
+            assert refresh_stale_bibtex() == 0
+
+
+class TestSortKeys:
+    """Tests for the precomputed title/author sort keys."""
+
+    def test_normalize_sort_key(self):
+        """Test lowercasing and removal of a leading article."""
+        assert normalize_sort_key("  The Art of Code ") == "art of code"
+        assert normalize_sort_key("An Apple") == "apple"
+        assert normalize_sort_key("Anatomy") == "anatomy"
+        assert normalize_sort_key(None) == ""
+
+    def test_title_sort_pages_in_sql(self, app, db_session, test_user, make_reference):
+        """Test that title order ignores articles and follows cursors."""
+        with app.app_context():
+            make_reference(
+                "C",
+                fields={"title": "The Zebra", "author": "Author"},
+                owner=test_user["id"],
+            )
+            make_reference(
+                "A",
+                fields={"title": "an apple", "author": "Author"},
+                owner=test_user["id"],
+            )
+            make_reference(
+                "B",
+                fields={"title": "Mango", "author": "Author"},
+                owner=test_user["id"],
+            )
+
+            first = find_references(sort_by="title", limit=2)
+            assert [r["bib_key"] for r in first] == ["A", "B"]
+
+            cursor = encode_cursor(first[-1], "title")
+            rest = find_references(sort_by="title", limit=2, cursor=cursor)
+            assert [r["bib_key"] for r in rest] == ["C"]
+
+    def test_search_sorted_by_author(self, app, db_session, test_user, make_reference):
+        """Test that search results are ordered by the author sort key."""
+        with app.app_context():
+            make_reference(
+                "K1",
+                fields={"title": "Common words", "author": "Zed"},
+                owner=test_user["id"],
+            )
+            make_reference(
+                "K2",
+                fields={"title": "Common words", "author": "adams"},
+                owner=test_user["id"],
+            )
+
+            result = search_reference_by_query("common", sort_by="author")
+            assert [r["bib_key"] for r in result] == ["K2", "K1"]
+
+    def test_edit_updates_sort_key(self, app, db_session, test_user, make_reference):
+        """Test that editing the title recomputes title_sort."""
+        with app.app_context():
+            make_reference(
+                "Edit1",
+                fields={"title": "Old", "author": "Author"},
+                owner=test_user["id"],
+            )
+            add_reference(
+                "article",
+                {"bib_key": "Edit1", "old_bib_key": "Edit1", "title": "The New"},
+                editing=True,
+            )
+
+            title_sort = db.session.execute(
+                text("SELECT title_sort FROM single_reference WHERE bib_key = 'Edit1'")
+            ).scalar()
+            assert title_sort == "new"
+
+
+class TestSearchReferenceByQuery:
+    """Tests for full-text search_reference_by_query."""
+
+    def test_search_is_case_insensitive(
+        self, app, db_session, test_user, make_reference
+    ):
+        """Test that searching ignores letter case."""
+        with app.app_context():
+            make_reference(
+                "Case2021", fields={"title": "Neural Networks"}, owner=test_user["id"]
+            )
+
+            result = search_reference_by_query("neural NETWORKS")
+            assert [r["bib_key"] for r in result] == ["Case2021"]
+
+    def test_search_matches_word_prefix_and_bib_key(
+        self, app, db_session, test_user, make_reference
+    ):
+        """Test that a word prefix matches field values and bib_key."""
+        with app.app_context():
+            make_reference(
+                "TestArticle2024", fields={"title": "Something"}, owner=test_user["id"]
+            )
+
+            result = search_reference_by_query("Test")
+            assert [r["bib_key"] for r in result] == ["TestArticle2024"]
+
+    def test_search_matches_tag_name(self, app, db_session, test_user, make_reference):
+        """Test that the tag name of a reference is searchable."""
+        with app.app_context():
+            make_reference(
+                "Tagged2021",
+                fields={"title": "Plain Title"},
+                owner=test_user["id"],
+                tag="bioinformatics",
+            )
+
+            result = search_reference_by_query("bioinformatics")
+            assert [r["bib_key"] for r in result] == ["Tagged2021"]
+
+    def test_search_excludes_words(self, app, db_session, test_user, make_reference):
+        """Test that websearch syntax can exclude words."""
+        with app.app_context():
+            make_reference(
+                "Keep2021", fields={"title": "Graph Theory"}, owner=test_user["id"]
+            )
+            make_reference(
+                "Drop2021", fields={"title": "Graph Databases"}, owner=test_user["id"]
+            )
+
+            result = search_reference_by_query("graph -databases")
+            assert [r["bib_key"] for r in result] == ["Keep2021"]
+
+    def test_search_orders_by_relevance(
+        self, app, db_session, test_user, make_reference
+    ):
+        """Test that a title match ranks above a journal-only match."""
+        with app.app_context():
+            make_reference(
+                "Title2021", fields={"title": "Compilers"}, owner=test_user["id"]
+            )
+            data = {
+                "bib_key": "Journal2021",
+                "author": "John Roe",
+                "title": "Other",
+                "journal": "Compilers Quarterly",
+                "year": 2021,
+            }
+            link_reference_to_user(test_user["id"], add_reference("article", data))
+
+            result = search_reference_by_query("compilers", sort_by="relevance")
+            assert [r["bib_key"] for r in result] == ["Title2021", "Journal2021"]
+            assert result[0]["rank"] > result[1]["rank"]
+
+    def test_relevance_results_can_be_paged(
+        self, app, db_session, test_user, make_reference
+    ):
+        """Test that a relevance cursor continues where the page ended."""
+        with app.app_context():
+            for i in range(3):
+                make_reference(
+                    f"Rank{i}", fields={"title": "Same Words"}, owner=test_user["id"]
+                )
+
+            first = search_reference_by_query("same", sort_by="relevance", limit=2)
+            cursor = f"{first[-1]['rank']!r}_{first[-1]['id']}"
+            rest = search_reference_by_query(
+                "same", sort_by="relevance", limit=2, cursor=cursor
+            )
+
+            keys = [r["bib_key"] for r in first + rest]
+            assert sorted(keys) == ["Rank0", "Rank1", "Rank2"]
+
+
+class TestFindReferences:
+    """Tests for the composed search/filter/sort query of find_references."""
+
+    FIELDS = {"author": "Grace Hopper", "title": "Compiler Notes", "year": 2020}
+
+    def test_query_filters_sort_and_limit_together(
+        self, app, db_session, test_user, make_reference
+    ):
+        """Test that type and tag filters are applied before the limit."""
+        with app.app_context():
+            make_reference("B1", "book", self.FIELDS, test_user["id"], tag="compilers")
+            make_reference(
+                "A3", fields=self.FIELDS, owner=test_user["id"], tag="compilers"
+            )
+            make_reference("A2", fields=self.FIELDS, owner=test_user["id"])
+            make_reference(
+                "A1", fields=self.FIELDS, owner=test_user["id"], tag="compilers"
+            )
+
+            result = find_references(
+                query="compiler",
+                ref_type_filter="article",
+                tag_filter="compilers",
+                sort_by="bib_key",
+                limit=1,
+            )
+            assert [r["bib_key"] for r in result] == ["A1"]
+
+            cursor = encode_cursor(result[-1], "bib_key")
+            rest = find_references(
+                query="compiler",
+                ref_type_filter="article",
+                tag_filter="compilers",
+                sort_by="bib_key",
+                cursor=cursor,
+            )
+            assert [r["bib_key"] for r in rest] == ["A3"]
+
+    def test_relevance_without_query_uses_newest(
+        self, app, db_session, test_user, make_reference
+    ):
+        """Test that relevance order falls back to newest without a query."""
+        with app.app_context():
+            make_reference("Old", fields=self.FIELDS, owner=test_user["id"])
+            make_reference("New", fields=self.FIELDS, owner=test_user["id"])
+
+            _, _, sort_by = build_reference_query(sort_by="relevance")
+            assert sort_by == "newest"
+            result = find_references(sort_by="relevance")
+            assert [r["bib_key"] for r in result] == ["New", "Old"]
+
+    def test_facets_count_all_matches(self, app, db_session, test_user, make_reference):
+        """Test that facet counts cover every match, not just the page."""
+        with app.app_context():
+            make_reference("B1", "book", self.FIELDS, test_user["id"], tag="compilers")
+            make_reference(
+                "A1", fields=self.FIELDS, owner=test_user["id"], tag="compilers"
+            )
+            make_reference("A2", fields=self.FIELDS, owner=test_user["id"])
+
+            result = find_references_with_facets(
+                query="compiler", sort_by="bib_key", limit=1
+            )
+            assert [r["bib_key"] for r in result["references"]] == ["A1"]
+            assert result["facets"] == {
+                "type": [
+                    {"value": "article", "count": 2},
+                    {"value": "book", "count": 1},
+                ],
+                "tag": [{"value": "compilers", "count": 2}],
+                "year": [{"value": "2020", "count": 3}],
+            }
+
+            filtered = find_references_with_facets(ref_type_filter="book")
+            assert [r["bib_key"] for r in filtered["references"]] == ["B1"]
+            # Sisarten määrät säilyvät; muut fasetit rajataan tyypillä
+            assert filtered["facets"] == {
+                "type": [
+                    {"value": "article", "count": 2},
+                    {"value": "book", "count": 1},
+                ],
+                "tag": [{"value": "compilers", "count": 1}],
+                "year": [{"value": "2020", "count": 1}],
+            }
+
+            by_tag = find_references_with_facets(
+                ref_type_filter="article", tag_filter="compilers"
+            )
+            assert [r["bib_key"] for r in by_tag["references"]] == ["A1"]
+            assert by_tag["facets"]["type"] == [
+                {"value": "article", "count": 1},
+                {"value": "book", "count": 1},
+            ]
+            assert by_tag["facets"]["tag"] == [{"value": "compilers", "count": 1}]
+            assert by_tag["facets"]["year"] == [{"value": "2020", "count": 1}]
+
+    def test_facets_are_returned_for_an_empty_page(
+        self, app, db_session, test_user, make_reference
+    ):
+        """Test that facets are counted even past the last page."""
+        with app.app_context():
+            make_reference("A1", fields=self.FIELDS, owner=test_user["id"])
+            last = find_references(sort_by="bib_key")[-1]
+
+            result = find_references_with_facets(
+                sort_by="bib_key", cursor=encode_cursor(last, "bib_key")
+            )
+            assert result["references"] == []
+            assert result["facets"]["type"] == [{"value": "article", "count": 1}]
+
+            nothing = find_references_with_facets(query="nomatch")
+            assert nothing == {
+                "references": [],
+                "facets": {"type": [], "tag": [], "year": []},
+            }
+
+
+class TestFuzzySearch:
+    """Tests for the trigram based fuzzy search mode."""
+
+    def test_fuzzy_matches_substring_ignoring_case(
+        self, app, db_session, test_user, make_reference
+    ):
+        """Test that fuzzy mode finds substrings inside words."""
+        with app.app_context():
+            make_reference(
+                "Sub2022",
+                fields={"author": "Edsger Dijkstra", "title": "Shortest"},
+                owner=test_user["id"],
+            )
+
+            result = search_reference_by_query("JKSTR", fuzzy=True)
+            assert [r["bib_key"] for r in result] == ["Sub2022"]
+
+    def test_fuzzy_treats_like_wildcards_literally(
+        self, app, db_session, test_user, make_reference
+    ):
+        """Test that % and _ in the query are not LIKE wildcards."""
+        with app.app_context():
+            make_reference(
+                "Wild2022",
+                fields={"author": "Ada Lovelace", "title": "Engines"},
+                owner=test_user["id"],
+            )
+
+            assert search_reference_by_query("%", fuzzy=True) == []
+
+    def test_fuzzy_finds_misspelled_author(
+        self, app, db_session, test_user, make_reference
+    ):
+        """Test that a misspelled name matches through trigram similarity."""
+        with app.app_context():
+            if not trigram_search_available():
+                pytest.skip("pg_trgm extension is not installed")
+            make_reference(
+                "Typo2022",
+                fields={"author": "Edsger Dijkstra", "title": "Shortest"},
+                owner=test_user["id"],
+            )
+            make_reference(
+                "Other2022",
+                fields={"author": "Alan Turing", "title": "Machines"},
+                owner=test_user["id"],
+            )
+
+            result = search_reference_by_query(
+                "Dijkstar", fuzzy=True, sort_by="relevance"
+            )
+            assert [r["bib_key"] for r in result] == ["Typo2022"]
+            assert 0 < result[0]["rank"] <= 1
+
+
+class TestReferenceDocument:
+    """Tests for the denormalized single_reference.document column."""
+
+    def _document(self, bib_key):
+        return db.session.execute(
+            text("SELECT document FROM single_reference WHERE bib_key = :bib_key"),
+            {"bib_key": bib_key},
+        ).scalar()
+
+    def test_document_contains_fields(
+        self, app, db_session, sample_reference_data, test_user
+    ):
+        """Test that add_reference writes the field values to the document."""
+        with app.app_context():
+            add_reference("article", sample_reference_data)
+
+            document = self._document(sample_reference_data["bib_key"])
+            assert document["fields"]["title"] == sample_reference_data["title"]
+            assert document["fields"]["year"] == str(sample_reference_data["year"])
+            assert document["tag"] is None
+
+    def test_document_follows_edit_and_tag(self, app, db_session, test_user):
+        """Test that editing and tagging keep the document up to date."""
+        with app.app_context():
+            data = {
+                "bib_key": "Doc2022",
+                "author": "Old Author",
+                "title": "Old Title",
+                "journal": "Journal",
+                "year": 2022,
+            }
+            ref_id = add_reference("article", data)
+            link_reference_to_user(test_user["id"], ref_id)
+            add_reference(
+                "article",
+                {**data, "title": "New Title", "old_bib_key": "Doc2022"},
+                editing=True,
+            )
+            tag_id = add_tag("docs")
+            add_tag_to_reference(tag_id, ref_id)
+
+            document = self._document("Doc2022")
+            assert document["fields"]["title"] == "New Title"
+            assert document["tag"] == {"id": tag_id, "name": "docs"}
+
+            reference = get_reference_by_bib_key("Doc2022")
+            assert reference["tag"]["name"] == "docs"
+            assert list(reference["fields"]) == sorted(reference["fields"])
+
+
 class TestIntegrationWorkflows:
     """Integration tests combining multiple functions."""
 
@@ -398,6 +1044,37 @@ class TestGetReferenceByBibKey:
             assert ref_after is None
 
 
+class TestGetReferencesByBibKeys:
+    """Tests for get_references_by_bib_keys function."""
+
+    def test_keeps_caller_order_and_skips_missing(
+        self, app, db_session, test_user, make_reference
+    ):
+        """Test that results follow the given key order."""
+        with app.app_context():
+            _add_articles(make_reference, test_user["id"], 3, prefix="Group")
+
+            result = get_references_by_bib_keys(["Group2", "Missing", "Group0"])
+            assert [r["bib_key"] for r in result] == ["Group2", "Group0"]
+            assert result[0]["fields"]["title"] == "Title 2"
+            assert result[0]["username"] == test_user["username"]
+
+    def test_private_reference_needs_owner(self, app, db_session, test_user):
+        """Test that private references are only returned to their owner."""
+        with app.app_context():
+            data = {"bib_key": "Hidden1", "title": "Secret", "is_public": False}
+            link_reference_to_user(test_user["id"], add_reference("article", data))
+
+            assert get_references_by_bib_keys(["Hidden1"]) == []
+            own = get_references_by_bib_keys(["Hidden1"], user_id=test_user["id"])
+            assert [r["bib_key"] for r in own] == ["Hidden1"]
+
+    def test_empty_key_list(self, app, db_session):
+        """Test that an empty key list returns an empty list."""
+        with app.app_context():
+            assert get_references_by_bib_keys([]) == []
+
+
 class TestDeleteReference:
     """Tests for delete_reference_by_bib_key function."""
 
@@ -0,0 +1,77 @@
+"""Integration tests for src/utils/request_cache.py module."""
+
+from sqlalchemy import text
+
+from src.config import db
+from src.utils import request_cache
+from src.utils.references import (
+    add_reference,
+    get_reference_by_bib_key,
+    get_reference_visibility,
+)
+from src.utils.tags import add_tag, add_tag_to_reference, get_tag_by_reference
+from src.utils.users import create_user, link_reference_to_user
+
+
+def _add_reference(make_reference):
+    user = create_user("cacheuser", "testpass123")
+    return make_reference("Cache2024", fields={"title": "Cached"}, owner=user["id"])
+
+
+class TestRequestCache:
+    """Tests for the flask.g backed request cache."""
+
+    def test_lookup_without_app_context_is_missing(self):
+        """Test that nothing is cached outside an app context."""
+        request_cache.remember(("key",), 1)
+        assert request_cache.lookup(("key",)) is request_cache.MISSING
+
+    def test_repeated_lookup_returns_same_object(self, app, db_session, make_reference):
+        """Test that a second lookup in the same request hits the cache."""
+        with app.app_context():
+            _add_reference(make_reference)
+
+            first = get_reference_by_bib_key("Cache2024")
+            assert get_reference_by_bib_key("Cache2024") is first
+
+    def test_reference_lookup_primes_visibility_and_tag(
+        self, app, db_session, make_reference
+    ):
+        """Test that visibility and tag come from the cached reference row."""
+        with app.app_context():
+            ref_id = _add_reference(make_reference)
+            add_tag_to_reference(add_tag("cached"), ref_id)
+            get_reference_by_bib_key("Cache2024")
+
+            # Muutos ohi kirjoitusfunktioiden ei näy saman pyynnön aikana
+            db.session.execute(
+                text("UPDATE single_reference SET is_public = FALSE WHERE id = :id"),
+                {"id": ref_id},
+            )
+            db.session.execute(
+                text("DELETE FROM reference_tags WHERE reference_id = :id"),
+                {"id": ref_id},
+            )
+            assert get_reference_visibility("Cache2024") is True
+            assert get_tag_by_reference(ref_id)["name"] == "cached"
+
+    def test_write_invalidates_cache(self, app, db_session, make_reference):
+        """Test that add_reference clears cached lookups."""
+        with app.app_context():
+            _add_reference(make_reference)
+            assert get_reference_by_bib_key("Cache2024")["fields"]["title"] == "Cached"
+
+            add_reference(
+                "article",
+                {"bib_key": "Cache2024", "old_bib_key": "Cache2024", "title": "New"},
+                editing=True,
+            )
+            assert get_reference_by_bib_key("Cache2024")["fields"]["title"] == "New"
+
+    def test_caches_are_per_app_context(self, app, db_session):
+        """Test that a new request starts with an empty cache."""
+        with app.app_context():
+            request_cache.remember(("key",), 1)
+            assert request_cache.lookup(("key",)) == 1
+        with app.app_context():
+            assert request_cache.lookup(("key",)) is request_cache.MISSING
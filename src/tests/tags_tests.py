@@ -1,12 +1,29 @@
 """Integration tests for src/utils/tags.py module."""
 
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import text
+
+from src.config import db
 from src.utils.references import add_reference
 from src.utils.tags import (
+    TagError,
+    TagExistsError,
     add_tag,
     add_tag_to_reference,
     delete_tag_from_reference,
+    get_or_create_tag,
     get_tag_by_reference,
+    get_tag_id_by_name,
+    get_tag_version,
     get_tags,
+    merge_tags,
+    rename_tag,
+    tag_references,
+    untag_references,
 )
 
 
@@ -151,3 +168,214 @@ class TestGetTags:
 
             for name in tag_names:
                 assert name in retrieved_tag_names
+
+
+class TestGetOrCreateTagRace:
+    """Tests for get_or_create_tag under a concurrent insert."""
+
+    def test_waits_for_concurrent_insert_of_same_name(self, app, db_session):
+        """Test that the id of a tag committed by another transaction is returned."""
+        result = {}
+
+        def create():
+            with app.app_context():
+                result["tag"] = get_or_create_tag("Race")
+
+        with db.engine.connect() as other:
+            tx = other.begin()
+            tag_id = other.execute(
+                text("INSERT INTO tags (name) VALUES ('Race') RETURNING id")
+            ).scalar()
+            worker = threading.Thread(target=create)
+            worker.start()
+            # Odotetaan, että toinen lause jää odottamaan rivilukkoa
+            deadline = time.monotonic() + 5
+            while not other.execute(
+                text(
+                    "SELECT EXISTS (SELECT 1 FROM pg_stat_activity "
+                    "WHERE wait_event_type = 'Lock' AND pid <> pg_backend_pid())"
+                )
+            ).scalar():
+                assert time.monotonic() < deadline
+                time.sleep(0.01)
+            tx.commit()
+            worker.join(5)
+
+        assert result["tag"] == (tag_id, False)
+
+
+class TestTagCache:
+    """Tests for the versioned tag list cache."""
+
+    def test_get_tags_is_cached_until_a_write(self, app, db_session):
+        """Test that tags changed behind the cache are not reloaded."""
+        with app.app_context():
+            add_tag("Cached Tag")
+            version = get_tag_version()
+            assert [tag["name"] for tag in get_tags()] == ["Cached Tag"]
+
+            db.session.execute(text("UPDATE tags SET name = 'Renamed'"))
+            db.session.commit()
+            assert [tag["name"] for tag in get_tags()] == ["Cached Tag"]
+            assert get_tag_version() == version
+
+    def test_add_tag_bumps_version(self, app, db_session):
+        """Test that adding a tag makes it visible immediately."""
+        with app.app_context():
+            get_tags()
+            version = get_tag_version()
+            add_tag("Fresh Tag")
+
+            assert get_tag_version() > version
+            assert "Fresh Tag" in [tag["name"] for tag in get_tags()]
+
+    def test_write_in_another_process_invalidates_cache(self, app, db_session):
+        """Test that the next request reloads tags after another process wrote."""
+        with app.app_context():
+            add_tag("Local Tag")
+            assert [tag["name"] for tag in get_tags()] == ["Local Tag"]
+
+        # Toinen prosessi: oma yhteys, tagi ja versio samassa transaktiossa
+        with db.engine.begin() as conn:
+            conn.execute(text("INSERT INTO tags (name) VALUES ('Remote Tag')"))
+            conn.execute(text("UPDATE tag_version SET version = version + 1"))
+
+        with app.app_context():
+            assert [tag["name"] for tag in get_tags()] == ["Local Tag", "Remote Tag"]
+
+    def test_tag_version_is_read_once_per_request(self, app, db_session):
+        """Test that a cached list costs no query after the first read."""
+        with app.app_context():
+            add_tag("Cached Tag")
+            get_tags()
+
+            with patch.object(db.session, "execute") as execute:
+                get_tags()
+                get_tag_version()
+                execute.assert_not_called()
+
+    def test_get_tag_id_by_name_uses_cache(self, app, db_session):
+        """Test that known names are resolved from the cache."""
+        with app.app_context():
+            tag_id = add_tag("Known Tag")
+            get_tags()
+
+            with patch.object(db.session, "execute") as execute:
+                assert get_tag_id_by_name("Known Tag") == tag_id
+                execute.assert_not_called()
+
+    def test_get_tag_id_by_name_falls_back_to_database(self, app, db_session):
+        """Test that a tag added by another process is found."""
+        with app.app_context():
+            get_tags()
+            tag_id = db.session.execute(
+                text("INSERT INTO tags (name) VALUES ('Elsewhere') RETURNING id")
+            ).scalar()
+            db.session.commit()
+
+            assert get_tag_id_by_name("Elsewhere") == tag_id
+            assert get_tag_id_by_name("Missing") is None
+            assert "Elsewhere" in [tag["name"] for tag in get_tags()]
+
+    def test_add_existing_tag_raises_without_insert(self, app, db_session):
+        """Test that a cached name raises TagExistsError."""
+        with app.app_context():
+            add_tag("Duplicate")
+
+            with pytest.raises(TagExistsError):
+                add_tag("Duplicate")
+
+
+class TestBulkTagOperations:
+    """Tests for the set-based tag operations."""
+
+    def test_get_or_create_tag(self, app, db_session):
+        """Test that an existing name returns its id instead of failing."""
+        with app.app_context():
+            tag_id, created = get_or_create_tag("Upsert")
+            assert created is True
+            assert get_or_create_tag("Upsert") == (tag_id, False)
+
+            # Toisen prosessin lisäämä tagi ei ole välimuistissa
+            other_id = db.session.execute(
+                text("INSERT INTO tags (name) VALUES ('Other') RETURNING id")
+            ).scalar()
+            db.session.commit()
+            assert get_or_create_tag("Other") == (other_id, False)
+            assert "Other" in [tag["name"] for tag in get_tags()]
+
+    def test_tag_references_replaces_and_skips_unchanged(
+        self, app, db_session, make_reference
+    ):
+        """Test tagging many references in one call."""
+        with app.app_context():
+            first = add_tag("First")
+            second = add_tag("Second")
+            ref_ids = [make_reference(f"Bulk{i}") for i in range(3)]
+            add_tag_to_reference(first, ref_ids[0])
+            add_tag_to_reference(second, ref_ids[1])
+
+            assert tag_references(second, ref_ids) == 2
+            assert all(get_tag_by_reference(i)["id"] == second for i in ref_ids)
+            assert tag_references(second, ref_ids + ref_ids) == 0
+
+            document = db.session.execute(
+                text("SELECT document FROM single_reference WHERE id = :id"),
+                {"id": ref_ids[0]},
+            ).scalar()
+            assert document["tag"]["name"] == "Second"
+
+            assert untag_references(ref_ids) == 3
+            assert all(get_tag_by_reference(i) is None for i in ref_ids)
+            assert tag_references(second, []) == 0
+
+    def test_rename_tag_updates_documents(self, app, db_session, make_reference):
+        """Test that renaming is visible in the tag list and documents."""
+        with app.app_context():
+            tag_id = add_tag("Old Name")
+            add_tag("Taken")
+            ref_id = [make_reference(f"Bulk{i}") for i in range(1)][0]
+            add_tag_to_reference(tag_id, ref_id)
+
+            rename_tag(tag_id, "New Name")
+
+            assert get_tag_by_reference(ref_id)["name"] == "New Name"
+            assert "New Name" in [tag["name"] for tag in get_tags()]
+            document = db.session.execute(
+                text("SELECT document FROM single_reference WHERE id = :id"),
+                {"id": ref_id},
+            ).scalar()
+            assert document["tag"]["name"] == "New Name"
+
+            with pytest.raises(TagExistsError):
+                rename_tag(tag_id, "Taken")
+            with pytest.raises(TagError):
+                rename_tag(tag_id + 1000, "Nothing")
+
+    def test_merge_tags_moves_references(self, app, db_session, make_reference):
+        """Test that merging moves references and deletes the source tag."""
+        with app.app_context():
+            source = add_tag("Source")
+            target = add_tag("Target")
+            ref_ids = [make_reference(f"Bulk{i}") for i in range(3)]
+            tag_references(source, ref_ids[:2])
+            tag_references(target, ref_ids[2:])
+
+            assert merge_tags(source, target) == 2
+
+            assert all(get_tag_by_reference(i)["id"] == target for i in ref_ids)
+            assert [tag["name"] for tag in get_tags()] == ["Target"]
+            with pytest.raises(TagError):
+                merge_tags(target, target)
+
+    def test_merge_into_missing_tag_keeps_source(self, app, db_session):
+        """Test that merging into a nonexistent tag fails and deletes nothing."""
+        with app.app_context():
+            source = add_tag("Source")
+
+            with pytest.raises(TagError, match="does not exist"):
+                merge_tags(source, source + 1000)
+            with pytest.raises(TagError, match="does not exist"):
+                merge_tags(source + 1000, source)
+
+            assert [tag["name"] for tag in get_tags()] == ["Source"]
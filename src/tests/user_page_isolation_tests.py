@@ -5,7 +5,11 @@ from utils.references import (
     get_all_added_references,
     get_reference_by_bib_key,
     delete_reference_by_bib_key,
+    delete_references_by_bib_keys,
+    get_reference_visibility,
+    set_references_visibility,
 )
+from utils.tags import add_tag, get_tag_by_reference
 from utils.users import create_user, link_reference_to_user
 
 
@@ -176,6 +180,123 @@ class TestUserIsolation:
             assert deleted_ref is None
 
 
+class TestBulkActions:
+    """Tests for bulk delete and bulk visibility on the user page."""
+
+    def test_bulk_delete_only_deletes_own_references(
+        self, app, db_session, make_reference
+    ):
+        """Test that other users' keys are ignored by the bulk delete."""
+        with app.app_context():
+            user1 = create_user("user1", "pass123")
+            user2 = create_user("user2", "pass456")
+            make_reference("Bulk1", owner=user1["id"])
+            make_reference("Bulk2", owner=user1["id"])
+            make_reference("Other1", owner=user2["id"])
+
+            deleted = delete_references_by_bib_keys(
+                ["Bulk1", "Bulk2", "Other1", "Missing"], user1["id"]
+            )
+
+            assert sorted(deleted) == ["Bulk1", "Bulk2"]
+            assert get_reference_by_bib_key("Bulk1", user_id=user1["id"]) is None
+            assert get_reference_by_bib_key("Other1", user_id=user2["id"]) is not None
+            assert delete_references_by_bib_keys([], user1["id"]) == []
+
+    def test_bulk_visibility_only_updates_own_references(
+        self, app, db_session, make_reference
+    ):
+        """Test that visibility changes are ownership-checked."""
+        with app.app_context():
+            user1 = create_user("user1", "pass123")
+            user2 = create_user("user2", "pass456")
+            make_reference("Vis1", owner=user1["id"])
+            make_reference("Vis2", owner=user2["id"])
+
+            updated = set_references_visibility(["Vis1", "Vis2"], user1["id"], False)
+
+            assert updated == ["Vis1"]
+            assert get_reference_visibility("Vis1") is False
+            assert get_reference_visibility("Vis2") is True
+
+    def test_bulk_routes_clean_up_group(self, app, client, db_session, make_reference):
+        """Test that deleted and privatized keys leave the session group."""
+        with app.app_context():
+            user = create_user("user1", "pass123")
+            for bib_key in ("Grp1", "Grp2", "Grp3"):
+                make_reference(bib_key, owner=user["id"])
+
+        with client.session_transaction() as sess:
+            sess["user_id"] = user["id"]
+            sess["username"] = user["username"]
+            sess["group"] = {"userId": None, "references": ["Grp1", "Grp2", "Grp3"]}
+
+        response = client.post("/references/bulk-delete", data={"bib_keys": ["Grp1"]})
+        assert response.status_code == 302
+        response = client.post(
+            "/references/bulk-visibility",
+            data={"bib_keys": ["Grp2", "Grp3"], "visibility": "private"},
+        )
+        assert response.status_code == 302
+
+        with client.session_transaction() as sess:
+            assert sess["group"]["references"] == []
+
+        with app.app_context():
+            assert get_reference_by_bib_key("Grp1", user_id=user["id"]) is None
+            assert get_reference_visibility("Grp2") is False
+
+    def test_bulk_tag_only_tags_own_references(
+        self, app, client, db_session, make_reference
+    ):
+        """Test that the bulk tag route skips other users' references."""
+        with app.app_context():
+            user1 = create_user("user1", "pass123")
+            user2 = create_user("user2", "pass456")
+            own_id = make_reference("Tag1", owner=user1["id"])
+            other_id = make_reference("Tag2", owner=user2["id"])
+            tag_id = add_tag("bulk")
+
+        with client.session_transaction() as sess:
+            sess["user_id"] = user1["id"]
+            sess["username"] = user1["username"]
+
+        response = client.post(
+            "/references/bulk-tag",
+            data={"bib_keys": ["Tag1", "Tag2"], "tag": str(tag_id)},
+        )
+        assert response.status_code == 302
+
+        with app.app_context():
+            assert get_tag_by_reference(own_id)["name"] == "bulk"
+            assert get_tag_by_reference(other_id) is None
+
+        client.post("/references/bulk-tag", data={"bib_keys": ["Tag1"], "tag": ""})
+        with app.app_context():
+            assert get_tag_by_reference(own_id) is None
+
+    def test_bulk_visibility_requires_choice(
+        self, app, client, db_session, make_reference
+    ):
+        """Test that a missing visibility value changes nothing."""
+        with app.app_context():
+            user = create_user("user1", "pass123")
+            make_reference("Keep1", owner=user["id"])
+
+        with client.session_transaction() as sess:
+            sess["user_id"] = user["id"]
+            sess["username"] = user["username"]
+
+        response = client.post(
+            "/references/bulk-visibility",
+            data={"bib_keys": ["Keep1"]},
+            follow_redirects=True,
+        )
+        assert "Valitse viitteet ja näkyvyys." in response.get_data(as_text=True)
+        with app.app_context():
+            assert get_reference_visibility("Keep1") is True
+
+
 class TestUserBibTexExport:
     """Tests for BibTeX export endpoints."""
 
@@ -355,3 +476,23 @@ class TestUserBibTexExport:
             assert response.status_code == 200
             content_disposition = response.headers.get("Content-Disposition")
             assert "my_references.bib" in content_disposition
+
+    def test_export_user_bibtex_is_streamed(self, app, client, db_session):
+        """Test that the export is sent as a streamed response."""
+        with app.app_context():
+            user = create_user("testuser", "testpass")
+            for i in range(3):
+                data = {"bib_key": f"Stream{i}", "title": "Title", "is_public": True}
+                link_reference_to_user(user["id"], add_reference("article", data))
+
+        with client.session_transaction() as sess:
+            sess["user_id"] = user["id"]
+            sess["username"] = user["username"]
+
+        # Ilman ulompaa app contextia pyynnön sessio poistetaan ennen kuin
+        # vastaus on luettu loppuun
+        response = client.get("/export/user_bibtex")
+
+        assert response.is_streamed
+        body = response.get_data(as_text=True)
+        assert body.index("Stream2") < body.index("Stream1") < body.index("Stream0")
@@ -1,20 +1,36 @@
 """Unit tests for src/util.py utility functions."""
 
 import json
+import os
 from unittest.mock import mock_open, patch
 
 import pytest
 import requests
 
+from src import util
 from src.util import (
+    BIBTEX_FORMAT_VERSION,
+    clear_form_fields_cache,
     format_bibtex_entry,
     format_bibtex_value,
+    get_field_index,
     get_fields_for_type,
+    get_form_schema,
     get_reference_type_by_id,
+    iter_bibtex_chunks,
     load_form_fields,
+    render_bibtex_entry,
 )
 
 
+@pytest.fixture(autouse=True)
+def fresh_form_fields_cache():
+    """Clear the schema cache so mocked loaders are not served stale data."""
+    clear_form_fields_cache()
+    yield
+    clear_form_fields_cache()
+
+
 @pytest.fixture
 def sample_form_fields():
     """Fixture providing sample form fields data."""
@@ -348,6 +364,107 @@ class TestLoadFormFieldsWithMocking:
                 load_form_fields()
 
 
+class TestFormSchemaCache:
+    """Tests for the mtime keyed form-fields.json cache."""
+
+    def test_schema_is_parsed_once_while_file_is_unchanged(self):
+        """Test that repeated lookups reuse the parsed schema."""
+        with patch("src.util.load_form_fields", wraps=load_form_fields) as loader:
+            first = get_form_schema()
+            assert get_form_schema() is first
+            get_fields_for_type("article")
+            assert loader.call_count == 1
+
+    def test_changed_mtime_reloads_schema(self, tmp_path, sample_form_fields):
+        """Test that editing the file is picked up without a restart."""
+        path = tmp_path / "form-fields.json"
+        path.write_text(json.dumps(sample_form_fields), encoding="utf-8")
+        with patch.object(util, "SCHEMA", str(path)):
+            assert len(get_field_index("article")["keys"]) == 5
+
+            sample_form_fields["article"] = sample_form_fields["article"][:2]
+            path.write_text(json.dumps(sample_form_fields), encoding="utf-8")
+            stat = os.stat(path)
+            os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+            assert get_field_index("article")["keys"] == ("author", "title")
+
+    def test_field_index_contents(self, sample_form_fields):
+        """Test the precomputed per-type index."""
+        with patch("src.util.load_form_fields", return_value=sample_form_fields):
+            index = get_field_index("article")
+
+        assert index["fields"] == sample_form_fields["article"]
+        assert index["by_key"]["journal"]["input-type"] == "text"
+        assert index["required"] == frozenset({"author", "title", "journal", "year"})
+        assert index["keys"] == ("author", "title", "journal", "year", "volume")
+
+    def test_unknown_type_has_no_index(self, sample_form_fields):
+        """Test that an unknown type returns None."""
+        with patch("src.util.load_form_fields", return_value=sample_form_fields):
+            assert get_field_index("nonexistent_type") is None
+
+
+class TestRenderBibtexEntry:
+    """Tests for render_bibtex_entry."""
+
+    def test_uses_stored_entry_of_current_version(self):
+        """Test that a stored entry is returned as is."""
+        reference = {
+            "bib_key": "Key",
+            "fields": {"title": "T"},
+            "bibtex": "stored",
+            "bibtex_version": BIBTEX_FORMAT_VERSION,
+        }
+        assert render_bibtex_entry(reference) == "stored"
+
+    def test_formats_missing_or_outdated_entry(self):
+        """Test that old or missing stored entries are formatted again."""
+        reference = {"reference_type": "book", "bib_key": "Key", "fields": {}}
+        expected = format_bibtex_entry(reference)
+
+        assert render_bibtex_entry(reference) == expected
+        outdated = dict(reference, bibtex="old", bibtex_version=0)
+        assert render_bibtex_entry(outdated) == expected
+
+
+class TestIterBibtexChunks:
+    """Tests for iter_bibtex_chunks."""
+
+    def _reference(self, bib_key):
+        return {
+            "reference_type": "article",
+            "bib_key": bib_key,
+            "fields": {"title": "T"},
+        }
+
+    def test_chunks_join_to_the_full_file(self):
+        """Test that the chunks concatenate to every formatted entry."""
+        references = [self._reference(f"Key{i}") for i in range(10)]
+        expected = "".join(format_bibtex_entry(r) + "\n\n" for r in references)
+
+        chunks = list(iter_bibtex_chunks(references, chunk_size=100))
+        assert len(chunks) > 1
+        assert "".join(chunks) == expected
+
+    def test_consumes_references_lazily(self):
+        """Test that entries are formatted as the input is consumed."""
+        consumed = []
+
+        def references():
+            for i in range(3):
+                consumed.append(i)
+                yield self._reference(f"Key{i}")
+
+        chunks = iter_bibtex_chunks(references(), chunk_size=1)
+        assert "Key0" in next(chunks)
+        assert consumed == [0]
+
+    def test_no_references_yield_nothing(self):
+        """Test that an empty input produces no chunks."""
+        assert list(iter_bibtex_chunks([])) == []
+
+
 class TestBibTeXFormatting:
     """Test BibTeX formatting functions"""
 
@@ -522,14 +639,13 @@ class TestBibTeXFormatting:
 class TestDOIParseFunction:
     """Tests for get_doi_data_from_api function."""
 
-    @patch("src.util.requests.get")
+    @patch("src.util.get_doi_metadata")
     def test_fetch_doi_data_success(self, mock_get):
         """Test successful DOI data fetch returns dict."""
         from src.util import get_doi_data_from_api
 
         # Mock the response
-        mock_response = mock_get.return_value
-        mock_response.json.return_value = {
+        mock_get.return_value = {
             "type": "proceedings-article",
             "author": [{"given": "John", "family": "Doe"}],
             "title": "Sample Title",
@@ -542,7 +658,7 @@ class TestDOIParseFunction:
         assert isinstance(result, dict)
         assert "type" in result
 
-    @patch("src.util.requests.get")
+    @patch("src.util.get_doi_metadata")
     def test_fetch_doi_data_failure(self, mock_get):
         """Test DOI data fetch failure raises UtilError."""
         from src.util import UtilError, get_doi_data_from_api
@@ -2,10 +2,13 @@
 
 import json
 import os
+import threading
 from typing import Any, Dict, List, Optional
 
 import requests
 
+from src.utils.doi_cache import get_doi_metadata
+
 SCHEMA = os.path.join(os.path.dirname(os.path.dirname(__file__)), "form-fields.json")
 
 
@@ -27,19 +30,23 @@ class ReferenceTypeError(UtilError):
     pass
 
 
+# Jäsennetty form-fields.json ja tyyppikohtaiset indeksit; avaimena tiedoston mtime
+_form_fields_lock = threading.Lock()
+_form_fields_cache = None
+
+
 def load_form_fields() -> Dict[str, List[Dict[str, Any]]]:
     """Lataa form-fields.json
 
+    Always reads the file; request paths use the cached get_form_schema().
+
     Raises:
         FileNotFoundError: If form-fields.json file is not found.
         json.JSONDecodeError: If form-fields.json contains invalid JSON.
         FormFieldsError: For other errors during loading.
     """
-    json_path = os.path.join(
-        os.path.dirname(os.path.dirname(__file__)), "form-fields.json"
-    )
     try:
-        with open(json_path, "r", encoding="utf-8") as f:
+        with open(SCHEMA, "r", encoding="utf-8") as f:
             return json.load(f)
     except (FileNotFoundError, json.JSONDecodeError):
         # Let these exceptions propagate without conversion
@@ -48,6 +55,86 @@ def load_form_fields() -> Dict[str, List[Dict[str, Any]]]:
         raise FormFieldsError(f"Failed to load form-fields.json: {e}")
 
 
+def _build_field_index(fields: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Precompute lookups for the field definitions of one type."""
+    return {
+        "fields": fields,
+        "by_key": {field["key"]: field for field in fields},
+        "required": frozenset(
+            field["key"] for field in fields if field.get("required", False)
+        ),
+        "keys": tuple(field["key"] for field in fields),
+    }
+
+
+def get_form_schema() -> Dict[str, Any]:
+    """Palauta jäsennetty form-fields.json välimuistista
+
+    The file is parsed again only when its modification time changes, so
+    edits to form-fields.json are picked up without restarting the app.
+
+    Returns:
+        dict: {"mtime": int, "form_fields": {type: [field]},
+               "types": {type: field index}}. See get_field_index().
+
+    Raises:
+        FileNotFoundError: If form-fields.json file is not found.
+        json.JSONDecodeError: If form-fields.json contains invalid JSON.
+        FormFieldsError: For other errors during loading.
+    """
+    global _form_fields_cache
+    mtime = os.stat(SCHEMA).st_mtime_ns
+    cache = _form_fields_cache
+    if cache is not None and cache["mtime"] == mtime:
+        return cache
+
+    with _form_fields_lock:
+        cache = _form_fields_cache
+        if cache is None or cache["mtime"] != mtime:
+            form_fields = load_form_fields()
+            try:
+                types = {
+                    type_name: _build_field_index(fields)
+                    for type_name, fields in form_fields.items()
+                }
+            except (AttributeError, KeyError, TypeError) as e:
+                raise FormFieldsError(f"Invalid form-fields.json: {e}")
+            cache = {"mtime": mtime, "form_fields": form_fields, "types": types}
+            _form_fields_cache = cache
+    return cache
+
+
+def clear_form_fields_cache() -> None:
+    """Drop the cached schema; it is reloaded on next use."""
+    global _form_fields_cache
+    with _form_fields_lock:
+        _form_fields_cache = None
+
+
+def get_field_index(type_name: str) -> Optional[Dict[str, Any]]:
+    """Hae viitetyypin valmiiksi laskettu kenttäindeksi
+
+    The returned structures are shared between callers and must not be
+    modified.
+
+    Args:
+        type_name: Viitetyypin nimi (esim. "article")
+
+    Returns:
+        {"fields": [field], "by_key": {key: field}, "required": frozenset,
+         "keys": tuple} tai None, jos tyyppiä ei ole
+
+    Raises:
+        FormFieldsError: If form fields cannot be loaded.
+    """
+    try:
+        return get_form_schema()["types"].get(type_name)
+    except FormFieldsError:
+        raise
+    except Exception as e:
+        raise FormFieldsError(f"Failed to get fields for type '{type_name}': {e}")
+
+
 def get_reference_type_by_id(reference_id: int, reference_types) -> Optional[str]:
     """Muunna tietokannan ID viitetyypin nimeksi
 
@@ -87,13 +174,13 @@ def get_fields_for_type(type_name: str) -> List[Dict[str, Any]]:
     Raises:
         FormFieldsError: If form fields cannot be loaded.
     """
-    try:
-        form_fields = load_form_fields()
-        return form_fields.get(type_name, [])
-    except FormFieldsError:
-        raise
-    except Exception as e:
-        raise FormFieldsError(f"Failed to get fields for type '{type_name}': {e}")
+    index = get_field_index(type_name)
+    return index["fields"] if index is not None else []
+
+
+# Kasvata, kun format_bibtex_entry():n tuloste muuttuu; tallennetut merkinnät,
+# joilla on eri versio, muotoillaan uudelleen
+BIBTEX_FORMAT_VERSION = 1
 
 
 def format_bibtex_value(key: str, value: str) -> str:
@@ -121,6 +208,50 @@ def format_bibtex_entry(reference_data: dict) -> str:
     return bibtex
 
 
+def render_bibtex_entry(reference_data: dict) -> str:
+    """Palauta viitteen tallennettu BibTeX-merkintä tai muotoile se
+
+    References read from the database carry the entry stored when they were
+    last written ("bibtex", "bibtex_version"). It is used when it was made
+    with the current BIBTEX_FORMAT_VERSION, otherwise the entry is formatted
+    again, so the output is the same either way.
+    """
+    bibtex = reference_data.get("bibtex")
+    if bibtex is not None and (
+        reference_data.get("bibtex_version") == BIBTEX_FORMAT_VERSION
+    ):
+        return bibtex
+    return format_bibtex_entry(reference_data)
+
+
+def iter_bibtex_chunks(references, chunk_size: int = 64 * 1024):
+    """Muodosta BibTeX-tiedosto paloina viite kerrallaan
+
+    Entries are formatted as the references are consumed and joined into
+    chunks of roughly chunk_size characters, so a streamed export does not
+    build the whole file in memory or send one tiny write per entry.
+
+    Args:
+        references: Iterable of reference dictionaries.
+        chunk_size: Approximate number of characters per yielded chunk.
+
+    Yields:
+        str: Consecutive parts of the BibTeX file.
+    """
+    buffer = []
+    size = 0
+    for reference in references:
+        entry = render_bibtex_entry(reference) + "\n\n"
+        buffer.append(entry)
+        size += len(entry)
+        if size >= chunk_size:
+            yield "".join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield "".join(buffer)
+
+
 TYPE_MAP = {
     "journal-article": "article",
     "proceedings-article": "inproceedings",
@@ -172,11 +303,9 @@ def parse_doi(doi_data: Dict[str, Any]) -> Dict[str, Any]:
     entry_type = detect_type(doi_data.get("type", "misc"))
     parsed = {"type": entry_type}
 
-    form_fields = load_form_fields()  # Assuming returns dict of type -> fields
-
-    for field in form_fields.get(entry_type, []):
-        key = field["key"]
+    index = get_field_index(entry_type)
 
+    for key in index["keys"] if index is not None else ():
         if key == "author":
             parsed[key] = parse_authors(doi_data.get("author"))
 
@@ -216,12 +345,13 @@ def parse_doi(doi_data: Dict[str, Any]) -> Dict[str, Any]:
 def get_doi_data_from_api(doi: str) -> Dict[str, Any]:
     """
     Fetch DOI metadata from CrossRef API and parse it.
+
+    The metadata is read through the shared doi_cache table; on a miss the
+    request goes through the pooled client of src.utils.doi_client, which
+    retries transient failures and fails fast while the service is down.
     """
-    url = f"https://citation.doi.org/metadata?doi={doi}"
     try:
-        response = requests.get(url, timeout=15)
-        response.raise_for_status()
-        doi_data = response.json()
+        doi_data = get_doi_metadata(doi)
         parsed = parse_doi(doi_data)
         return parsed
     except requests.exceptions.RequestException as e:
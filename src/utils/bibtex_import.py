@@ -0,0 +1,594 @@
+"""Bulk import of .bib files.
+
+The file is parsed one entry at a time and streamed with COPY into a
+temporary staging table. Set-based statements then merge the staged rows
+into single_reference, reference_values, user_ref and reference_tags in the
+same transaction, so a large bibliography costs a few statements instead of
+dozens per entry.
+
+Command line:
+    python -m src.utils.bibtex_import refs.bib --user <username> [--tag <name>]
+"""
+
+import argparse
+import re
+import sys
+
+from sqlalchemy import text
+
+from src.config import app, db
+from src.utils import request_cache
+from src.utils.references import MAX_BIB_KEY_LENGTH, refresh_reference_documents
+from src.utils.tags import bump_tag_version
+
+# BibTeXin vakiomakrot kuukausille
+DEFAULT_MACROS = {
+    "jan": "January",
+    "feb": "February",
+    "mar": "March",
+    "apr": "April",
+    "may": "May",
+    "jun": "June",
+    "jul": "July",
+    "aug": "August",
+    "sep": "September",
+    "oct": "October",
+    "nov": "November",
+    "dec": "December",
+}
+
+_ENTRY_START = re.compile(r"@\s*([A-Za-z]+)\s*([{(])")
+_BRACES = re.compile(r"\\.|[{}]")
+_QUOTED = re.compile(r'\\.|[{}"]')
+_FIELD_NAME = re.compile(r"\s*([A-Za-z][\w\-:.+]*)\s*=\s*")
+_NUMBER = re.compile(r"\d+")
+_IDENTIFIER = re.compile(r"[A-Za-z][\w\-:.+]*")
+_UNESCAPE = re.compile(r"\\([\\{}])")
+
+
+class BibtexImportError(Exception):
+    """Raised when a .bib file cannot be imported."""
+
+    pass
+
+
+class _ParseError(Exception):
+    """Raised for a malformed entry; the entry is skipped."""
+
+    pass
+
+
+def _clean_value(value: str) -> str:
+    """Unescape \\{, \\} and \\\\ (as written by the exporter) and collapse spaces."""
+    return " ".join(_UNESCAPE.sub(r"\1", value).split())
+
+
+def _closing_brace(body: str, start: int) -> int:
+    """Return the index after the brace closing the one at body[start]."""
+    depth = 0
+    for match in _BRACES.finditer(body, start):
+        if match.group() == "{":
+            depth += 1
+        elif match.group() == "}":
+            depth -= 1
+            if depth == 0:
+                return match.end()
+    raise _ParseError("unbalanced braces in value")
+
+
+def _closing_quote(body: str, start: int) -> int:
+    """Return the index after the quote closing the one at body[start]."""
+    depth = 0
+    for match in _QUOTED.finditer(body, start + 1):
+        char = match.group()
+        if char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+        elif char == '"' and depth == 0:
+            return match.end()
+    raise _ParseError("unterminated quoted value")
+
+
+def _parse_value(body: str, pos: int, macros: dict) -> tuple:
+    """Parse a value (parts joined with #) starting at pos.
+
+    Returns:
+        tuple: (value, position after the value)
+    """
+    parts = []
+    while True:
+        while pos < len(body) and body[pos].isspace():
+            pos += 1
+        if pos >= len(body):
+            raise _ParseError("missing value")
+        char = body[pos]
+        if char == "{":
+            end = _closing_brace(body, pos)
+            parts.append(body[pos + 1 : end - 1])
+        elif char == '"':
+            end = _closing_quote(body, pos)
+            parts.append(body[pos + 1 : end - 1])
+        elif match := _NUMBER.match(body, pos):
+            end = match.end()
+            parts.append(match.group())
+        elif match := _IDENTIFIER.match(body, pos):
+            end = match.end()
+            name = match.group()
+            parts.append(macros.get(name.lower(), name))
+        else:
+            raise _ParseError(f"unexpected character {char!r} in value")
+        pos = end
+        while pos < len(body) and body[pos].isspace():
+            pos += 1
+        if pos < len(body) and body[pos] == "#":
+            pos += 1
+            continue
+        return "".join(parts), pos
+
+
+def _parse_fields(body: str, pos: int, macros: dict) -> dict:
+    """Parse "name = value" pairs separated by commas."""
+    fields = {}
+    while True:
+        while pos < len(body) and (body[pos].isspace() or body[pos] == ","):
+            pos += 1
+        if pos >= len(body):
+            return fields
+        match = _FIELD_NAME.match(body, pos)
+        if not match:
+            raise _ParseError(f"expected a field name at {body[pos:pos + 20]!r}")
+        value, pos = _parse_value(body, match.end(), macros)
+        # Ensimmäinen esiintymä jää voimaan
+        fields.setdefault(match.group(1).lower(), _clean_value(value))
+        while pos < len(body) and body[pos].isspace():
+            pos += 1
+        if pos < len(body) and body[pos] != ",":
+            raise _ParseError(f"expected ',' at {body[pos:pos + 20]!r}")
+
+
+def _parse_entry(entry_type: str, body: str, line: int, macros: dict):
+    """Parse the text between an entry's braces.
+
+    Returns:
+        dict | None: The entry, or None for @string/@preamble/@comment.
+    """
+    if entry_type in ("comment", "preamble"):
+        return None
+    if entry_type == "string":
+        macros.update(
+            {name: value for name, value in _parse_fields(body, 0, macros).items()}
+        )
+        return None
+
+    key, separator, rest = body.partition(",")
+    bib_key = key.strip()
+    if not bib_key:
+        raise _ParseError("missing citation key")
+    if len(bib_key) > MAX_BIB_KEY_LENGTH:
+        raise _ParseError(f"citation key longer than {MAX_BIB_KEY_LENGTH} characters")
+    if any(char.isspace() for char in bib_key):
+        raise _ParseError(f"invalid citation key {bib_key!r}")
+    fields = _parse_fields(rest, 0, macros) if separator else {}
+    return {
+        "line": line,
+        "entry_type": entry_type,
+        "bib_key": bib_key,
+        "fields": fields,
+    }
+
+
+def parse_bibtex(lines, errors: list | None = None):
+    """Parse BibTeX entries from an iterable of lines, one entry at a time.
+
+    Only the lines of the entry being parsed are kept in memory, so files of
+    any size can be read from a stream. Text outside entries is ignored, as
+    in BibTeX. @string macros are expanded; @comment and @preamble entries
+    are skipped. Entry types and field names are lowercased and whitespace
+    in values is collapsed.
+
+    Args:
+        lines: Iterable of text lines, e.g. an open text file.
+        errors: Optional list that receives {"line", "message"} dicts for
+                malformed entries, which are skipped.
+
+    Yields:
+        dict: {"line": int, "entry_type": str, "bib_key": str,
+               "fields": {name: value}}
+    """
+    macros = dict(DEFAULT_MACROS)
+    entry_lines = []
+    entry_type = None
+    start_line = 0
+    depth = 0
+    # Lainausmerkkiarvon sisällä aaltosulkeet eivät päätä merkintää
+    in_quote = False
+
+    def fail(line, message):
+        if errors is not None:
+            errors.append({"line": line, "message": message})
+
+    for line_no, line in enumerate(lines, start=1):
+        pos = 0
+        while pos < len(line):
+            if entry_type is None:
+                at = line.find("@", pos)
+                if at < 0:
+                    break
+                match = _ENTRY_START.match(line, at)
+                if not match:
+                    pos = at + 1
+                    continue
+                if match.group(2) == "(":
+                    fail(
+                        line_no, "entries delimited with parentheses are not supported"
+                    )
+                    pos = match.end()
+                    continue
+                entry_type = match.group(1).lower()
+                start_line = line_no
+                depth = 1
+                in_quote = False
+                pos = match.end()
+                entry_lines = []
+
+            end = None
+            for token in _QUOTED.finditer(line, pos):
+                char = token.group()
+                if in_quote:
+                    in_quote = char != '"'
+                elif char == '"':
+                    # Lainausmerkki aloittaa arvon vain kenttätasolla
+                    in_quote = depth == 1
+                elif char == "{":
+                    depth += 1
+                elif char == "}":
+                    depth -= 1
+                    if depth == 0:
+                        end = token.end()
+                        break
+            if end is None:
+                entry_lines.append(line[pos:])
+                break
+
+            entry_lines.append(line[pos : end - 1])
+            try:
+                entry = _parse_entry(
+                    entry_type, "".join(entry_lines), start_line, macros
+                )
+                if entry is not None:
+                    yield entry
+            except _ParseError as e:
+                fail(start_line, str(e))
+            entry_type = None
+            entry_lines = []
+            pos = end
+
+    if entry_type is not None:
+        fail(start_line, "entry is not closed before end of file")
+
+
+def _copy_text(value) -> str:
+    """Format a value for COPY ... FROM STDIN in text format."""
+    if value is None:
+        return "\\N"
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def _staging_rows(entries):
+    """Yield COPY lines for import_rows: an entry row, then its field rows."""
+    for entry_no, entry in enumerate(entries):
+        fields = entry["fields"]
+        yield "\t".join(
+            _copy_text(value)
+            for value in (
+                entry_no,
+                entry["line"],
+                entry["bib_key"],
+                entry["entry_type"],
+                None,
+                None,
+            )
+        ) + "\n"
+        for name, value in fields.items():
+            yield "\t".join(
+                _copy_text(value)
+                for value in (entry_no, entry["line"], None, None, name, value)
+            ) + "\n"
+
+
+class _LineStream:
+    """File-like reader over an iterator of strings, as COPY expects."""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = ""
+
+    def read(self, size: int = -1) -> str:
+        parts = [self._buffer]
+        length = len(self._buffer)
+        while size < 0 or length < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            parts.append(chunk)
+            length += len(chunk)
+        data = "".join(parts)
+        if size < 0:
+            self._buffer = ""
+            return data
+        self._buffer = data[size:]
+        return data[:size]
+
+    def readline(self, size: int = -1) -> str:
+        return self.read(size)
+
+
+def import_bibtex(
+    lines,
+    user_id: int,
+    tag_name: str | None = None,
+    is_public: bool = True,
+) -> dict:
+    """Import every entry of a .bib file for a user.
+
+    Entries whose bib_key already exists, or repeats an earlier entry of the
+    file that is imported, are not imported. Entries of unknown types are skipped too, as are
+    fields that do not belong to the entry's type. Everything is imported
+    in one transaction.
+
+    Args:
+        lines: Iterable of text lines of the .bib file.
+        user_id: Owner of the imported references.
+        tag_name: Optional tag added to every imported reference; created if
+                  it does not exist.
+        is_public: Visibility of the imported references.
+
+    Returns:
+        dict: {"imported": int, "existing": [bib_key], "duplicates": [bib_key],
+               "unknown_types": [{"bib_key", "entry_type"}],
+               "unknown_fields": {field: count},
+               "errors": [{"line", "message"}]}
+
+    Raises:
+        BibtexImportError: If the import fails; nothing is imported then.
+    """
+    errors = []
+    try:
+        db.session.execute(
+            text(
+                """
+                CREATE TEMP TABLE import_rows (
+                    entry_no INT NOT NULL,
+                    line INT NOT NULL,
+                    bib_key TEXT,
+                    entry_type TEXT,
+                    field TEXT,
+                    value TEXT
+                ) ON COMMIT DROP
+                """
+            )
+        )
+        cursor = db.session.connection().connection.cursor()
+        try:
+            cursor.copy_expert(
+                "COPY import_rows FROM STDIN",
+                _LineStream(_staging_rows(parse_bibtex(lines, errors))),
+            )
+        finally:
+            cursor.close()
+
+        # Tilapäistauluja ei analysoida automaattisesti
+        db.session.execute(text("ANALYZE import_rows"))
+        db.session.execute(
+            text(
+                """
+                CREATE TEMP TABLE import_entries ON COMMIT DROP AS
+                SELECT
+                    r.entry_no,
+                    r.bib_key,
+                    r.entry_type,
+                    rt.id AS type_id,
+                    NULL::int AS reference_id,
+                    CASE
+                        WHEN rt.id IS NULL THEN 'unknown_type'
+                        -- Hylätty tuntematon tyyppi ei varaa avainta
+                        WHEN r.entry_no <> min(r.entry_no)
+                            FILTER (WHERE rt.id IS NOT NULL)
+                            OVER (PARTITION BY r.bib_key) THEN 'duplicate'
+                        WHEN EXISTS (
+                            SELECT 1 FROM single_reference sr
+                            WHERE sr.bib_key = r.bib_key
+                        ) THEN 'existing'
+                        ELSE 'new'
+                    END AS status
+                FROM import_rows r
+                LEFT JOIN reference_types rt ON rt.name = r.entry_type
+                WHERE r.field IS NULL
+                """
+            )
+        )
+        db.session.execute(
+            text("CREATE INDEX ON import_entries (entry_no) WHERE status = 'new'")
+        )
+        db.session.execute(text("ANALYZE import_entries"))
+
+        db.session.execute(
+            text(
+                """
+                WITH inserted AS (
+                    INSERT INTO single_reference (bib_key, reference_type_id, is_public)
+                    SELECT bib_key, type_id, :is_public
+                    FROM import_entries
+                    WHERE status = 'new'
+                    ORDER BY entry_no
+                    RETURNING id, bib_key
+                )
+                UPDATE import_entries e
+                SET reference_id = inserted.id
+                FROM inserted
+                WHERE e.bib_key = inserted.bib_key AND e.status = 'new'
+                """
+            ),
+            {"is_public": is_public},
+        )
+
+        # Vain viitetyyppiin kuuluvat kentät tallennetaan
+        db.session.execute(
+            text(
+                """
+                INSERT INTO reference_values (reference_id, field_id, value)
+                SELECT DISTINCT ON (e.reference_id, f.id)
+                    e.reference_id, f.id, r.value
+                FROM import_rows r
+                JOIN import_entries e
+                    ON e.entry_no = r.entry_no AND e.status = 'new'
+                JOIN reference_type_fields rtf ON rtf.reference_type_id = e.type_id
+                JOIN fields f ON f.id = rtf.field_id AND f.key_name = r.field
+                WHERE r.field IS NOT NULL AND r.value <> ''
+                ORDER BY e.reference_id, f.id
+                """
+            )
+        )
+        unknown_fields = db.session.execute(
+            text(
+                """
+                SELECT r.field, count(*) AS count
+                FROM import_rows r
+                JOIN import_entries e
+                    ON e.entry_no = r.entry_no AND e.status = 'new'
+                WHERE r.field IS NOT NULL
+                  AND NOT EXISTS (
+                      SELECT 1
+                      FROM reference_type_fields rtf
+                      JOIN fields f ON f.id = rtf.field_id
+                      WHERE rtf.reference_type_id = e.type_id
+                        AND f.key_name = r.field
+                  )
+                GROUP BY r.field
+                ORDER BY count DESC, r.field
+                """
+            )
+        ).all()
+
+        db.session.execute(
+            text(
+                """
+                INSERT INTO user_ref (user_id, reference_id)
+                SELECT :user_id, reference_id
+                FROM import_entries
+                WHERE status = 'new'
+                ON CONFLICT DO NOTHING
+                """
+            ),
+            {"user_id": user_id},
+        )
+
+        tag_name = (tag_name or "").strip()
+        if tag_name:
+            created = db.session.execute(
+                text("INSERT INTO tags (name) VALUES (:tag) ON CONFLICT DO NOTHING"),
+                {"tag": tag_name},
+            ).rowcount
+            if created:
+                bump_tag_version()
+            db.session.execute(
+                text(
+                    """
+                    INSERT INTO reference_tags (reference_id, tag_id)
+                    SELECT e.reference_id, t.id
+                    FROM import_entries e
+                    JOIN tags t ON t.name = :tag
+                    WHERE e.status = 'new'
+                    """
+                ),
+                {"tag": tag_name},
+            )
+
+        reference_ids = (
+            db.session.execute(
+                text(
+                    "SELECT reference_id FROM import_entries "
+                    "WHERE status = 'new' ORDER BY entry_no"
+                )
+            )
+            .scalars()
+            .all()
+        )
+        refresh_reference_documents(reference_ids)
+
+        skipped = db.session.execute(
+            text(
+                """
+                SELECT bib_key, entry_type, status
+                FROM import_entries
+                WHERE status <> 'new'
+                ORDER BY entry_no
+                """
+            )
+        ).all()
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        raise BibtexImportError(f"Failed to import BibTeX: {e}") from e
+
+    request_cache.invalidate()
+
+    return {
+        "imported": len(reference_ids),
+        "existing": [row.bib_key for row in skipped if row.status == "existing"],
+        "duplicates": [row.bib_key for row in skipped if row.status == "duplicate"],
+        "unknown_types": [
+            {"bib_key": row.bib_key, "entry_type": row.entry_type}
+            for row in skipped
+            if row.status == "unknown_type"
+        ],
+        "unknown_fields": {row.field: row.count for row in unknown_fields},
+        "errors": errors,
+    }
+
+
+def main(argv=None) -> int:
+    """Import a .bib file from the command line."""
+    from src.utils.users import get_user_by_username
+
+    parser = argparse.ArgumentParser(description="Import a .bib file.")
+    parser.add_argument("path", help=".bib file to import")
+    parser.add_argument("--user", required=True, help="owner of the references")
+    parser.add_argument("--tag", help="tag added to every imported reference")
+    parser.add_argument(
+        "--private", action="store_true", help="import as private references"
+    )
+    args = parser.parse_args(argv)
+
+    with app.app_context():
+        user = get_user_by_username(args.user)
+        if user is None:
+            print(f"Unknown user: {args.user}", file=sys.stderr)
+            return 1
+        with open(args.path, "r", encoding="utf-8") as bib_file:
+            report = import_bibtex(
+                bib_file, user["id"], tag_name=args.tag, is_public=not args.private
+            )
+
+    print(f"Imported {report['imported']} references")
+    for name, label in (("existing", "Already exists"), ("duplicates", "Duplicate")):
+        for bib_key in report[name]:
+            print(f"{label}: {bib_key}")
+    for item in report["unknown_types"]:
+        print(f"Unknown type @{item['entry_type']}: {item['bib_key']}")
+    for field, count in report["unknown_fields"].items():
+        print(f"Unknown field {field}: {count} entries")
+    for error in report["errors"]:
+        print(f"Line {error['line']}: {error['message']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
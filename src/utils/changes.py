@@ -0,0 +1,231 @@
+"""Change feed of a user's references for incremental sync.
+
+Every write to a reference sets its updated_at and change_xid (the id of
+the writing transaction), and removing a reference from a user's list
+writes a tombstone row to deleted_references. The feed returns both kinds
+of changes in (change_xid, kind, id) order after a cursor.
+
+Only changes of transactions older than the current snapshot's xmin are
+returned. Every transaction below it has finished, so a change that
+commits later can never sort before a cursor that was already handed out.
+"""
+
+from sqlalchemy import text
+
+from src.config import db
+from src.utils.references import BACKFILL_BATCH_SIZE, DatabaseError, unpack_document
+
+DEFAULT_CHANGE_LIMIT = 500
+MAX_CHANGE_LIMIT = 5000
+
+# Saman transaktion muutoksista poistot ennen päivityksiä
+KIND_DELETE = 0
+KIND_UPSERT = 1
+
+# Kursorin arvojen rajat: xid8 on etumerkitön, id:t bigint-alueella
+MAX_CHANGE_XID = 2**64 - 1
+MAX_CHANGE_ID = 2**63 - 1
+
+
+def encode_change_cursor(change: dict) -> str:
+    """Build a feed cursor from the last change of a batch.
+
+    Returns:
+        str: Cursor string in the form "<change_xid>_<kind>_<id>".
+    """
+    return f"{change['change_xid']}_{change['kind']}_{change['id']}"
+
+
+def decode_change_cursor(cursor: str | None) -> tuple | None:
+    """Parse a cursor created by encode_change_cursor().
+
+    Returns:
+        tuple | None: (change_xid, kind, id), or None if the cursor is
+                      missing.
+
+    Raises:
+        ValueError: If the cursor is malformed or out of range.
+    """
+    if not cursor:
+        return None
+    parts = cursor.split("_")
+    if len(parts) != 3:
+        raise ValueError(f"Invalid change cursor: {cursor}")
+    try:
+        xid, kind, change_id = (int(part) for part in parts)
+    except ValueError:
+        raise ValueError(f"Invalid change cursor: {cursor}") from None
+    if (
+        not 0 <= xid <= MAX_CHANGE_XID
+        or kind not in (KIND_DELETE, KIND_UPSERT)
+        or not 0 <= change_id <= MAX_CHANGE_ID
+    ):
+        raise ValueError(f"Invalid change cursor: {cursor}")
+    return (xid, kind, change_id)
+
+
+def _after_id(kind: int, position: tuple) -> int:
+    """Return the id after which rows of kind in the cursor's xid are new."""
+    _, cursor_kind, cursor_id = position
+    if kind > cursor_kind:
+        return 0
+    if kind == cursor_kind:
+        return cursor_id
+    # Tämän lajin rivit samasta transaktiosta on jo palautettu
+    return MAX_CHANGE_ID
+
+
+def backfill_change_columns(batch_size: int = BACKFILL_BATCH_SIZE) -> int:
+    """Fill updated_at and change_xid of references stored before they existed.
+
+    Migration 005 adds the columns without rewriting the table, so older rows
+    are NULL until this runs. Each batch is committed on its own, and the
+    references become part of the feed with the xid of that batch.
+
+    Returns:
+        int: Number of references filled in.
+
+    Raises:
+        DatabaseError: If the update fails.
+    """
+    sql = text(
+        """
+        UPDATE single_reference
+        SET updated_at = COALESCE(updated_at, created_at),
+            change_xid = COALESCE(change_xid, pg_current_xact_id())
+        WHERE id IN (
+            SELECT id FROM single_reference
+            WHERE updated_at IS NULL OR change_xid IS NULL
+            ORDER BY id
+            LIMIT :limit
+        )
+        """
+    )
+    filled = 0
+    try:
+        while True:
+            count = db.session.execute(sql, {"limit": batch_size}).rowcount
+            db.session.commit()
+            if not count:
+                return filled
+            filled += count
+    except Exception as e:
+        db.session.rollback()
+        raise DatabaseError(f"Failed to fill change columns: {e}") from e
+
+
+def get_reference_changes(
+    user_id: int, cursor: str | None = None, limit: int = DEFAULT_CHANGE_LIMIT
+) -> dict:
+    """Fetch the changes of a user's references after a cursor.
+
+    Without a cursor the feed starts from the beginning, which is the
+    initial sync: every current reference of the user as an upsert, and a
+    delete for every reference removed from the user's list before. A
+    delete of a bib_key the client does not have can be ignored. Apply the
+    changes in order.
+
+    Args:
+        user_id: Owner of the references.
+        cursor: next_cursor of the previous call, or None.
+        limit: Maximum number of changes to return.
+
+    Returns:
+        dict: {"changes": list, "next_cursor": str | None, "has_more": bool}.
+              Each change has "action" ("upsert" or "delete"), "bib_key"
+              and "changed_at"; upserts also have "reference_type", "fields",
+              "tag" and the stored "bibtex"/"bibtex_version". next_cursor is
+              the cursor to pass next time; it is the given cursor when there
+              were no changes.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+        DatabaseError: If database query fails.
+    """
+    position = decode_change_cursor(cursor) or (0, KIND_DELETE - 1, 0)
+    params = {
+        "user_id": user_id,
+        "xid": str(position[0]),
+        "upsert_after": _after_id(KIND_UPSERT, position),
+        "delete_after": _after_id(KIND_DELETE, position),
+        "limit": limit + 1,
+    }
+    sql = text(
+        f"""
+        WITH horizon AS (
+            SELECT pg_snapshot_xmin(pg_current_snapshot()) AS xmin
+        )
+        SELECT *
+        FROM (
+            SELECT
+                sr.change_xid::text AS change_xid,
+                {KIND_UPSERT} AS kind,
+                sr.id,
+                sr.bib_key,
+                sr.updated_at AS changed_at,
+                rt.name AS reference_type,
+                sr.document,
+                sr.bibtex,
+                sr.bibtex_version
+            FROM single_reference sr
+            JOIN reference_types rt ON rt.id = sr.reference_type_id
+            CROSS JOIN horizon
+            WHERE (sr.change_xid, sr.id) > (CAST(:xid AS xid8), :upsert_after)
+              AND sr.change_xid < horizon.xmin
+              AND EXISTS (
+                  SELECT 1
+                  FROM user_ref ur
+                  WHERE ur.reference_id = sr.id AND ur.user_id = :user_id
+              )
+            UNION ALL
+            SELECT
+                dr.change_xid::text,
+                {KIND_DELETE},
+                dr.id,
+                dr.bib_key,
+                dr.deleted_at,
+                NULL,
+                NULL,
+                NULL,
+                NULL
+            FROM deleted_references dr
+            CROSS JOIN horizon
+            WHERE dr.user_id = :user_id
+              AND (dr.change_xid, dr.id) > (CAST(:xid AS xid8), :delete_after)
+              AND dr.change_xid < horizon.xmin
+        ) changes
+        ORDER BY change_xid::xid8, kind, id
+        LIMIT :limit
+        """
+    )
+    try:
+        rows = db.session.execute(sql, params).mappings().all()
+    except Exception as e:
+        db.session.rollback()
+        raise DatabaseError(f"Failed to fetch reference changes: {e}") from e
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    changes = []
+    for row in rows:
+        change = {
+            "action": "upsert" if row["kind"] == KIND_UPSERT else "delete",
+            "bib_key": row["bib_key"],
+            "changed_at": row["changed_at"],
+        }
+        if row["kind"] == KIND_UPSERT:
+            fields, tag = unpack_document(row["document"])
+            change.update(
+                {
+                    "reference_type": row["reference_type"],
+                    "fields": fields,
+                    "tag": tag,
+                    "bibtex": row["bibtex"],
+                    "bibtex_version": row["bibtex_version"],
+                }
+            )
+        changes.append(change)
+
+    next_cursor = encode_change_cursor(rows[-1]) if rows else cursor
+    return {"changes": changes, "next_cursor": next_cursor, "has_more": has_more}
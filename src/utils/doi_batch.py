@@ -0,0 +1,265 @@
+"""Batch resolution of DOIs, e.g. for importing a reading list.
+
+The DOIs are looked up concurrently in a bounded thread pool shared by the
+whole process, so a batch takes about as long as its slowest lookups rather
+than the sum of them. Web requests do not call resolve_dois() themselves;
+they submit a background job (src/utils/doi_jobs.py).
+Each lookup goes through the shared DOI cache and the pooled client, whose
+rate limiter keeps the pool within the service's limits. A failing DOI only
+fails its own result.
+
+Command line:
+    python -m src.utils.doi_batch dois.txt [--user <username> [--private]]
+
+With --user the resolved DOIs are added as references of that user.
+"""
+
+import argparse
+import re
+import sys
+import threading
+import unicodedata
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from os import getenv
+
+from sqlalchemy import text
+
+from src.config import app, db
+from src.util import get_doi_data_from_api
+from src.utils.doi_cache import normalize_doi
+from src.utils.references import MAX_BIB_KEY_LENGTH, add_reference
+from src.utils.users import link_reference_to_user
+
+DEFAULT_BATCH_WORKERS = 8
+# Kutsutaan progress-funktiota vähintään näin usein, vaikka haku ei valmistu
+PROGRESS_POLL_INTERVAL = 1.0
+MAX_BATCH_DOIS = 500
+
+DOI_PATTERN = re.compile(r"^10\.\d{4,}/\S+$")
+
+_executor_lock = threading.Lock()
+_executor = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    """Return the process-wide lookup pool, creating it on first use."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=int(getenv("DOI_BATCH_WORKERS") or DEFAULT_BATCH_WORKERS),
+                thread_name_prefix="doi-batch",
+            )
+        return _executor
+
+
+def split_dois(value: str) -> list:
+    """Split whitespace- or comma-separated DOIs into a list."""
+    return [doi for doi in re.split(r"[\s,]+", value or "") if doi]
+
+
+def _resolve_one(doi: str) -> dict:
+    """Look up and parse one DOI; errors are returned, not raised."""
+    with app.app_context():
+        try:
+            return {"doi": doi, "data": get_doi_data_from_api(doi), "error": None}
+        except KeyError as e:
+            return {"doi": doi, "data": None, "error": f"Missing expected data: {e}"}
+        except Exception as e:
+            return {"doi": doi, "data": None, "error": str(e)}
+
+
+def normalize_dois(dois: list) -> list:
+    """Normalize DOIs and drop duplicates and empty values, keeping the order.
+
+    Raises:
+        ValueError: If there are more than MAX_BATCH_DOIS distinct DOIs.
+    """
+    keys = list(dict.fromkeys(normalize_doi(doi) for doi in dois if doi.strip()))
+    if len(keys) > MAX_BATCH_DOIS:
+        raise ValueError(f"At most {MAX_BATCH_DOIS} DOIs can be resolved at once")
+    return keys
+
+
+def resolve_dois(dois: list, executor=None, progress=None) -> list:
+    """Resolve many DOIs concurrently.
+
+    DOIs are normalized and duplicates are resolved once. Malformed DOIs
+    are reported without a lookup.
+
+    Args:
+        dois: DOIs, with or without a doi.org prefix.
+        executor: Pool to run the lookups in (default the shared pool of
+            DOI_BATCH_WORKERS or 8 threads).
+        progress: Called in the calling thread with the number of DOIs
+            resolved so far, after each lookup and at least every
+            PROGRESS_POLL_INTERVAL seconds while lookups are pending.
+
+    Returns:
+        list: One {"doi", "data", "error"} dict per distinct DOI, in input
+              order. data is the parse_doi() result, or None when error is
+              set.
+
+    Raises:
+        ValueError: If there are more than MAX_BATCH_DOIS DOIs.
+    """
+    keys = normalize_dois(dois)
+
+    results = {}
+    valid = []
+    for doi in keys:
+        if DOI_PATTERN.match(doi):
+            valid.append(doi)
+        else:
+            results[doi] = {"doi": doi, "data": None, "error": "Invalid DOI format"}
+
+    pool = executor or _get_executor()
+    futures = [pool.submit(_resolve_one, doi) for doi in valid]
+    pending = set(futures)
+    while pending:
+        done, pending = wait(
+            pending, timeout=PROGRESS_POLL_INTERVAL, return_when=FIRST_COMPLETED
+        )
+        for future in done:
+            result = future.result()
+            results[result["doi"]] = result
+        if progress is not None:
+            progress(len(results))
+
+    return [results[doi] for doi in keys]
+
+
+def _ascii(value: str) -> str:
+    folded = unicodedata.normalize("NFKD", value).encode("ascii", "ignore").decode()
+    return re.sub(r"[^A-Za-z0-9]", "", folded)
+
+
+def make_bib_key_base(data: dict) -> str:
+    """Build a bib_key stem such as "Doe2020" from parsed DOI data."""
+    author = str(data.get("author") or "").split(",")[0].split()
+    family = _ascii(author[-1]) if author else ""
+    if not family:
+        title = str(data.get("title") or "").split()
+        family = _ascii(title[0]) if title else ""
+    return f"{family.capitalize() or 'Ref'}{data.get('year') or ''}"[:90]
+
+
+def _assign_bib_keys(results: list) -> None:
+    """Give every resolved DOI a bib_key not used in the database or batch."""
+    bases = {
+        result["doi"]: make_bib_key_base(result["data"])
+        for result in results
+        if result["data"]
+    }
+    if not bases:
+        return
+    taken = set(
+        db.session.execute(
+            text(
+                "SELECT bib_key FROM single_reference WHERE bib_key LIKE ANY(:patterns)"
+            ),
+            {"patterns": [f"{base}%" for base in set(bases.values())]},
+        )
+        .scalars()
+        .all()
+    )
+    for result in results:
+        base = bases.get(result["doi"])
+        if base is None:
+            continue
+        bib_key, suffix = base, 0
+        while bib_key in taken:
+            # Doe2020, Doe2020a, ..., Doe2020z, Doe2020aa
+            suffix += 1
+            letters, n = "", suffix
+            while n:
+                n, rest = divmod(n - 1, 26)
+                letters = chr(ord("a") + rest) + letters
+            bib_key = f"{base}{letters}"[:MAX_BIB_KEY_LENGTH]
+        taken.add(bib_key)
+        result["bib_key"] = bib_key
+
+
+def add_resolved_references(
+    results: list, user_id: int, is_public: bool = True, progress=None
+) -> list:
+    """Add the resolved DOIs of resolve_dois() as references of a user.
+
+    Each result gets a generated "bib_key". A result whose insert fails
+    gets an "error" instead; the other references are still added.
+
+    Args:
+        results: Output of resolve_dois().
+        user_id: Owner of the new references.
+        is_public: Visibility of the new references.
+        progress: Called with the number of results handled so far, before
+            each one.
+
+    Returns:
+        list: The same results, with "bib_key" set for added references.
+    """
+    _assign_bib_keys(results)
+    for handled, result in enumerate(results):
+        if progress is not None:
+            progress(handled)
+        if result["error"] is not None:
+            continue
+        data = dict(result["data"])
+        reference_type = data.pop("type")
+        data.update({"bib_key": result["bib_key"], "is_public": is_public})
+        try:
+            ref_id = add_reference(reference_type, data)
+            link_reference_to_user(user_id, ref_id)
+        except Exception as e:
+            result["error"] = str(e)
+            result.pop("bib_key", None)
+    return results
+
+
+def main(argv=None) -> int:
+    """Resolve DOIs from a file or stdin and optionally add them."""
+    from src.utils.users import get_user_by_username
+
+    parser = argparse.ArgumentParser(description="Resolve a list of DOIs.")
+    parser.add_argument("path", nargs="?", help="file of DOIs (default stdin)")
+    parser.add_argument("--user", help="add the references for this user")
+    parser.add_argument(
+        "--private", action="store_true", help="add as private references"
+    )
+    parser.add_argument("--workers", type=int, help="concurrent lookups")
+    args = parser.parse_args(argv)
+
+    if args.path:
+        with open(args.path, "r", encoding="utf-8") as doi_file:
+            dois = split_dois(doi_file.read())
+    else:
+        dois = split_dois(sys.stdin.read())
+
+    with app.app_context():
+        user = None
+        if args.user:
+            user = get_user_by_username(args.user)
+            if user is None:
+                print(f"Unknown user: {args.user}", file=sys.stderr)
+                return 1
+        if args.workers:
+            with ThreadPoolExecutor(max_workers=args.workers) as pool:
+                results = resolve_dois(dois, executor=pool)
+        else:
+            results = resolve_dois(dois)
+        if user is not None:
+            add_resolved_references(results, user["id"], is_public=not args.private)
+
+    failed = 0
+    for result in results:
+        if result["error"]:
+            failed += 1
+            print(f"{result['doi']}\tERROR\t{result['error']}")
+        else:
+            label = result.get("bib_key") or result["data"].get("title", "")
+            print(f"{result['doi']}\tOK\t{label}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,176 @@
+"""Read-through cache of DOI metadata in the doi_cache table.
+
+The raw JSON of the DOI service is stored under the normalized DOI, so every
+worker process shares it and repeated lookups are a primary key read.
+Answers that the DOI does not exist (404, 400, 410) are cached too, for a
+shorter time, so a mistyped DOI submitted again does not reach the service.
+Server errors and an open circuit are never cached. Expired rows are
+deleted by purge_expired_doi_cache(), which runs whenever a DOI job is
+submitted.
+
+Settings are read from the environment:
+    DOI_CACHE_TTL       seconds metadata stays fresh (default 30 days)
+    DOI_NEGATIVE_TTL    seconds a "not found" answer is kept (default 1 hour)
+"""
+
+import json
+import re
+from os import getenv
+
+import requests
+from flask import has_app_context
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from src.config import db
+from src.utils.doi_client import fetch_doi_metadata
+
+DEFAULT_CACHE_TTL = 30 * 24 * 3600
+DEFAULT_NEGATIVE_TTL = 3600
+# Yhdellä kutsulla poistettavien vanhentuneiden rivien enimmäismäärä
+PURGE_BATCH_SIZE = 1000
+
+# Vastaukset, jotka tarkoittavat ettei DOI:ta ole
+NEGATIVE_STATUSES = (400, 404, 410)
+
+_DOI_PREFIX = re.compile(r"^(?:https?://(?:dx\.)?doi\.org/|doi:\s*)", re.IGNORECASE)
+
+
+class DoiNotFoundError(requests.exceptions.RequestException):
+    """Raised when the DOI service does not know the DOI."""
+
+    pass
+
+
+def normalize_doi(doi: str) -> str:
+    """Normalize a DOI for use as a cache key.
+
+    DOIs are case-insensitive, so the key is lowercased. Surrounding
+    whitespace and a "doi:" or https://doi.org/ prefix are removed.
+    """
+    return _DOI_PREFIX.sub("", doi.strip()).strip().lower()
+
+
+def _ttl(name: str, default: int) -> int:
+    value = getenv(name)
+    return int(value) if value else default
+
+
+def _read(doi: str):
+    """Return the fresh (status, metadata) row of a DOI, or None."""
+    with db.engine.connect() as conn:
+        return conn.execute(
+            text(
+                """
+                SELECT status, metadata
+                FROM doi_cache
+                WHERE doi = :doi AND expires_at > CURRENT_TIMESTAMP
+                """
+            ),
+            {"doi": doi},
+        ).first()
+
+
+def _write(doi: str, status: int, metadata, ttl: int) -> None:
+    """Store an answer of the DOI service for ttl seconds."""
+    # Oma yhteys: välimuistin kirjoitus ei saa commitoida kutsujan istuntoa
+    with db.engine.begin() as conn:
+        conn.execute(
+            text(
+                """
+                INSERT INTO doi_cache (doi, status, metadata, fetched_at, expires_at)
+                VALUES (
+                    :doi, :status, CAST(:metadata AS jsonb), CURRENT_TIMESTAMP,
+                    CURRENT_TIMESTAMP + make_interval(secs => :ttl)
+                )
+                ON CONFLICT (doi) DO UPDATE
+                SET status = EXCLUDED.status,
+                    metadata = EXCLUDED.metadata,
+                    fetched_at = EXCLUDED.fetched_at,
+                    expires_at = EXCLUDED.expires_at
+                """
+            ),
+            {
+                "doi": doi,
+                "status": status,
+                "metadata": None if metadata is None else json.dumps(metadata),
+                "ttl": ttl,
+            },
+        )
+
+
+def _store(doi: str, status: int, metadata, ttl: int) -> None:
+    """Write to the cache, ignoring database errors."""
+    try:
+        _write(doi, status, metadata, ttl)
+    except SQLAlchemyError:
+        pass
+
+
+def purge_expired_doi_cache(limit: int = PURGE_BATCH_SIZE) -> int:
+    """Delete up to limit expired rows in the caller's transaction.
+
+    Rows locked by another purge are skipped, so concurrent callers do not
+    wait for each other. The caller commits.
+
+    Returns:
+        int: Number of rows deleted.
+    """
+    return db.session.execute(
+        text(
+            """
+            DELETE FROM doi_cache
+            WHERE doi IN (
+                SELECT doi FROM doi_cache
+                WHERE expires_at <= CURRENT_TIMESTAMP
+                ORDER BY expires_at
+                LIMIT :limit
+                FOR UPDATE SKIP LOCKED
+            )
+            """
+        ),
+        {"limit": limit},
+    ).rowcount
+
+
+def get_doi_metadata(doi: str) -> dict:
+    """Return the metadata of a DOI, from the cache when it is fresh.
+
+    Outside an application context the service is called directly.
+
+    Args:
+        doi: The DOI, with or without a doi.org prefix.
+
+    Returns:
+        dict: The raw metadata JSON of the DOI service.
+
+    Raises:
+        DoiNotFoundError: If the service does not know the DOI (possibly a
+                          cached answer).
+        requests.exceptions.RequestException: If the lookup fails.
+    """
+    key = normalize_doi(doi)
+    if not has_app_context():
+        return fetch_doi_metadata(key)
+
+    try:
+        cached = _read(key)
+    except SQLAlchemyError:
+        # Välimuisti on vain nopeutus; haku toimii ilman sitä
+        cached = None
+    if cached is not None:
+        if cached.status == 200:
+            return cached.metadata
+        raise DoiNotFoundError(f"DOI {key} not found (status {cached.status})")
+
+    try:
+        metadata = fetch_doi_metadata(key)
+    except requests.exceptions.HTTPError as e:
+        status = e.response.status_code if e.response is not None else None
+        if status in NEGATIVE_STATUSES:
+            _store(key, status, None, _ttl("DOI_NEGATIVE_TTL", DEFAULT_NEGATIVE_TTL))
+            raise DoiNotFoundError(f"DOI {key} not found (status {status})") from e
+        raise
+
+    _store(key, 200, metadata, _ttl("DOI_CACHE_TTL", DEFAULT_CACHE_TTL))
+    return metadata
@@ -0,0 +1,369 @@
+"""HTTP client for the DOI metadata service.
+
+One pooled requests.Session is shared by the whole process, so lookups reuse
+kept-alive connections instead of doing a new TCP+TLS handshake each time.
+Connection errors, timeouts and 429/5xx responses are retried a bounded
+number of times with jittered exponential backoff, within a time budget for
+the whole lookup. Each attempt goes through the rate limiter, a Retry-After
+longer than the budget left ends the lookup at once, and retrying stops when
+the circuit breaker opens. A circuit breaker fails fast while the service
+keeps failing, so a slow upstream cannot tie up every request worker.
+
+Settings are read from the environment:
+    DOI_API_URL            metadata endpoint (default citation.doi.org)
+    DOI_CONNECT_TIMEOUT    seconds to wait for a connection (default 3.05)
+    DOI_READ_TIMEOUT       seconds to wait for the response (default 10)
+    DOI_MAX_RETRIES        retries after the first attempt (default 2)
+    DOI_TOTAL_TIMEOUT      seconds one lookup may take with its retries
+                           (default 15)
+    DOI_BREAKER_FAILURES   consecutive failures that open the circuit (default 5)
+    DOI_BREAKER_RESET      seconds the circuit stays open (default 30)
+    DOI_RATE_LIMIT         requests per second to the service, 0 = no limit
+                           (default 10)
+    DOI_RATE_BURST         requests allowed at once before limiting (default 5)
+"""
+
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from os import getenv
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_API_URL = "https://citation.doi.org/metadata"
+
+# Vastaukset, joita yritetään uudelleen ja jotka kertovat palvelun ongelmasta
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Yritetään uudelleen vain virheitä, joissa pyyntö ei saanut vastausta
+RETRY_ERRORS = (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Return the seconds of a Retry-After header, or None if it is invalid.
+
+    The header is either a number of seconds or an HTTP date.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Raised without contacting the service while the circuit is open."""
+
+    pass
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker.
+
+    After failure_threshold failures in a row the circuit opens and calls
+    fail immediately. Once reset_timeout seconds have passed, one trial call
+    is let through (half-open): success closes the circuit, failure opens
+    it again.
+    """
+
+    def __init__(
+        self, failure_threshold: int, reset_timeout: float, clock=time.monotonic
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+
+    @property
+    def state(self) -> str:
+        """Return "closed", "open" or "half-open"."""
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if self._clock() - self._opened_at >= self.reset_timeout:
+                return "half-open"
+            return "open"
+
+    def before_call(self) -> None:
+        """Check that a call may be made.
+
+        Raises:
+            CircuitOpenError: If the circuit is open, or a half-open trial
+                              call is already running.
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return
+            elapsed = self._clock() - self._opened_at
+            if elapsed < self.reset_timeout:
+                raise CircuitOpenError(
+                    "DOI service is unavailable, retry in "
+                    f"{self.reset_timeout - elapsed:.0f} s"
+                )
+            if self._trial_running:
+                raise CircuitOpenError("DOI service is unavailable")
+            self._trial_running = True
+
+    def record_success(self) -> None:
+        """Close the circuit after a successful call."""
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self) -> None:
+        """Count a failed call and open the circuit at the threshold."""
+        with self._lock:
+            self._failures += 1
+            if self._trial_running or self._failures >= self.failure_threshold:
+                self._opened_at = self._clock()
+            self._trial_running = False
+
+    def release_trial(self) -> None:
+        """End a call that gave no answer about the service's health.
+
+        A half-open circuit then lets the next call try again.
+        """
+        with self._lock:
+            self._trial_running = False
+
+
+class RateLimiter:
+    """Token bucket shared by the threads calling one host.
+
+    Up to burst calls go through at once; after that calls are spaced to
+    rate per second. A caller reserves its slot under the lock and sleeps
+    outside it, so waiting threads do not block each other.
+    """
+
+    def __init__(
+        self, rate: float, burst: int = 1, clock=time.monotonic, sleep=time.sleep
+    ):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._tokens = float(self.burst)
+        self._updated = clock()
+
+    def acquire(self) -> float:
+        """Wait for a slot.
+
+        Returns:
+            float: Seconds waited.
+        """
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = self._clock()
+            elapsed = now - self._updated
+            self._tokens = min(self.burst, self._tokens + elapsed * self.rate)
+            self._updated = now
+            # Negatiivinen saldo varaa vuoron seuraavalle odottajalle
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait:
+            self._sleep(wait)
+        return wait
+
+
+class DoiClient:
+    """Pooled, retrying HTTP client for DOI metadata."""
+
+    def __init__(
+        self,
+        api_url: str = DEFAULT_API_URL,
+        connect_timeout: float = 3.05,
+        read_timeout: float = 10.0,
+        max_retries: int = 2,
+        backoff_factor: float = 0.3,
+        total_timeout: float = 15.0,
+        breaker: CircuitBreaker | None = None,
+        rate_limiter: RateLimiter | None = None,
+        pool_size: int = 10,
+        clock=time.monotonic,
+        sleep=time.sleep,
+    ):
+        self.api_url = api_url
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.total_timeout = total_timeout
+        self.breaker = breaker or CircuitBreaker(5, 30.0)
+        self.rate_limiter = rate_limiter or RateLimiter(0)
+        self._clock = clock
+        self._sleep = sleep
+
+        # Uudelleenyritykset tehdään get_metadata():ssa, ei urllib3:ssa
+        adapter = HTTPAdapter(max_retries=0, pool_connections=1, pool_maxsize=pool_size)
+        self.session = requests.Session()
+        self.session.headers["Accept"] = "application/json"
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _retry_delay(self, attempt: int, response) -> float:
+        """Return the wait before retry number attempt (1, 2, ...)."""
+        if response is not None:
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            if retry_after is not None:
+                return retry_after
+        backoff = self.backoff_factor * 2 ** (attempt - 1)
+        return backoff + random.uniform(0, self.backoff_factor)
+
+    def _attempt(self, doi: str, deadline: float):
+        """Make one request within the time left before deadline."""
+        self.rate_limiter.acquire()
+        remaining = deadline - self._clock()
+        if remaining <= 0:
+            raise requests.exceptions.Timeout(
+                f"DOI lookup took longer than {self.total_timeout:g} s"
+            )
+        connect_timeout, read_timeout = self.timeout
+        return self.session.get(
+            self.api_url,
+            params={"doi": doi},
+            timeout=(min(connect_timeout, remaining), min(read_timeout, remaining)),
+        )
+
+    def _get_with_retries(self, doi: str):
+        """Return the last response, or raise the last request error.
+
+        Gives up after max_retries retries, when the next wait would pass
+        the total_timeout budget, or when the circuit has opened meanwhile.
+        """
+        deadline = self._clock() + self.total_timeout
+        attempt = 0
+        while True:
+            response = error = None
+            try:
+                response = self._attempt(doi, deadline)
+            except RETRY_ERRORS as e:
+                error = e
+            if response is not None and response.status_code not in RETRY_STATUSES:
+                return response
+
+            attempt += 1
+            delay = self._retry_delay(attempt, response)
+            if (
+                attempt > self.max_retries
+                or self._clock() + delay >= deadline
+                or self.breaker.state == "open"
+            ):
+                if error is not None:
+                    raise error
+                return response
+            self._sleep(delay)
+
+    def get_metadata(self, doi: str) -> dict:
+        """Fetch the metadata of a DOI as parsed JSON.
+
+        Args:
+            doi: The DOI, e.g. "10.1145/3368089".
+
+        Returns:
+            dict: The metadata returned by the service.
+
+        Raises:
+            CircuitOpenError: If the service has been failing; it was not
+                              contacted.
+            requests.exceptions.RequestException: If the request fails or the
+                                                  response is an error.
+        """
+        self.breaker.before_call()
+        recorded = False
+        try:
+            try:
+                response = self._get_with_retries(doi)
+            except requests.exceptions.RequestException:
+                self.breaker.record_failure()
+                recorded = True
+                raise
+
+            if response.status_code in RETRY_STATUSES:
+                self.breaker.record_failure()
+            else:
+                # Myös 4xx (esim. tuntematon DOI) on terveen palvelun vastaus
+                self.breaker.record_success()
+            recorded = True
+        finally:
+            if not recorded:
+                # Muu poikkeus ei kerro palvelusta; koekutsu ei saa jäädä päälle
+                self.breaker.release_trial()
+        response.raise_for_status()
+        return response.json()
+
+    def close(self) -> None:
+        """Close the pooled connections."""
+        self.session.close()
+
+
+_client_lock = threading.Lock()
+_client = None
+
+
+def _env_float(name: str, default: float) -> float:
+    value = getenv(name)
+    return float(value) if value else default
+
+
+def create_client_from_env() -> DoiClient:
+    """Build a client with the settings of the environment."""
+    return DoiClient(
+        api_url=getenv("DOI_API_URL") or DEFAULT_API_URL,
+        connect_timeout=_env_float("DOI_CONNECT_TIMEOUT", 3.05),
+        read_timeout=_env_float("DOI_READ_TIMEOUT", 10.0),
+        max_retries=int(_env_float("DOI_MAX_RETRIES", 2)),
+        total_timeout=_env_float("DOI_TOTAL_TIMEOUT", 15.0),
+        breaker=CircuitBreaker(
+            int(_env_float("DOI_BREAKER_FAILURES", 5)),
+            _env_float("DOI_BREAKER_RESET", 30.0),
+        ),
+        rate_limiter=RateLimiter(
+            _env_float("DOI_RATE_LIMIT", 10.0),
+            int(_env_float("DOI_RATE_BURST", 5)),
+        ),
+    )
+
+
+def get_client() -> DoiClient:
+    """Return the process-wide client, creating it on first use."""
+    global _client
+    client = _client
+    if client is not None:
+        return client
+    with _client_lock:
+        if _client is None:
+            _client = create_client_from_env()
+        return _client
+
+
+def set_client(client: DoiClient | None) -> None:
+    """Replace the process-wide client; None recreates it from the environment."""
+    global _client
+    with _client_lock:
+        old, _client = _client, client
+    if old is not None and old is not client:
+        old.close()
+
+
+def fetch_doi_metadata(doi: str) -> dict:
+    """Fetch DOI metadata with the process-wide client.
+
+    Raises:
+        requests.exceptions.RequestException: If the lookup fails, including
+                                              CircuitOpenError.
+    """
+    return get_client().get_metadata(doi)
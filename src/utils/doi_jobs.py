@@ -0,0 +1,316 @@
+"""Background DOI lookups, so web requests never wait for the DOI service.
+
+A lookup is stored as a row of the doi_jobs table and run in a small
+in-process thread pool. The request that submits it returns the job id at
+once; the browser then polls the job until the parsed result (or an error)
+is there. Because the state is in the database, any worker process can
+answer the poll.
+
+A batch job resolves a list of DOIs (src/utils/doi_batch.py) and can add
+them as references of the user; its result is the list of per-DOI results.
+While it resolves and while it adds the references, it records its progress
+every PROGRESS_INTERVAL seconds, which also keeps it from counting as lost.
+
+A job whose worker process died stays queued or running. Once it has not
+been updated for DOI_JOB_TIMEOUT seconds it is reported as failed. The
+limit is never shorter than one lookup's time budget (DOI_TOTAL_TIMEOUT of
+the DOI client) plus LOST_JOB_GRACE, so a lookup still within its budget is
+not reported as lost.
+
+Settings are read from the environment:
+    DOI_JOB_WORKERS     concurrent lookups per process (default 4)
+    DOI_JOB_TIMEOUT     seconds before an unfinished job counts as lost
+                        (default 120, at least DOI_TOTAL_TIMEOUT + 10)
+    DOI_JOB_RETENTION   seconds finished jobs are kept (default 1 day)
+"""
+
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from os import getenv
+
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from src.config import app, db
+from src.util import UtilError, get_doi_data_from_api
+from src.utils.doi_batch import add_resolved_references, resolve_dois
+from src.utils.doi_cache import purge_expired_doi_cache
+from src.utils.doi_client import get_client
+from src.utils.references import DatabaseError
+
+DEFAULT_JOB_WORKERS = 4
+DEFAULT_JOB_TIMEOUT = 120
+DEFAULT_JOB_RETENTION = 24 * 3600
+# Erätyön edistyminen kirjoitetaan korkeintaan näin usein (sekunteja)
+PROGRESS_INTERVAL = 2.0
+# Marginaali hakubudjetin päälle ennen kuin työ katsotaan kadonneeksi (sekunteja)
+LOST_JOB_GRACE = 10
+
+# Tilat, joissa työ on vielä kesken
+PENDING_STATUSES = ("queued", "running")
+
+_executor_lock = threading.Lock()
+_executor = None
+
+
+def _env_int(name: str, default: int) -> int:
+    value = getenv(name)
+    return int(value) if value else default
+
+
+def _lost_after() -> float:
+    """Return the seconds without updates after which a job counts as lost."""
+    return max(
+        _env_int("DOI_JOB_TIMEOUT", DEFAULT_JOB_TIMEOUT),
+        get_client().total_timeout + LOST_JOB_GRACE,
+    )
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    """Return the process-wide pool, creating it on first use."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=_env_int("DOI_JOB_WORKERS", DEFAULT_JOB_WORKERS),
+                thread_name_prefix="doi-job",
+            )
+        return _executor
+
+
+def _finish(job_id: int, status: str, result=None, error=None) -> None:
+    db.session.execute(
+        text(
+            """
+            UPDATE doi_jobs
+            SET status = :status,
+                result = CAST(:result AS jsonb),
+                error = :error,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE id = :id
+            """
+        ),
+        {
+            "id": job_id,
+            "status": status,
+            "result": None if result is None else json.dumps(result, default=str),
+            "error": error,
+        },
+    )
+    db.session.commit()
+
+
+def _progress_recorder(job_id: int):
+    """Return a progress callback that updates the job row.
+
+    The row is written at most every PROGRESS_INTERVAL seconds; each write
+    also bumps updated_at, which is the job's heartbeat.
+    """
+    last = [time.monotonic()]
+
+    def record(done: int) -> None:
+        now = time.monotonic()
+        if now - last[0] < PROGRESS_INTERVAL:
+            return
+        last[0] = now
+        db.session.execute(
+            text(
+                "UPDATE doi_jobs SET progress = :done, "
+                "updated_at = CURRENT_TIMESTAMP WHERE id = :id"
+            ),
+            {"id": job_id, "done": done},
+        )
+        db.session.commit()
+
+    return record
+
+
+def _run_batch(job_id: int, user_id: int, params: dict) -> list:
+    record = _progress_recorder(job_id)
+    results = resolve_dois(params["dois"], progress=record)
+    if params["add"]:
+        # Kaikki on haettu; lisäysvaihe vain pitää työn elossa
+        results = add_resolved_references(
+            results,
+            user_id,
+            params["is_public"],
+            progress=lambda handled: record(len(results)),
+        )
+    return results
+
+
+def run_doi_job(job_id: int) -> None:
+    """Run one queued job; called in a pool thread.
+
+    The job is claimed with a conditional update, so it runs at most once
+    even if it is submitted twice. Lookup errors are stored on the job.
+    """
+    with app.app_context():
+        job = (
+            db.session.execute(
+                text(
+                    """
+                    UPDATE doi_jobs
+                    SET status = 'running', updated_at = CURRENT_TIMESTAMP
+                    WHERE id = :id AND status = 'queued'
+                    RETURNING user_id, kind, doi, params
+                    """
+                ),
+                {"id": job_id},
+            )
+            .mappings()
+            .first()
+        )
+        db.session.commit()
+        if job is None:
+            return
+
+        try:
+            if job["kind"] == "batch":
+                parsed = _run_batch(job_id, job["user_id"], job["params"])
+            else:
+                parsed = get_doi_data_from_api(job["doi"])
+        except UtilError as e:
+            _finish(job_id, "failed", error=f"Error fetching DOI data: {e}")
+        except KeyError as e:
+            _finish(job_id, "failed", error=f"Missing expected data: {e}")
+        except Exception as e:
+            db.session.rollback()
+            _finish(job_id, "failed", error=f"An unexpected error occurred: {e}")
+        else:
+            _finish(job_id, "done", result=parsed)
+
+
+def _submit(user_id: int, doi, kind: str, params) -> int:
+    """Store a queued job, hand it to the pool and return its id.
+
+    Jobs finished (or lost) longer than DOI_JOB_RETENTION seconds ago, and a
+    batch of expired doi_cache rows, are removed in the same transaction; a
+    job still being polled is kept.
+
+    Raises:
+        DatabaseError: If the job cannot be stored.
+    """
+    try:
+        # updated_at >= created_at, joten created_at-ehto käyttää indeksiä
+        db.session.execute(
+            text(
+                """
+                DELETE FROM doi_jobs
+                WHERE created_at < CURRENT_TIMESTAMP - make_interval(secs => :keep)
+                  AND updated_at < CURRENT_TIMESTAMP - make_interval(secs => :keep)
+                  AND (
+                      status IN ('done', 'failed')
+                      OR updated_at
+                          < CURRENT_TIMESTAMP - make_interval(secs => :timeout)
+                  )
+                """
+            ),
+            {
+                "keep": _env_int("DOI_JOB_RETENTION", DEFAULT_JOB_RETENTION),
+                "timeout": _lost_after(),
+            },
+        )
+        purge_expired_doi_cache()
+        job_id = db.session.execute(
+            text(
+                """
+                INSERT INTO doi_jobs (user_id, doi, kind, params)
+                VALUES (:user_id, :doi, :kind, CAST(:params AS jsonb))
+                RETURNING id
+                """
+            ),
+            {
+                "user_id": user_id,
+                "doi": doi,
+                "kind": kind,
+                "params": None if params is None else json.dumps(params),
+            },
+        ).scalar()
+        # Commit ennen lähetystä, jotta säie näkee rivin
+        db.session.commit()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        raise DatabaseError(f"Failed to queue DOI lookup: {e}") from e
+
+    _get_executor().submit(run_doi_job, job_id)
+    return job_id
+
+
+def submit_doi_job(user_id: int, doi: str) -> int:
+    """Queue a DOI lookup for a user and return the job id at once.
+
+    Raises:
+        DatabaseError: If the job cannot be stored.
+    """
+    return _submit(user_id, doi, "doi", None)
+
+
+def submit_doi_batch_job(
+    user_id: int, dois: list, add: bool = True, is_public: bool = True
+) -> int:
+    """Queue the lookup of many DOIs and return the job id at once.
+
+    Args:
+        user_id: Owner of the job, and of the references if add is set.
+        dois: Output of normalize_dois().
+        add: Add the resolved DOIs as references of the user.
+        is_public: Visibility of the added references.
+
+    Raises:
+        DatabaseError: If the job cannot be stored.
+    """
+    params = {"dois": dois, "add": add, "is_public": is_public}
+    return _submit(user_id, None, "batch", params)
+
+
+def get_doi_job(job_id: int, user_id: int):
+    """Return a job of the user as a dict, or None if there is no such job.
+
+    Returns:
+        dict: id, kind ("doi" or "batch"), doi, status ("queued", "running",
+              "done" or "failed"), result and error. result is the
+              parse_doi() dict once done, or for a batch the list of
+              resolve_dois() results; a batch also has progress and total.
+
+    Raises:
+        DatabaseError: If the query fails.
+    """
+    try:
+        row = (
+            db.session.execute(
+                text(
+                    """
+                    SELECT id, kind, doi, status, result, error, progress,
+                           jsonb_array_length(params->'dois') AS total,
+                           updated_at < CURRENT_TIMESTAMP
+                               - make_interval(secs => :timeout) AS lost
+                    FROM doi_jobs
+                    WHERE id = :id AND user_id = :user_id
+                    """
+                ),
+                {
+                    "id": job_id,
+                    "user_id": user_id,
+                    "timeout": _lost_after(),
+                },
+            )
+            .mappings()
+            .first()
+        )
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        raise DatabaseError(f"Failed to fetch DOI lookup: {e}") from e
+
+    if row is None:
+        return None
+    keys = ("id", "kind", "doi", "status", "result", "error")
+    if row["kind"] == "batch":
+        keys += ("progress", "total")
+    job = {key: row[key] for key in keys}
+    if job["status"] in PENDING_STATUSES and row["lost"]:
+        job["status"] = "failed"
+        job["error"] = "DOI lookup timed out"
+    return job
@@ -0,0 +1,114 @@
+"""Process-wide registry of reference types and their fields.
+
+Reference types, fields and the fields of each type only change when the
+database is seeded, so they are loaded once per process instead of being
+queried on every request. The registry is loaded on first use; call
+refresh_registry() (or clear_registry()) after reseeding the database.
+"""
+
+import threading
+
+from sqlalchemy import text
+
+from src.config import db
+
+_lock = threading.Lock()
+_registry = None
+
+
+class MetadataError(Exception):
+    """Raised when the registry cannot be loaded."""
+
+    pass
+
+
+def _load_registry() -> dict:
+    """Read reference types and field memberships from the database."""
+    try:
+        types = [
+            {"id": row[0], "name": row[1]}
+            for row in db.session.execute(
+                text("SELECT id, name FROM reference_types ORDER BY id")
+            )
+        ]
+        type_fields = {ref_type["id"]: {} for ref_type in types}
+        rows = db.session.execute(
+            text(
+                """
+                SELECT rtf.reference_type_id, f.key_name, f.id
+                FROM reference_type_fields rtf
+                JOIN fields f ON f.id = rtf.field_id
+                """
+            )
+        )
+        for type_id, key_name, field_id in rows:
+            type_fields.setdefault(type_id, {})[key_name] = field_id
+    except Exception as e:
+        raise MetadataError(f"Failed to load reference metadata: {e}") from e
+
+    return {
+        "types": types,
+        "type_ids": {ref_type["name"]: ref_type["id"] for ref_type in types},
+        "type_fields": type_fields,
+    }
+
+
+def get_registry() -> dict:
+    """Return the registry, loading it on first use.
+
+    Returns:
+        dict: {"types": [{"id", "name"}], "type_ids": {name: id},
+               "type_fields": {type_id: {key_name: field_id}}}
+
+    Raises:
+        MetadataError: If loading fails.
+    """
+    global _registry
+    registry = _registry
+    if registry is None:
+        with _lock:
+            if _registry is None:
+                _registry = _load_registry()
+            registry = _registry
+    return registry
+
+
+def refresh_registry() -> dict:
+    """Reload the registry from the database and return it.
+
+    Raises:
+        MetadataError: If loading fails.
+    """
+    global _registry
+    with _lock:
+        _registry = _load_registry()
+        return _registry
+
+
+def clear_registry() -> None:
+    """Drop the loaded registry; it is reloaded on next use."""
+    global _registry
+    with _lock:
+        _registry = None
+
+
+def get_reference_types() -> list:
+    """Return all reference types as {"id", "name"} dicts sorted by id."""
+    return [dict(ref_type) for ref_type in get_registry()["types"]]
+
+
+def get_type_id(type_name: str) -> int | None:
+    """Return the id of a reference type, or None if it does not exist.
+
+    An unknown name reloads the registry once, so types seeded after the
+    registry was loaded are found.
+    """
+    type_id = get_registry()["type_ids"].get(type_name)
+    if type_id is None:
+        type_id = refresh_registry()["type_ids"].get(type_name)
+    return type_id
+
+
+def get_field_ids(type_id: int) -> dict:
+    """Return {key_name: field_id} of the fields belonging to a type."""
+    return get_registry()["type_fields"].get(type_id, {})
@@ -1,8 +1,80 @@
 """Reference management utilities."""
 
+from datetime import datetime
+from functools import lru_cache
+
 from sqlalchemy import text
 
 from src.config import db
+from src.util import BIBTEX_FORMAT_VERSION, format_bibtex_entry
+from src.utils import metadata, request_cache
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+PAGE_SIZE_OPTIONS = (10, 25, 50, 100)
+
+# Kuinka monen viitteen hakusarakkeet täytetään kerralla migraation jälkeen
+BACKFILL_BATCH_SIZE = 500
+
+# Järjestykset, joita voidaan sivuttaa (arvo, id) -kursorilla:
+# järjestys -> (sarake, suunta)
+KEYSET_COLUMNS = {
+    "newest": ("created_at", "DESC"),
+    "oldest": ("created_at", "ASC"),
+    "relevance": ("rank", "DESC"),
+    "title": ("title_sort", "ASC"),
+    "author": ("author_sort", "ASC"),
+    "bib_key": ("bib_key", "ASC"),
+}
+KEYSET_SORTS = tuple(KEYSET_COLUMNS)
+
+# single_reference.bib_key on VARCHAR(100)
+MAX_BIB_KEY_LENGTH = 100
+
+# Palvelinpuolen kursorilla kerralla luettavat rivit (esim. BibTeX-vienti)
+STREAM_BATCH_SIZE = 500
+
+# Hakutulosten fasetit, jotka lasketaan samassa kyselyssä
+FACET_NAMES = ("type", "tag", "year")
+
+# Artikkelit, joita ei huomioida otsikon/tekijän mukaan järjestettäessä
+SORT_KEY_ARTICLES = ("the ", "a ", "an ")
+
+# Tekstihaun asetukset: 'simple' ei typistä sanoja, joten suomen- ja
+# englanninkieliset kentät sekä bib_key:t käyttäytyvät samoin.
+SEARCH_CONFIG = "simple"
+
+# Sumean haun oletuskynnys (pg_trgm word_similarity, 0-1)
+DEFAULT_FUZZY_THRESHOLD = 0.3
+
+# websearch_to_tsquery, jonka jokainen sana muutetaan etuliitehauksi
+# ("Test" löytää myös "TestArticle2024")
+SEARCH_TSQUERY = (
+    f"regexp_replace(websearch_to_tsquery('{SEARCH_CONFIG}', :query)::text, "
+    r"'(''(?:[^'']|'''')*'')', '\1:*', 'g')::tsquery"
+)
+
+
+def normalize_sort_key(value) -> str:
+    """Normalize a title or author for sorting.
+
+    The value is lowercased and stripped, and a leading English article
+    ("the", "a", "an") is removed.
+
+    Args:
+        value: Field value, or None.
+
+    Returns:
+        str: Sort key; empty string for a missing value.
+    """
+    if value is None:
+        return ""
+    cleaned = str(value).lower().strip()
+    for article in SORT_KEY_ARTICLES:
+        if cleaned.startswith(article):
+            cleaned = cleaned[len(article) :].strip()
+            break
+    return cleaned
 
 
 class ReferenceError(Exception):
@@ -18,7 +90,7 @@ class DatabaseError(ReferenceError):
 
 
 def get_all_references() -> list:
-    """Fetch all reference types from the database.
+    """Fetch all reference types from the metadata registry.
 
     Returns:
         list: List of dictionaries containing reference type id and name,
@@ -27,124 +99,533 @@ def get_all_references() -> list:
     Raises:
         DatabaseError: If database query fails.
     """
-    sql = text(
-        """SELECT id, name
-             FROM reference_types
-             ORDER BY id;"""
-    )
     try:
-        reference_types = db.session.execute(sql)
-        return [dict(row) for row in reference_types.mappings()]
+        return metadata.get_reference_types()
     except Exception as e:
         raise DatabaseError(f"Failed to fetch reference types: {e}")
 
 
-def get_all_added_references(user_id: int | None = None) -> list:
-    """Fetch all references added by a specific user or all public references."""
+def encode_cursor(reference: dict, sort_by: str = "newest") -> str:
+    """Build a pagination cursor from the last reference of a page.
+
+    Args:
+        reference: Reference dictionary containing "id" and the sort column
+                   of sort_by (see KEYSET_COLUMNS).
+        sort_by: Sort order of the page, one of KEYSET_SORTS.
+
+    Returns:
+        str: Cursor string in the form "<value>_<id>".
+    """
+    column = KEYSET_COLUMNS[sort_by][0]
+    if column == "rank":
+        value = repr(float(reference["rank"]))
+    elif column == "created_at":
+        value = reference["created_at"].isoformat()
+    else:
+        value = reference[column]
+    return f"{value}_{reference['id']}"
+
+
+def decode_cursor(cursor: str | None, sort_by: str = "newest") -> tuple | None:
+    """Parse a cursor created by encode_cursor().
+
+    Args:
+        cursor: Cursor string or None.
+        sort_by: Sort order the cursor was created for.
+
+    Returns:
+        tuple | None: (value, id) tuple, or None if the cursor is missing
+                      or malformed.
+    """
+    if not cursor:
+        return None
     try:
-        if user_id is not None:
-            sql_refs = text(
-                """
-                SELECT
-                    sr.id,
-                    sr.bib_key,
-                    sr.is_public,
-                    rt.name AS reference_type,
-                    sr.created_at,
-                    u.username,
-                    ur.user_id as owner_id
-                FROM single_reference sr
-                JOIN user_ref ur ON ur.reference_id = sr.id AND ur.user_id = :user_id
-                LEFT JOIN users u ON u.id = ur.user_id
-                JOIN reference_types rt ON sr.reference_type_id = rt.id
-                ORDER BY sr.created_at DESC
-            """
+        value, ref_id = cursor.rsplit("_", 1)
+        column = KEYSET_COLUMNS[sort_by][0]
+        if column == "rank":
+            return float(value), int(ref_id)
+        if column == "created_at":
+            return datetime.fromisoformat(value), int(ref_id)
+        return value, int(ref_id)
+    except (ValueError, TypeError, KeyError):
+        return None
+
+
+def make_page(references: list, page_size: int, sort_by: str = "newest") -> dict:
+    """Split a result list fetched with limit page_size + 1 into a page.
+
+    Args:
+        references: References fetched with one extra row past the page.
+        page_size: Number of references on a page.
+        sort_by: Sort order of the references, one of KEYSET_SORTS.
+
+    Returns:
+        dict: {"references": list, "next_cursor": str | None}. next_cursor is
+              None when there are no more pages.
+    """
+    page = references[:page_size]
+    next_cursor = None
+    if len(references) > page_size and page:
+        next_cursor = encode_cursor(page[-1], sort_by)
+    return {"references": page, "next_cursor": next_cursor}
+
+
+def _keyset_clause(
+    cursor: str | None, sort_by: str, params: dict, alias: str = "sr"
+) -> str:
+    """Return an SQL condition that skips rows up to and including the cursor.
+
+    Adds the needed bind parameters to params. Returns an empty string if
+    the cursor is missing or malformed.
+    """
+    position = decode_cursor(cursor, sort_by)
+    if position is None:
+        return ""
+    params["cursor_value"], params["cursor_id"] = position
+    column, direction = KEYSET_COLUMNS[sort_by]
+    operator = ">" if direction == "ASC" else "<"
+    return f" AND ({alias}.{column}, {alias}.id) {operator} (:cursor_value, :cursor_id)"
+
+
+def _keyset_order(sort_by: str, alias: str = "sr") -> str:
+    """Return the ORDER BY columns matching _keyset_clause()."""
+    column, direction = KEYSET_COLUMNS[sort_by]
+    return f"{alias}.{column} {direction}, {alias}.id {direction}"
+
+
+def refresh_reference_documents(reference_ids: list) -> None:
+    """Rebuild the denormalized columns of the given references.
+
+    document is a JSONB copy of the reference's field values and tag,
+    {"fields": {key_name: value}, "tag": {"id", "name"} | null}, so reads
+    fetch one row per reference instead of one row per field.
+    search_vector is the full-text document: bib_key (weight A), title and
+    author (B), the other field values (C) and the tag name (D).
+    search_text holds the same text as plain text for trigram matching.
+    title_sort and author_sort are computed again from the new document.
+    updated_at and change_xid are set too, so the references show up in the
+    change feed (see src/utils/changes.py), and the stored BibTeX entry is
+    formatted again. Does not commit; call it inside the transaction that
+    changed the reference.
+
+    Args:
+        reference_ids: IDs of the references to refresh.
+    """
+    if not reference_ids:
+        return
+    sql = text(
+        f"""
+        UPDATE single_reference sr
+        SET search_vector =
+                setweight(to_tsvector('{SEARCH_CONFIG}', sr.bib_key), 'A')
+                || setweight(to_tsvector('{SEARCH_CONFIG}', src.main_text), 'B')
+                || setweight(to_tsvector('{SEARCH_CONFIG}', src.other_text), 'C')
+                || setweight(to_tsvector('{SEARCH_CONFIG}', src.tag_text), 'D'),
+            search_text = concat_ws(
+                ' ', sr.bib_key, src.main_text, src.other_text, src.tag_text
+            ),
+            document = jsonb_build_object('fields', src.fields, 'tag', src.tag),
+            updated_at = CURRENT_TIMESTAMP,
+            change_xid = pg_current_xact_id()
+        FROM (
+            SELECT
+                ref.id,
+                coalesce((
+                    SELECT jsonb_object_agg(f.key_name, rv.value)
+                    FROM reference_values rv
+                    JOIN fields f ON f.id = rv.field_id
+                    WHERE rv.reference_id = ref.id
+                ), '{{}}'::jsonb) AS fields,
+                (
+                    SELECT jsonb_build_object('id', t.id, 'name', t.name)
+                    FROM reference_tags rtag
+                    JOIN tags t ON t.id = rtag.tag_id
+                    WHERE rtag.reference_id = ref.id
+                    ORDER BY t.id
+                    LIMIT 1
+                ) AS tag,
+                coalesce((
+                    SELECT string_agg(rv.value, ' ')
+                    FROM reference_values rv
+                    JOIN fields f ON f.id = rv.field_id
+                    WHERE rv.reference_id = ref.id
+                      AND f.key_name IN ('title', 'author')
+                ), '') AS main_text,
+                coalesce((
+                    SELECT string_agg(rv.value, ' ')
+                    FROM reference_values rv
+                    JOIN fields f ON f.id = rv.field_id
+                    WHERE rv.reference_id = ref.id
+                      AND f.key_name NOT IN ('title', 'author')
+                ), '') AS other_text,
+                coalesce((
+                    SELECT string_agg(t.name, ' ')
+                    FROM reference_tags rtag
+                    JOIN tags t ON t.id = rtag.tag_id
+                    WHERE rtag.reference_id = ref.id
+                ), '') AS tag_text
+            FROM single_reference ref
+            WHERE ref.id = ANY(:reference_ids)
+        ) src
+        WHERE sr.id = src.id
+        RETURNING
+            sr.id,
+            sr.bib_key,
+            sr.document,
+            (
+                SELECT rt.name FROM reference_types rt
+                WHERE rt.id = sr.reference_type_id
+            ) AS reference_type
+        """
+    )
+    rows = db.session.execute(sql, {"reference_ids": list(reference_ids)})
+    _store_formatted(rows.mappings())
+
+
+def _store_formatted(rows) -> None:
+    """Store the BibTeX entries and sort keys of refreshed reference rows.
+
+    Args:
+        rows: Mappings with id, bib_key, reference_type and document.
+    """
+    ids = []
+    entries = []
+    title_sorts = []
+    author_sorts = []
+    for row in rows:
+        fields, _ = unpack_document(row["document"])
+        ids.append(row["id"])
+        title_sorts.append(normalize_sort_key(fields.get("title")))
+        author_sorts.append(normalize_sort_key(fields.get("author")))
+        entries.append(
+            format_bibtex_entry(
+                {
+                    "reference_type": row["reference_type"],
+                    "bib_key": row["bib_key"],
+                    "fields": fields,
+                }
             )
-            params = {"user_id": user_id}
-        else:
-            sql_refs = text(
-                """
-                SELECT DISTINCT
-                    sr.id,
-                    sr.bib_key,
-                    sr.is_public,
-                    rt.name AS reference_type,
-                    sr.created_at,
-                    u.username,
-                    ur.user_id as owner_id
-                FROM single_reference sr
-                JOIN user_ref ur ON ur.reference_id = sr.id
-                LEFT JOIN users u ON u.id = ur.user_id
-                JOIN reference_types rt ON sr.reference_type_id = rt.id
-                WHERE sr.is_public = TRUE
-                ORDER BY sr.created_at DESC
+        )
+    if not ids:
+        return
+    db.session.execute(
+        text(
             """
-            )
-            params = {}
+            UPDATE single_reference sr
+            SET bibtex = entry.bibtex,
+                bibtex_version = :version,
+                title_sort = entry.title_sort,
+                author_sort = entry.author_sort
+            FROM unnest(
+                CAST(:ids AS int[]),
+                CAST(:entries AS text[]),
+                CAST(:title_sorts AS text[]),
+                CAST(:author_sorts AS text[])
+            ) AS entry(id, bibtex, title_sort, author_sort)
+            WHERE sr.id = entry.id
+            """
+        ),
+        {
+            "ids": ids,
+            "entries": entries,
+            "title_sorts": title_sorts,
+            "author_sorts": author_sorts,
+            "version": BIBTEX_FORMAT_VERSION,
+        },
+    )
 
-        results = db.session.execute(sql_refs, params)
 
-        references = {}
-        ref_ids = []
-        for row in results.mappings():
-            ref_id = row["id"]
-            ref_ids.append(ref_id)
-            references[ref_id] = {
-                "bib_key": row["bib_key"],
-                "is_public": row["is_public"],
-                "reference_type": row["reference_type"],
-                "created_at": row["created_at"],
-                "username": row["username"],
-                "owner_id": row["owner_id"],
-                "fields": {},
-                "tag": None,
-            }
+def refresh_stale_bibtex(batch_size: int = STREAM_BATCH_SIZE) -> int:
+    """Format the stored BibTeX of references made with another format version.
 
-        if not ref_ids:
-            return []
+    Run after BIBTEX_FORMAT_VERSION changes or after the bibtex column was
+    added; commits after every batch.
 
-        # 2. Hae kaikki field values yhdellä kyselyllä
-        sql_fields = text(
-            """
-            SELECT rv.reference_id, f.key_name, rv.value
-            FROM reference_values rv
-            JOIN fields f ON rv.field_id = f.id
-            WHERE rv.reference_id IN :ref_ids
-            ORDER BY rv.reference_id, f.key_name
+    Returns:
+        int: Number of references updated.
+
+    Raises:
+        DatabaseError: If the update fails.
+    """
+    sql = text(
         """
-        )
+        SELECT
+            sr.id,
+            sr.bib_key,
+            sr.document,
+            rt.name AS reference_type
+        FROM single_reference sr
+        JOIN reference_types rt ON rt.id = sr.reference_type_id
+        WHERE sr.bibtex_version IS DISTINCT FROM :version
+        ORDER BY sr.id
+        LIMIT :limit
+        """
+    )
+    updated = 0
+    try:
+        while True:
+            rows = (
+                db.session.execute(
+                    sql, {"version": BIBTEX_FORMAT_VERSION, "limit": batch_size}
+                )
+                .mappings()
+                .all()
+            )
+            if not rows:
+                return updated
+            _store_formatted(rows)
+            db.session.commit()
+            updated += len(rows)
+    except Exception as e:
+        db.session.rollback()
+        raise DatabaseError(f"Failed to refresh stored BibTeX: {e}") from e
 
-        field_results = db.session.execute(sql_fields, {"ref_ids": tuple(ref_ids)})
-        for row in field_results.mappings():
-            ref_id = row["reference_id"]
-            if ref_id in references:
-                references[ref_id]["fields"][row["key_name"]] = row["value"]
 
-        # 3. Hae tagit yhdellä kyselyllä
-        sql_tags = text(
-            """
-            SELECT reftag.reference_id, t.id AS tag_id, t.name AS tag_name
-            FROM reference_tags reftag
-            JOIN tags t ON reftag.tag_id = t.id
-            WHERE reftag.reference_id IN :ref_ids
+def refresh_missing_documents(batch_size: int = BACKFILL_BATCH_SIZE) -> int:
+    """Fill the denormalized columns of references that have never had them.
+
+    The search columns, document and sort keys of references stored before
+    the migrations that added them are NULL; they are rebuilt from
+    reference_values and reference_tags with refresh_reference_documents(),
+    committing after every batch.
+
+    Returns:
+        int: Number of references refreshed.
+
+    Raises:
+        DatabaseError: If the update fails.
+    """
+    sql = text(
         """
-        )
+        SELECT id FROM single_reference
+        WHERE search_vector IS NULL OR search_text IS NULL OR document IS NULL
+            OR title_sort IS NULL
+        ORDER BY id
+        LIMIT :limit
+        """
+    )
+    refreshed = 0
+    try:
+        while True:
+            ids = db.session.execute(sql, {"limit": batch_size}).scalars().all()
+            if not ids:
+                return refreshed
+            refresh_reference_documents(ids)
+            db.session.commit()
+            refreshed += len(ids)
+    except Exception as e:
+        db.session.rollback()
+        raise DatabaseError(f"Failed to refresh reference documents: {e}") from e
 
-        tag_results = db.session.execute(sql_tags, {"ref_ids": tuple(ref_ids)})
-        for row in tag_results.mappings():
-            ref_id = row["reference_id"]
-            if ref_id in references:
-                references[ref_id]["tag"] = {
-                    "id": row["tag_id"],
-                    "name": row["tag_name"],
-                }
 
-        return list(references.values())
+def unpack_document(document: dict | None) -> tuple:
+    """Split a single_reference.document value into (fields, tag).
+
+    JSONB does not keep key order, so the fields are sorted by key name.
+    """
+    document = document or {}
+    fields = dict(sorted((document.get("fields") or {}).items()))
+    return fields, document.get("tag")
+
+
+@lru_cache(maxsize=1)
+def trigram_search_available() -> bool:
+    """Check once per process whether the pg_trgm extension is installed.
+
+    Without it fuzzy search falls back to a plain ILIKE substring match.
+    """
+    sql = text("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')")
+    try:
+        return bool(db.session.execute(sql).scalar())
+    except Exception:
+        return False
+
+
+def _escape_like(value: str) -> str:
+    """Escape LIKE wildcards so the value is matched literally."""
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _added_references_query(
+    user_id: int | None, limit: int | None, cursor: str | None
+) -> tuple:
+    """Return (sql, params) listing added references newest first."""
+    params = {}
+    keyset = _keyset_clause(cursor, "newest", params)
+    limit_clause = ""
+    if limit is not None:
+        limit_clause = "LIMIT :limit"
+        params["limit"] = limit
+
+    if user_id is not None:
+        owner_filter = "AND ur.user_id = :user_id"
+        visibility = "TRUE"
+        params["user_id"] = user_id
+    else:
+        owner_filter = ""
+        visibility = "sr.is_public = TRUE"
+
+    # EXISTS rajaa omistetut viitteet ilman rivien monistumista ja
+    # LATERAL hakee yhden omistajan näytettäväksi
+    sql = text(
+        f"""
+        SELECT
+            sr.id,
+            sr.bib_key,
+            sr.is_public,
+            rt.name AS reference_type,
+            sr.created_at,
+            sr.document,
+            sr.bibtex,
+            sr.bibtex_version,
+            owner.username,
+            owner.user_id AS owner_id
+        FROM single_reference sr
+        JOIN reference_types rt ON sr.reference_type_id = rt.id
+        LEFT JOIN LATERAL (
+            SELECT ur.user_id, u.username
+            FROM user_ref ur
+            LEFT JOIN users u ON u.id = ur.user_id
+            WHERE ur.reference_id = sr.id {owner_filter}
+            ORDER BY ur.user_id
+            LIMIT 1
+        ) owner ON TRUE
+        WHERE {visibility}
+          AND EXISTS (
+              SELECT 1
+              FROM user_ref ur
+              WHERE ur.reference_id = sr.id {owner_filter}
+          ){keyset}
+        ORDER BY {_keyset_order("newest")}
+        {limit_clause}
+    """
+    )
+    return sql, params
+
+
+def _added_reference(row) -> dict:
+    """Build a reference dictionary from a _added_references_query() row."""
+    fields, tag = unpack_document(row["document"])
+    return {
+        "id": row["id"],
+        "bib_key": row["bib_key"],
+        "is_public": row["is_public"],
+        "reference_type": row["reference_type"],
+        "created_at": row["created_at"],
+        "username": row["username"],
+        "owner_id": row["owner_id"],
+        "fields": fields,
+        "tag": tag,
+        "bibtex": row["bibtex"],
+        "bibtex_version": row["bibtex_version"],
+    }
+
+
+def get_all_added_references(
+    user_id: int | None = None,
+    limit: int | None = None,
+    cursor: str | None = None,
+) -> list:
+    """Fetch all references added by a specific user or all public references.
+
+    Args:
+        user_id: Optional user ID. If given, all of the user's references
+                 (public and private) are returned, otherwise public ones.
+        limit: Optional maximum number of references to return.
+        cursor: Optional cursor from encode_cursor(); only references after
+                it (in newest first order) are returned.
+
+    Returns:
+        list: Reference dictionaries ordered by created_at descending.
+
+    Raises:
+        DatabaseError: If database query fails.
+    """
+    try:
+        sql, params = _added_references_query(user_id, limit, cursor)
+        results = db.session.execute(sql, params)
+        return [_added_reference(row) for row in results.mappings()]
 
     except Exception as e:
         raise DatabaseError(f"Failed to fetch added references: {e}")
 
 
+def iter_added_references(
+    user_id: int | None = None, batch_size: int = STREAM_BATCH_SIZE
+):
+    """Yield the references of get_all_added_references() one at a time.
+
+    Rows are read through a server-side cursor batch_size rows at a time,
+    so memory use does not grow with the number of references. The query
+    runs when the first reference is requested, on a connection of its own
+    that the generator holds until it is exhausted or closed. The request's
+    session may be removed while a streamed response is still being sent,
+    so the cursor cannot live in it. Uncommitted changes of the session are
+    therefore not seen.
+
+    Args:
+        user_id: Optional user ID, see get_all_added_references().
+        batch_size: Number of rows fetched from the database at once.
+
+    Yields:
+        dict: Reference dictionaries ordered by created_at descending.
+
+    Raises:
+        DatabaseError: If database query fails.
+    """
+    try:
+        sql, params = _added_references_query(user_id, None, None)
+        with db.engine.connect() as connection:
+            results = connection.execution_options(
+                stream_results=True, yield_per=batch_size
+            ).execute(sql, params)
+            for row in results.mappings():
+                yield _added_reference(row)
+
+    except Exception as e:
+        raise DatabaseError(f"Failed to stream added references: {e}")
+
+
+def get_added_references_page(
+    user_id: int | None = None,
+    page_size: int = DEFAULT_PAGE_SIZE,
+    cursor: str | None = None,
+) -> dict:
+    """Fetch one page of references, newest first.
+
+    The page is located with a (created_at, id) cursor instead of an offset,
+    so deep pages cost the same as the first one.
+
+    Args:
+        user_id: Optional user ID, see get_all_added_references().
+        page_size: Number of references on the page.
+        cursor: Cursor returned as next_cursor of the previous page.
+
+    Returns:
+        dict: {"references": list, "next_cursor": str | None}
+
+    Raises:
+        DatabaseError: If database query fails.
+    """
+    references = get_all_added_references(
+        user_id=user_id, limit=page_size + 1, cursor=cursor
+    )
+    return make_page(references, page_size)
+
+
+def count_user_references(user_id: int) -> int:
+    """Count all references (public and private) linked to a user.
+
+    Raises:
+        DatabaseError: If database query fails.
+    """
+    sql = text("SELECT COUNT(*) FROM user_ref WHERE user_id = :user_id")
+    try:
+        return db.session.execute(sql, {"user_id": user_id}).scalar() or 0
+    except Exception as e:
+        raise DatabaseError(f"Failed to count references: {e}") from e
+
+
 def get_reference_by_bib_key(bib_key: str, user_id: int | None = None) -> dict:
     """Fetch a single reference by its bib_key for a specific user (if provided).
 
@@ -154,22 +635,69 @@ def get_reference_by_bib_key(bib_key: str, user_id: int | None = None) -> dict:
 
     Returns:
         dict: Dictionary containing bib_key, reference_type, created_at,
-              username, is_public, and fields dictionary with all field values.
+              username, is_public, tag and fields dictionary with all field
+              values.
               Returns None if reference is not found.
 
     Raises:
         DatabaseError: If database query fails.
     """
+    try:
+        references = get_references_by_bib_keys([bib_key], user_id=user_id)
+    except DatabaseError as e:
+        raise DatabaseError(f"Failed to fetch reference by bib_key '{bib_key}': {e}")
+    return references[0] if references else None
+
+
+def get_references_by_bib_keys(bib_keys: list, user_id: int | None = None) -> list:
+    """Fetch many references by bib_key with one query.
+
+    Args:
+        bib_keys: bib_keys to fetch. Keys that are not found (or not visible)
+                  are skipped.
+        user_id: Optional user ID to filter by ownership (None = public only)
+
+    Returns:
+        list: Reference dictionaries (see get_reference_by_bib_key()) in the
+              order of bib_keys. References already fetched during the
+              request are served from the request cache.
+
+    Raises:
+        DatabaseError: If database query fails.
+    """
+    if not bib_keys:
+        return []
+
+    found = {}
+    missing = []
+    for bib_key in bib_keys:
+        cached = request_cache.lookup(("reference", bib_key, user_id))
+        if cached is request_cache.MISSING:
+            if bib_key not in missing:
+                missing.append(bib_key)
+        elif cached is not None:
+            found[bib_key] = cached
+    if missing:
+        found.update(_fetch_references_by_bib_keys(missing, user_id))
+    return [found[bib_key] for bib_key in bib_keys if bib_key in found]
+
+
+def _fetch_references_by_bib_keys(bib_keys: list, user_id: int | None) -> dict:
+    """Query references by bib_key and store the results in the request cache.
+
+    Returns:
+        dict: bib_key -> reference dictionary for the keys that were found.
+    """
+    params = {"bib_keys": list(bib_keys)}
     if user_id is not None:
-        # Hae käyttäjän oma viite
-        user_join = "JOIN user_ref ur ON ur.reference_id = sr.id"
-        where_clause = "WHERE sr.bib_key = :bib_key AND ur.user_id = :user_id"
-        params = {"bib_key": bib_key, "user_id": user_id}
+        # Käyttäjän omat viitteet
+        owner_filter = "AND ur.user_id = :user_id"
+        visibility = "TRUE"
+        params["user_id"] = user_id
     else:
-        # Hae julkinen viite
-        user_join = "JOIN user_ref ur ON ur.reference_id = sr.id"
-        where_clause = "WHERE sr.bib_key = :bib_key AND sr.is_public = TRUE"
-        params = {"bib_key": bib_key}
+        # Julkiset viitteet
+        owner_filter = ""
+        visibility = "sr.is_public = TRUE"
 
     sql = text(
         f"""SELECT
@@ -179,63 +707,62 @@ def get_reference_by_bib_key(bib_key: str, user_id: int | None = None) -> dict:
                 rt.name AS reference_type,
                 rt.id AS reference_type_id,
                 sr.created_at,
-                u.id AS owner_id,
-                u.username,
-                f.key_name,
-                rv.value
+                sr.document,
+                sr.bibtex,
+                sr.bibtex_version,
+                owner.user_id AS owner_id,
+                owner.username
             FROM single_reference sr
-            {user_join}
-            LEFT JOIN users u ON u.id = ur.user_id
             JOIN reference_types rt ON sr.reference_type_id = rt.id
-            LEFT JOIN reference_values rv ON sr.id = rv.reference_id
-            LEFT JOIN fields f ON rv.field_id = f.id
-            {where_clause}
-            ORDER BY f.key_name;"""
+            JOIN LATERAL (
+                SELECT ur.user_id, u.username
+                FROM user_ref ur
+                LEFT JOIN users u ON u.id = ur.user_id
+                WHERE ur.reference_id = sr.id {owner_filter}
+                ORDER BY ur.user_id
+                LIMIT 1
+            ) owner ON TRUE
+            WHERE sr.bib_key = ANY(:bib_keys) AND {visibility};"""
     )
     try:
-        results = db.session.execute(sql, params)
-
-        reference = None
-        for row in results.mappings():
-            if reference is None:
-                reference = {
-                    "id": row["id"],
-                    "bib_key": row["bib_key"],
-                    "is_public": row["is_public"],
-                    "reference_type": row["reference_type"],
-                    "reference_type_id": row["reference_type_id"],
-                    "username": row["username"],
-                    "created_at": row["created_at"],
-                    "owner_id": row["owner_id"],
-                    "fields": {},
-                }
-
-            # Add field value if it exists
-            if row["key_name"] is not None:
-                reference["fields"][row["key_name"]] = row["value"]
-
-        return reference
+        by_key = {}
+        for row in db.session.execute(sql, params).mappings():
+            fields, tag = unpack_document(row["document"])
+            by_key[row["bib_key"]] = {
+                "id": row["id"],
+                "bib_key": row["bib_key"],
+                "is_public": row["is_public"],
+                "reference_type": row["reference_type"],
+                "reference_type_id": row["reference_type_id"],
+                "username": row["username"],
+                "created_at": row["created_at"],
+                "owner_id": row["owner_id"],
+                "fields": fields,
+                "tag": tag,
+                "bibtex": row["bibtex"],
+                "bibtex_version": row["bibtex_version"],
+            }
     except Exception as e:
-        raise DatabaseError(f"Failed to fetch reference by bib_key '{bib_key}': {e}")
+        raise DatabaseError(f"Failed to fetch references by bib_key: {e}") from e
+
+    for bib_key in bib_keys:
+        reference = by_key.get(bib_key)
+        request_cache.remember(("reference", bib_key, user_id), reference)
+        if reference is not None:
+            # Samasta rivistä saadaan myös näkyvyys ja tagi
+            request_cache.remember(("visibility", bib_key), reference["is_public"])
+            request_cache.remember(("reference_tag", reference["id"]), reference["tag"])
+    return by_key
 
 
 def add_reference(reference_type_name: str, data: dict, editing: bool = False) -> int:
     """Lisää uusi viite tietokantaan tai päivitä olemassa oleva."""
     try:
-        # 1) Hae viitetyypin id
-        result = (
-            db.session.execute(
-                text("SELECT id FROM reference_types WHERE name = :name"),
-                {"name": reference_type_name},
-            )
-            .mappings()
-            .first()
-        )
-
-        if result is None:
+        # 1) Hae viitetyypin id ja sen kentät rekisteristä
+        reference_type_id = metadata.get_type_id(reference_type_name)
+        if reference_type_id is None:
             raise DatabaseError(f"Unknown reference type: {reference_type_name}")
-
-        reference_type_id = result["id"]
+        field_ids = metadata.get_field_ids(reference_type_id)
 
         # 2) Tarkista onko viite jo olemassa
         old_bib_key = (
@@ -247,7 +774,9 @@ def add_reference(reference_type_name: str, data: dict, editing: bool = False) -
 
         existing_ref = (
             db.session.execute(
-                text("SELECT id FROM single_reference WHERE bib_key = :bib_key"),
+                text(
+                    "SELECT id, is_public FROM single_reference WHERE bib_key = :bib_key"
+                ),
                 {"bib_key": bib_key_to_check},
             )
             .mappings()
@@ -258,15 +787,21 @@ def add_reference(reference_type_name: str, data: dict, editing: bool = False) -
             is_public = data.pop("is_public")
         elif editing and existing_ref:
             # Muokataan olemassa olevaa viitettä, säilytetään nykyinen arvo
-            current_visibility = db.session.execute(
-                text("SELECT is_public FROM single_reference WHERE id = :ref_id"),
-                {"ref_id": existing_ref["id"]},
-            ).scalar()
+            current_visibility = existing_ref["is_public"]
             is_public = current_visibility if current_visibility is not None else True
         else:
             # Uusi viite, oletus on True (julkinen)
             is_public = True
 
+        # 3) Tallennettavat kentät: vain viitetyyppiin kuuluvat ja ei-tyhjät
+        stored = {
+            key: value
+            for key, value in data.items()
+            if key not in ("bib_key", "old_bib_key")
+            and value not in (None, "")
+            and key in field_ids
+        }
+
         if existing_ref:
             if not editing:
                 raise DatabaseError(
@@ -284,30 +819,32 @@ def add_reference(reference_type_name: str, data: dict, editing: bool = False) -
             )
             db.session.flush()
 
-            # Päivitä bib_key JA is_public jos ne muuttuivat
             if old_bib_key and data["bib_key"] != old_bib_key:
+                # Vanha avain poistuu omistajien muutossyötteestä
                 db.session.execute(
                     text(
-                        """UPDATE single_reference
-                           SET bib_key = :new_bib_key, is_public = :is_public
-                           WHERE id = :id"""
-                    ),
-                    {
-                        "new_bib_key": data["bib_key"],
-                        "is_public": is_public,
-                        "id": ref_id,
-                    },
-                )
-            else:
-                # Päivitä vain is_public (bib_key pysyy samana)
-                db.session.execute(
-                    text(
-                        """UPDATE single_reference
-                           SET is_public = :is_public
-                           WHERE id = :id"""
+                        """
+                        INSERT INTO deleted_references (bib_key, user_id)
+                        SELECT :old_bib_key, ur.user_id
+                        FROM user_ref ur
+                        WHERE ur.reference_id = :id
+                        """
                     ),
-                    {"is_public": is_public, "id": ref_id},
+                    {"old_bib_key": old_bib_key, "id": ref_id},
                 )
+            # Päivitä bib_key (ennallaan, jos sitä ei vaihdettu) ja is_public
+            db.session.execute(
+                text(
+                    """UPDATE single_reference
+                       SET bib_key = :new_bib_key, is_public = :is_public
+                       WHERE id = :id"""
+                ),
+                {
+                    "new_bib_key": data["bib_key"],
+                    "is_public": is_public,
+                    "id": ref_id,
+                },
+            )
         else:
             # Luodaan uusi viite
             insert_ref = db.session.execute(
@@ -331,53 +868,28 @@ def add_reference(reference_type_name: str, data: dict, editing: bool = False) -
                 row = insert_ref.mappings().first()
                 ref_id = row["id"]
 
-        # 3) Lisää kentät reference_values-tauluun
-        for key, value in data.items():
-            if key in ("bib_key", "old_bib_key"):
-                continue
-            if value in (None, ""):
-                continue
-
-            field_row = (
-                db.session.execute(
-                    text(
-                        """
-                    SELECT f.id
-                    FROM fields f
-                    JOIN reference_type_fields rtf ON rtf.field_id = f.id
-                    WHERE f.key_name = :key_name
-                    AND rtf.reference_type_id = :reference_type_id;
-                    """
-                    ),
-                    {
-                        "key_name": key,
-                        "reference_type_id": reference_type_id,
-                    },
-                )
-                .mappings()
-                .first()
-            )
-
-            if field_row is None:
-                continue
-
-            field_id = field_row["id"]
-
+        # 4) Kaikki kenttäarvot yhdellä lauseella
+        if stored:
             db.session.execute(
                 text(
                     """
                     INSERT INTO reference_values (reference_id, field_id, value)
-                    VALUES (:reference_id, :field_id, :value);
+                    SELECT :reference_id, v.field_id, v.value
+                    FROM unnest(CAST(:field_ids AS int[]), CAST(:values AS text[]))
+                        AS v(field_id, value)
                     """
                 ),
                 {
                     "reference_id": ref_id,
-                    "field_id": field_id,
-                    "value": value,
+                    "field_ids": [field_ids[key] for key in stored],
+                    "values": [str(value) for value in stored.values()],
                 },
             )
 
+        refresh_reference_documents([ref_id])
+
         db.session.commit()
+        request_cache.invalidate()
         return ref_id
 
     except Exception as exc:
@@ -388,6 +900,9 @@ def add_reference(reference_type_name: str, data: dict, editing: bool = False) -
 def delete_reference_by_bib_key(bib_key: str, user_id: int | None = None) -> None:
     """Delete a reference (and its values via cascade) by bib_key.
 
+    A tombstone is written to deleted_references for every user the
+    reference belonged to, in the same statement as the delete.
+
     Args:
         bib_key: The BibTeX key of the reference to delete.
         user_id: Optional user id to enforce ownership.
@@ -395,346 +910,585 @@ def delete_reference_by_bib_key(bib_key: str, user_id: int | None = None) -> Non
     Raises:
         DatabaseError: If the delete operation fails.
     """
+    if user_id is None:
+        delete = "DELETE FROM single_reference sr WHERE sr.bib_key = :bib_key"
+    else:
+        delete = """DELETE FROM single_reference sr
+                USING user_ref ur
+                WHERE sr.bib_key = :bib_key
+                  AND ur.reference_id = sr.id
+                  AND ur.user_id = :user_id"""
     try:
-        if user_id is None:
-            db.session.execute(
-                text("DELETE FROM single_reference WHERE bib_key = :bib_key"),
-                {"bib_key": bib_key},
-            )
-        else:
-            db.session.execute(
-                text(
-                    """
-                    DELETE FROM single_reference sr
-                    USING user_ref ur
-                    WHERE sr.bib_key = :bib_key
-                      AND ur.reference_id = sr.id
-                      AND ur.user_id = :user_id
-                    """
-                ),
-                {"bib_key": bib_key, "user_id": user_id},
-            )
+        # CTE:n lause näkee user_ref-rivit ennen kaskadipoistoa
+        db.session.execute(
+            text(
+                f"""
+                WITH deleted AS (
+                    {delete}
+                    RETURNING sr.id, sr.bib_key
+                )
+                INSERT INTO deleted_references (bib_key, user_id)
+                SELECT deleted.bib_key, owner.user_id
+                FROM deleted
+                JOIN user_ref owner ON owner.reference_id = deleted.id
+                """
+            ),
+            {"bib_key": bib_key, "user_id": user_id},
+        )
         db.session.commit()
+        request_cache.invalidate()
     except Exception as e:
         db.session.rollback()
         raise DatabaseError(f"Failed to delete reference '{bib_key}': {e}") from e
 
 
-def search_reference_by_query(query: str, user_id: int | None = None) -> list:
-    """Search for references matching the given query string."""
-    try:
-        if user_id is not None:
-            user_join = "JOIN user_ref ur ON ur.reference_id = sr.id"
-            where_clause = "WHERE sr.is_public = TRUE"
-            params = {"query": f"%{query}%", "user_id": user_id}
-        else:
-            user_join = "JOIN user_ref ur ON ur.reference_id = sr.id"
-            where_clause = "WHERE sr.is_public = TRUE"
-            params = {"query": f"%{query}%"}
-
-        sql = text(
-            f"""
-            SELECT
-                sr.id,
-                sr.bib_key,
-                sr.is_public,
-                rt.name AS reference_type,
-                sr.created_at,
-                f.key_name,
-                rv.value,
-                t.id AS tag_id,
-                t.name AS tag_name,
-                u.username AS username,
-                ur.user_id as owner_id
-            FROM single_reference sr
-            {user_join}
-            LEFT JOIN users u ON u.id = ur.user_id
-            JOIN reference_types rt ON sr.reference_type_id = rt.id
-            LEFT JOIN reference_values rv ON sr.id = rv.reference_id
-            LEFT JOIN fields f ON rv.field_id = f.id
-            LEFT JOIN reference_tags reftag ON sr.id = reftag.reference_id
-            LEFT JOIN tags t ON reftag.tag_id = t.id
-            {where_clause}
-              AND sr.id IN (
-                SELECT DISTINCT sr2.id
-                FROM single_reference sr2
-                LEFT JOIN reference_values rv2 ON sr2.id = rv2.reference_id
-                WHERE sr2.bib_key LIKE :query
-                   OR rv2.value LIKE :query
-            )
-            ORDER BY sr.created_at DESC, sr.id, f.key_name;
-            """
-        )
-        results = db.session.execute(sql, params)
+def delete_references_by_bib_keys(bib_keys: list, user_id: int) -> list:
+    """Delete many of a user's references with one statement.
 
-        references = {}
-        for row in results.mappings():
-            ref_id = row["id"]
-            if ref_id not in references:
-                references[ref_id] = {
-                    "bib_key": row["bib_key"],
-                    "is_public": row["is_public"],
-                    "reference_type": row["reference_type"],
-                    "created_at": row["created_at"],
-                    "username": row["username"],
-                    "owner_id": row["owner_id"],
-                    "fields": {},
-                    "tag": None,
-                }
+    Keys that do not exist or do not belong to the user are ignored. A
+    tombstone is written for every owner of a deleted reference, as in
+    delete_reference_by_bib_key().
 
-                if row["tag_id"] is not None:
-                    references[ref_id]["tag"] = {
-                        "id": row["tag_id"],
-                        "name": row["tag_name"],
-                    }
+    Args:
+        bib_keys: The BibTeX keys of the references to delete.
+        user_id: Owner of the references.
 
-            if row["key_name"] is not None:
-                references[ref_id]["fields"][row["key_name"]] = row["value"]
+    Returns:
+        list: The bib_keys that were deleted.
 
-        return list(references.values())
+    Raises:
+        DatabaseError: If the delete operation fails.
+    """
+    if not bib_keys:
+        return []
+    try:
+        deleted = (
+            db.session.execute(
+                text(
+                    """
+                    WITH deleted AS (
+                        DELETE FROM single_reference sr
+                        USING user_ref ur
+                        WHERE sr.bib_key = ANY(:bib_keys)
+                          AND ur.reference_id = sr.id
+                          AND ur.user_id = :user_id
+                        RETURNING sr.id, sr.bib_key
+                    ),
+                    tombstones AS (
+                        INSERT INTO deleted_references (bib_key, user_id)
+                        SELECT deleted.bib_key, owner.user_id
+                        FROM deleted
+                        JOIN user_ref owner ON owner.reference_id = deleted.id
+                    )
+                    SELECT bib_key FROM deleted
+                    """
+                ),
+                {"bib_keys": list(bib_keys), "user_id": user_id},
+            )
+            .scalars()
+            .all()
+        )
+        db.session.commit()
+        request_cache.invalidate()
+        return deleted
     except Exception as e:
-        raise DatabaseError(
-            f"Failed to search references with query '{query}': {e}"
-        ) from e
+        db.session.rollback()
+        raise DatabaseError(f"Failed to delete references: {e}") from e
 
 
-def sort_references_by_created_at(references: list, sort_type: str = "newest") -> list:
-    """Sort references by creation date.
+def set_references_visibility(bib_keys: list, user_id: int, is_public: bool) -> list:
+    """Set is_public for many of a user's references with one statement.
+
+    Keys that do not exist or do not belong to the user are ignored.
 
     Args:
-        references: List of reference dictionaries
-        sort_type: "newest" (desc) or "oldest" (asc)
+        bib_keys: The BibTeX keys of the references to update.
+        user_id: Owner of the references.
+        is_public: New visibility.
 
     Returns:
-        list: Sorted references
+        list: The bib_keys that were updated.
+
+    Raises:
+        DatabaseError: If the update fails.
     """
-    if not references:
+    if not bib_keys:
         return []
-
-    def get_created_at(ref):
-        created_at = ref.get("created_at")
-        if hasattr(created_at, "isoformat"):
-            return created_at.isoformat()
-        return created_at or ""
-
-    reverse = sort_type == "newest"
     try:
-        return sorted(references, key=get_created_at, reverse=reverse)
+        updated = (
+            db.session.execute(
+                text(
+                    """
+                    UPDATE single_reference sr
+                    SET is_public = :is_public,
+                        updated_at = CURRENT_TIMESTAMP,
+                        change_xid = pg_current_xact_id()
+                    FROM user_ref ur
+                    WHERE sr.bib_key = ANY(:bib_keys)
+                      AND ur.reference_id = sr.id
+                      AND ur.user_id = :user_id
+                    RETURNING sr.bib_key
+                    """
+                ),
+                {
+                    "bib_keys": list(bib_keys),
+                    "user_id": user_id,
+                    "is_public": is_public,
+                },
+            )
+            .scalars()
+            .all()
+        )
+        db.session.commit()
+        request_cache.invalidate()
+        return updated
     except Exception as e:
-        print(f"Warning: Date sorting failed: {e}")
-        return references
+        db.session.rollback()
+        raise DatabaseError(f"Failed to update reference visibility: {e}") from e
 
 
-def sort_references_by_field(
-    references: list, sort_by: str, sort_order: str = "asc"
-) -> list:
-    """Sort references by a field value (title, author, etc.).
+def _filter_conditions(ref_type_filter: str, tag_filter: str, params: dict) -> tuple:
+    """Return SQL conditions (type, tag) for the filters; "TRUE" when unset."""
+    type_condition = tag_condition = "TRUE"
+    if ref_type_filter.strip():
+        # Tyypin id rekisteristä, jolloin ehto osuu suoraan sr-tauluun
+        type_condition = "sr.reference_type_id = :ref_type_id"
+        params["ref_type_id"] = metadata.get_type_id(ref_type_filter.strip())
+    if tag_filter.strip():
+        tag_condition = """EXISTS (
+                    SELECT 1
+                    FROM reference_tags rtag
+                    JOIN tags tg ON tg.id = rtag.tag_id
+                    WHERE rtag.reference_id = sr.id AND tg.name = :tag_name
+                )"""
+        params["tag_name"] = tag_filter.strip()
+    return type_condition, tag_condition
+
+
+def _filter_clause(ref_type_filter: str, tag_filter: str, params: dict) -> str:
+    """Return SQL conditions for the reference type and tag filters."""
+    return "".join(
+        f" AND {condition}"
+        for condition in _filter_conditions(ref_type_filter, tag_filter, params)
+        if condition != "TRUE"
+    )
+
+
+def build_reference_query(
+    query: str = "",
+    ref_type_filter: str = "",
+    tag_filter: str = "",
+    sort_by: str = "newest",
+    limit: int | None = None,
+    cursor: str | None = None,
+    fuzzy: bool = False,
+    use_trigram: bool = False,
+    facets: bool = False,
+) -> tuple:
+    """Compose one SQL statement that searches, filters, sorts and pages.
+
+    The search match, type and tag filters, keyset cursor, ORDER BY and
+    LIMIT are all applied in the inner "matched" query, so only the rows
+    of the requested page are joined with their owner.
+
+    With facets=True the matching references (before cursor and limit) are
+    also counted per type, tag and year in the same statement. Each facet
+    is counted with the other active filters only, so the type counts do
+    not depend on the chosen type and the user can switch to a sibling
+    value; the year counts use both filters. Every row then has a "facets"
+    column holding the counts as a JSON array of [facet, value, count], and
+    a row with a NULL id is returned when the page itself is empty.
 
     Args:
-        references: List of reference dictionaries
-        sort_by: Field name to sort by ("title", "author")
-        sort_order: "asc" or "desc"
+        query: Optional search string. Empty lists all public references.
+        ref_type_filter: Optional reference type name to filter by.
+        tag_filter: Optional tag name to filter by.
+        sort_by: One of KEYSET_SORTS. "relevance" without a query and
+                 unknown values fall back to "newest".
+        limit: Optional maximum number of references.
+        cursor: Optional cursor from encode_cursor() to continue after.
+        fuzzy: Match the query with ILIKE/trigrams instead of full-text search.
+        use_trigram: Whether pg_trgm is available for fuzzy matching.
+        facets: Whether to count the matches per type, tag and year.
 
     Returns:
-        list: Sorted references
+        tuple: (sql, params, sort_by) where sort_by is the order actually used.
     """
+    if sort_by not in KEYSET_SORTS or (sort_by == "relevance" and not query):
+        sort_by = "newest"
+    params = {}
+    ctes = []
+    search_join = ""
+
+    if not query:
+        match = "TRUE"
+        rank = "0.0"
+    elif not fuzzy:
+        params["query"] = query
+        ctes.append(f"search AS (SELECT {SEARCH_TSQUERY} AS query)")
+        search_join = "CROSS JOIN search"
+        match = "sr.search_vector @@ search.query"
+        rank = "ts_rank(sr.search_vector, search.query)"
+    else:
+        params["query"] = query
+        params["like_query"] = f"%{_escape_like(query)}%"
+        match = "sr.search_text ILIKE :like_query"
+        rank = "1.0"
+        if use_trigram:
+            match = f"({match} OR :query <% sr.search_text)"
+            rank = (
+                "GREATEST(similarity(:query, sr.search_text), "
+                "word_similarity(:query, sr.search_text))"
+            )
 
-    def get_sort_value(ref):
-        value = ref.get("fields", {}).get(sort_by, "")
-
-        cleaned = str(value).lower().strip()
+    keyset = _keyset_clause(cursor, sort_by, params, alias="hits")
+    limit_clause = ""
+    if limit is not None:
+        limit_clause = "LIMIT :limit"
+        params["limit"] = limit
+
+    facet_columns = ""
+    page_filters = ""
+    if facets:
+        # Suodattimet sarakkeina: kunkin fasetin määrät lasketaan ilman omaa ehtoaan
+        type_condition, tag_condition = _filter_conditions(
+            ref_type_filter, tag_filter, params
+        )
+        filters = ""
+        page_filters = " AND hits.type_match AND hits.tag_match"
+        facet_columns = f""",
+                    rt.name AS type_name,
+                    sr.document -> 'tag' ->> 'name' AS tag_name,
+                    sr.document -> 'fields' ->> 'year' AS year,
+                    ({type_condition}) AS type_match,
+                    ({tag_condition}) AS tag_match"""
+    else:
+        filters = _filter_clause(ref_type_filter, tag_filter, params)
+    hits = f"""
+                SELECT
+                    sr.id,
+                    sr.bib_key,
+                    sr.created_at,
+                    sr.title_sort,
+                    sr.author_sort,
+                    ({rank})::float8 AS rank{facet_columns}
+                FROM single_reference sr
+                JOIN reference_types rt ON sr.reference_type_id = rt.id
+                {search_join}
+                WHERE sr.is_public = TRUE
+                  AND {match}{filters}
+                  AND EXISTS (
+                      SELECT 1 FROM user_ref ur WHERE ur.reference_id = sr.id
+                  )"""
+
+    if facets:
+        # Osumat lasketaan kerran; sekä sivu että fasetit luetaan samasta CTE:stä
+        ctes.append(f"hits AS ({hits})")
+        hits_source = "hits"
+    else:
+        hits_source = f"({hits}) hits"
+
+    ctes.append(
+        f"""matched AS (
+            SELECT hits.*
+            FROM {hits_source}
+            WHERE TRUE{page_filters}{keyset}
+            ORDER BY {_keyset_order(sort_by, alias="hits")}
+            {limit_clause}
+        )"""
+    )
 
-        for article in ["the ", "a ", "an "]:
-            if cleaned.startswith(article):
-                cleaned = cleaned[len(article) :].strip()
-                break
+    page = f"""
+        SELECT
+            sr.id,
+            sr.bib_key,
+            sr.is_public,
+            rt.name AS reference_type,
+            sr.created_at,
+            sr.title_sort,
+            sr.author_sort,
+            sr.document,
+            m.rank,
+            owner.username,
+            owner.user_id AS owner_id
+        FROM matched m
+        JOIN single_reference sr ON sr.id = m.id
+        JOIN reference_types rt ON sr.reference_type_id = rt.id
+        LEFT JOIN LATERAL (
+            SELECT ur.user_id, u.username
+            FROM user_ref ur
+            LEFT JOIN users u ON u.id = ur.user_id
+            WHERE ur.reference_id = sr.id
+            ORDER BY ur.user_id
+            LIMIT 1
+        ) owner ON TRUE
+    """
 
-        return cleaned
+    if not facets:
+        sql = f"""
+            WITH {", ".join(ctes)}
+            {page}
+            ORDER BY {_keyset_order(sort_by, alias="m")}
+        """
+        return text(sql), params, sort_by
+
+    ctes.append(
+        """facet_counts AS (
+            SELECT 'type' AS facet, type_name AS value, COUNT(*) AS count
+            FROM hits
+            WHERE tag_match
+            GROUP BY type_name
+            UNION ALL
+            SELECT 'tag', tag_name, COUNT(*)
+            FROM hits
+            WHERE type_match
+            GROUP BY tag_name
+            UNION ALL
+            SELECT 'year', year, COUNT(*)
+            FROM hits
+            WHERE type_match AND tag_match
+            GROUP BY year
+        )"""
+    )
+    ctes.append(
+        """facets AS (
+            SELECT COALESCE(
+                jsonb_agg(
+                    jsonb_build_array(facet, value, count)
+                    ORDER BY facet, count DESC, value
+                ),
+                '[]'::jsonb
+            ) AS facets
+            FROM facet_counts
+            WHERE value IS NOT NULL
+        )"""
+    )
+    sql = f"""
+        WITH {", ".join(ctes)}
+        SELECT facets.facets, page.*
+        FROM facets
+        LEFT JOIN ({page}) page ON TRUE
+        ORDER BY {_keyset_order(sort_by, alias="page")}
+    """
+    return text(sql), params, sort_by
+
+
+def _run_reference_query(
+    query: str,
+    ref_type_filter: str,
+    tag_filter: str,
+    sort_by: str,
+    limit: int | None,
+    cursor: str | None,
+    fuzzy: bool,
+    threshold: float,
+    facets: bool,
+) -> tuple:
+    """Execute build_reference_query() and return (references, facet rows)."""
+    use_trigram = bool(query) and fuzzy and trigram_search_available()
+    if use_trigram:
+        # <% käyttää tätä kynnysarvoa ja osaa hyödyntää GIN-indeksiä
+        db.session.execute(
+            text(
+                "SELECT set_config("
+                "'pg_trgm.word_similarity_threshold', :threshold, true)"
+            ),
+            {"threshold": str(threshold)},
+        )
 
-    reverse = sort_order == "desc"
-    return sorted(references, key=get_sort_value, reverse=reverse)
+    sql, params, _ = build_reference_query(
+        query=query,
+        ref_type_filter=ref_type_filter,
+        tag_filter=tag_filter,
+        sort_by=sort_by,
+        limit=limit,
+        cursor=cursor,
+        fuzzy=fuzzy,
+        use_trigram=use_trigram,
+        facets=facets,
+    )
+    results = db.session.execute(sql, params)
+
+    references = []
+    facet_rows = []
+    for row in results.mappings():
+        if facets:
+            facet_rows = row["facets"]
+            # Tyhjällä sivulla palautuu vain fasettirivi
+            if row["id"] is None:
+                continue
+        fields, tag = unpack_document(row["document"])
+        references.append(
+            {
+                "id": row["id"],
+                "bib_key": row["bib_key"],
+                "is_public": row["is_public"],
+                "reference_type": row["reference_type"],
+                "created_at": row["created_at"],
+                "username": row["username"],
+                "owner_id": row["owner_id"],
+                "rank": row["rank"],
+                "title_sort": row["title_sort"],
+                "author_sort": row["author_sort"],
+                "fields": fields,
+                "tag": tag,
+            }
+        )
+    return references, facet_rows
 
 
-def sort_references_by_bib_key(references: list, sort_order: str = "asc") -> list:
-    """Sort references by bib_key alphabetically.
+def find_references(
+    query: str = "",
+    ref_type_filter: str = "",
+    tag_filter: str = "",
+    sort_by: str = "newest",
+    limit: int | None = None,
+    cursor: str | None = None,
+    fuzzy: bool = False,
+    threshold: float = DEFAULT_FUZZY_THRESHOLD,
+) -> list:
+    """Run build_reference_query() and return the matching public references.
 
     Args:
-        references: List of reference dictionaries
-        sort_order: "asc" or "desc"
+        See build_reference_query(). threshold is the minimum word
+        similarity (0-1) for fuzzy matches.
 
     Returns:
-        list: Sorted references
-    """
+        list: Reference dictionaries in the requested order, each with a
+              "rank" key (0.0 when there is no query).
 
-    def get_bib_key(ref):
-        bib_key = ref.get("bib_key", "")
-        return str(bib_key).lower().strip()
-
-    reverse = sort_order == "desc"
+    Raises:
+        DatabaseError: If database query fails.
+    """
     try:
-        return sorted(references, key=get_bib_key, reverse=reverse)
-    except Exception as e:
-        print(f"Warning: Bib key sorting failed: {e}")
+        references, _ = _run_reference_query(
+            query,
+            ref_type_filter,
+            tag_filter,
+            sort_by,
+            limit,
+            cursor,
+            fuzzy,
+            threshold,
+            facets=False,
+        )
         return references
+    except Exception as e:
+        raise DatabaseError(f"Failed to find references: {e}") from e
 
 
-def get_references_filtered_sorted(
+def find_references_with_facets(
+    query: str = "",
     ref_type_filter: str = "",
     tag_filter: str = "",
     sort_by: str = "newest",
-    user_id: int | None = None,
-) -> list:
-    try:
-        if user_id is not None:
-            user_join = "JOIN user_ref ur ON ur.reference_id = sr.id"
-            params = {"user_id": user_id}
-        else:
-            # VAIN julkiset viitteet (kaikki käyttäjät)
-            user_join = "JOIN user_ref ur ON ur.reference_id = sr.id"
-            params = {}
-
-        base_sql = f"""
-            SELECT DISTINCT
-                sr.id,
-                sr.bib_key,
-                rt.name AS reference_type,
-                sr.created_at,
-                f.key_name,
-                rv.value,
-                t.id AS tag_id,
-                t.name AS tag_name,
-                ur.user_id as owner_id
-            FROM single_reference sr
-            {user_join}
-            JOIN reference_types rt ON sr.reference_type_id = rt.id
-            LEFT JOIN reference_values rv ON sr.id = rv.reference_id
-            LEFT JOIN fields f ON rv.field_id = f.id
-            LEFT JOIN reference_tags reftag ON sr.id = reftag.reference_id
-            LEFT JOIN tags t ON reftag.tag_id = t.id
-            WHERE sr.is_public = TRUE
-        """
-
-        conditions = []
-
-        if ref_type_filter.strip():
-            conditions.append("rt.name = :ref_type")
-            params["ref_type"] = ref_type_filter.strip()
-
-        if tag_filter.strip():
-            conditions.append("t.name = :tag_name")
-            params["tag_name"] = tag_filter.strip()
-
-        if conditions:
-            base_sql += " AND " + " AND ".join(conditions)
-
-        if sort_by == "oldest":
-            order_clause = "ORDER BY sr.created_at ASC, sr.id, f.key_name"
-        elif sort_by == "bib_key":
-            order_clause = "ORDER BY sr.bib_key ASC, sr.id, f.key_name"
-        else:
-            order_clause = "ORDER BY sr.created_at DESC, sr.id, f.key_name"
-
-        base_sql += " " + order_clause
-
-        results = db.session.execute(text(base_sql), params)
-
-        references = {}
-        for row in results.mappings():
-            ref_id = row["id"]
-            if ref_id not in references:
-                references[ref_id] = {
-                    "id": ref_id,
-                    "bib_key": row["bib_key"],
-                    "reference_type": row["reference_type"],
-                    "created_at": row["created_at"],
-                    "owner_id": row["owner_id"],
-                    "fields": {},
-                    "tag": None,
-                }
-
-            if row["tag_id"] is not None:
-                references[ref_id]["tag"] = {
-                    "id": row["tag_id"],
-                    "name": row["tag_name"],
-                }
-
-            if row["key_name"] and row["value"]:
-                references[ref_id]["fields"][row["key_name"]] = row["value"]
+    limit: int | None = None,
+    cursor: str | None = None,
+    fuzzy: bool = False,
+    threshold: float = DEFAULT_FUZZY_THRESHOLD,
+) -> dict:
+    """Like find_references(), but also count all matches per facet.
 
-        reference_list = list(references.values())
+    The counts cover every reference matching the query, not just the
+    requested page, and come from the same SQL statement. A facet's counts
+    ignore its own filter, so sibling values keep their counts.
 
-        if sort_by == "title":
-            reference_list = sort_references_by_field(reference_list, "title", "asc")
-        elif sort_by == "author":
-            reference_list = sort_references_by_field(reference_list, "author", "asc")
-        return reference_list
+    Returns:
+        dict: {"references": list,
+               "facets": {"type" | "tag" | "year": [{"value", "count"}]}}
+              with each facet sorted by count, largest first. References
+              without a tag or year are not counted in those facets.
 
+    Raises:
+        DatabaseError: If database query fails.
+    """
+    try:
+        references, facet_rows = _run_reference_query(
+            query,
+            ref_type_filter,
+            tag_filter,
+            sort_by,
+            limit,
+            cursor,
+            fuzzy,
+            threshold,
+            facets=True,
+        )
     except Exception as e:
-        raise DatabaseError(f"Failed to fetch filtered references: {e}") from e
+        raise DatabaseError(f"Failed to find references: {e}") from e
+
+    facets = {name: [] for name in FACET_NAMES}
+    for facet, value, count in facet_rows:
+        facets[facet].append({"value": value, "count": count})
+    return {"references": references, "facets": facets}
 
 
-def filter_and_sort_search_results(
-    search_results: list,
+def search_reference_by_query(
+    query: str,
     ref_type_filter: str = "",
     tag_filter: str = "",
     sort_by: str = "newest",
+    limit: int | None = None,
+    cursor: str | None = None,
+    fuzzy: bool = False,
+    threshold: float = DEFAULT_FUZZY_THRESHOLD,
 ) -> list:
-    """Apply filters and sorting to existing search results.
+    """Search public references.
 
-    Args:
-        search_results: Results from search_reference_by_query()
-        ref_type_filter: Filter by reference type
-        tag_filter: Filter by tag name
-        sort_by: Sort type - "newest", "oldest", "title", "author", "bib_key"
+    By default PostgreSQL full-text search is used: the query uses websearch
+    syntax ("quoted phrase", or, -exclude), every word also matches as a
+    prefix and rank is ts_rank against search_vector.
 
-    Returns:
-        list: Filtered and sorted results
-    """
-    if not search_results:
-        return []
+    With fuzzy=True the query is matched against search_text with ILIKE or
+    pg_trgm word similarity, so misspelled words are found too. Rank is the
+    larger of similarity() and word_similarity(). Both use the trigram GIN
+    index. If pg_trgm is not installed only the ILIKE match is used.
 
-    filtered = search_results.copy()
-
-    if ref_type_filter.strip():
-        filtered = [
-            ref for ref in filtered if ref.get("reference_type") == ref_type_filter
-        ]
+    Args:
+        query: Search string.
+        ref_type_filter: Optional reference type name to filter by.
+        tag_filter: Optional tag name to filter by.
+        sort_by: One of KEYSET_SORTS. Other values return newest first.
+        limit: Optional maximum number of references to return.
+        cursor: Optional cursor from encode_cursor() to continue after.
+        fuzzy: Use trigram matching instead of full-text search.
+        threshold: Minimum word similarity (0-1) for fuzzy matches.
 
-    if tag_filter.strip():
-        filtered = [
-            ref
-            for ref in filtered
-            if ref.get("tag") is not None
-            and isinstance(ref.get("tag"), dict)
-            and ref["tag"].get("name") == tag_filter
-        ]
+    Returns:
+        list: Matching reference dictionaries, each with a "rank" key.
 
+    Raises:
+        DatabaseError: If database query fails.
+    """
     try:
-        if sort_by in ["newest", "oldest"]:
-            sorted_results = sort_references_by_created_at(filtered, sort_by)
-        elif sort_by in ["title", "author"]:
-            sorted_results = sort_references_by_field(filtered, sort_by, "asc")
-        elif sort_by == "bib_key":
-            sorted_results = sort_references_by_bib_key(filtered, "asc")
-        else:
-            sorted_results = sort_references_by_created_at(filtered, "newest")
-
-        return sorted_results
-    except Exception as e:
-        print(f"Warning: Sorting failed, returning filtered results: {e}")
-        return filtered
+        return find_references(
+            query=query,
+            ref_type_filter=ref_type_filter,
+            tag_filter=tag_filter,
+            sort_by=sort_by,
+            limit=limit,
+            cursor=cursor,
+            fuzzy=fuzzy,
+            threshold=threshold,
+        )
+    except DatabaseError as e:
+        raise DatabaseError(
+            f"Failed to search references with query '{query}': {e}"
+        ) from e
 
 
 def get_reference_visibility(bib_key: str) -> bool:
     """Get the is_public status of a reference."""
+    cached = request_cache.lookup(("visibility", bib_key))
+    if cached is not request_cache.MISSING:
+        return cached
     try:
         sql = text("SELECT is_public FROM single_reference WHERE bib_key = :bib_key")
         result = db.session.execute(sql, {"bib_key": bib_key}).mappings().first()
 
-        if result:
-            return result["is_public"]
-
-        return True
+        is_public = result["is_public"] if result else True
+        request_cache.remember(("visibility", bib_key), is_public)
+        return is_public
 
     except Exception as e:
         raise DatabaseError(f"Failed to fetch visibility for '{bib_key}': {e}") from e
@@ -0,0 +1,47 @@
+"""Request-scoped identity map for repeated lookups.
+
+Lookup functions store their results on flask.g, so asking for the same
+reference, tag or visibility again during one request is answered from
+memory. Write functions call invalidate() so later reads in the same
+request see the change. Outside an application context nothing is cached.
+"""
+
+from flask import g, has_app_context
+
+# Palautetaan, kun avainta ei ole välimuistissa (None on kelvollinen arvo)
+MISSING = object()
+
+_CACHE_ATTR = "_lookup_cache"
+
+
+def _store() -> dict | None:
+    """Return the cache dictionary of the current app context, if any."""
+    if not has_app_context():
+        return None
+    store = g.get(_CACHE_ATTR)
+    if store is None:
+        store = {}
+        setattr(g, _CACHE_ATTR, store)
+    return store
+
+
+def lookup(key: tuple):
+    """Return the cached value for key, or MISSING."""
+    store = _store()
+    if store is None:
+        return MISSING
+    return store.get(key, MISSING)
+
+
+def remember(key: tuple, value) -> None:
+    """Cache value under key for the rest of the request."""
+    store = _store()
+    if store is not None:
+        store[key] = value
+
+
+def invalidate() -> None:
+    """Forget everything cached during this request."""
+    store = _store()
+    if store is not None:
+        store.clear()
@@ -1,9 +1,13 @@
 """Tag management utilities."""
 
+import threading
+
 from sqlalchemy import text
 from sqlalchemy.exc import IntegrityError
 
 from src.config import db
+from src.utils import request_cache
+from src.utils.references import refresh_reference_documents
 
 
 class TagError(Exception):
@@ -18,6 +22,82 @@ class TagExistsError(Exception):
     pass
 
 
+# Prosessin yhteinen tagilista. Versio on tietokannassa (tag_version), joten
+# toisen prosessin tagimuutos vanhentaa myös tämän prosessin listan.
+_tag_lock = threading.Lock()
+_tag_cache = None
+
+_VERSION_KEY = ("tag_version",)
+
+
+def get_tag_version() -> int:
+    """Return the version of the tag list, bumped by every tag write.
+
+    The version is read from the database once per request.
+
+    Raises:
+        TagError: If the database query fails.
+    """
+    version = request_cache.lookup(_VERSION_KEY)
+    if version is request_cache.MISSING:
+        try:
+            version = db.session.execute(
+                text("SELECT version FROM tag_version")
+            ).scalar_one()
+        except Exception as e:
+            raise TagError(f"Failed to fetch tag version: {e}.")
+        request_cache.remember(_VERSION_KEY, version)
+    return version
+
+
+def bump_tag_version() -> None:
+    """Mark the tag list stale in every process.
+
+    The counter is updated in the caller's transaction, so call this before
+    committing the tag write.
+    """
+    db.session.execute(text("UPDATE tag_version SET version = version + 1"))
+    clear_tag_cache()
+
+
+def clear_tag_cache() -> None:
+    """Drop the tag list cached in this process; it is reloaded on next use."""
+    global _tag_cache
+    with _tag_lock:
+        _tag_cache = None
+
+
+def _get_tag_cache() -> dict:
+    """Return the cached tag list, loading it if its version is stale.
+
+    Returns:
+        dict: {"version": int, "tags": [{"id", "name"}], "ids": {name: id}}
+
+    Raises:
+        TagError: If the database query fails.
+    """
+    global _tag_cache
+    version = get_tag_version()
+    cache = _tag_cache
+    if cache is not None and cache["version"] == version:
+        return cache
+
+    with _tag_lock:
+        if _tag_cache is None or _tag_cache["version"] != version:
+            sql = text("SELECT id, name FROM tags ORDER BY name;")
+            try:
+                rows = db.session.execute(sql).fetchall()
+            except Exception as e:
+                raise TagError(f"Failed to fetch tags: {e}.")
+            tags = [{"id": row[0], "name": row[1]} for row in rows]
+            _tag_cache = {
+                "version": version,
+                "tags": tags,
+                "ids": {tag["name"]: tag["id"] for tag in tags},
+            }
+        return _tag_cache
+
+
 def add_tag(tag: str):
     """Add a new tag to the database.
 
@@ -31,11 +111,17 @@ def add_tag(tag: str):
         TagExistsError: If a tag with this name already exists.
         TagError: If the database operation fails.
     """
+    # Tunnettu nimi ei tarvitse epäonnistuvaa INSERT-lausetta
+    if tag in _get_tag_cache()["ids"]:
+        raise TagExistsError(f"Failed to add tag {tag}: tag already exists.")
+
     sql = text("INSERT INTO tags (name) VALUES (:tag) RETURNING id;")
     try:
-        tag_id = db.session.execute(sql, {"tag": tag})
+        tag_id = db.session.execute(sql, {"tag": tag}).scalar_one()
+        bump_tag_version()
         db.session.commit()
-        return tag_id.fetchone()[0]
+        request_cache.invalidate()
+        return tag_id
 
     except IntegrityError as e:
         db.session.rollback()
@@ -45,8 +131,180 @@ def add_tag(tag: str):
         raise TagError(f"Failed to add tag {tag}: {e}.")
 
 
+def get_or_create_tag(tag: str) -> tuple:
+    """Return the id of a tag, creating the tag if it does not exist.
+
+    Uses one INSERT ... ON CONFLICT DO NOTHING statement, so concurrent
+    callers never fail on the unique name. If a concurrent insert of the
+    same name commits while the statement waits, its snapshot cannot see
+    the row, so the tag is selected again.
+
+    Args:
+        tag: The name of the tag.
+
+    Returns:
+        tuple: (tag_id, created) where created is True if the tag was added.
+
+    Raises:
+        TagError: If the database operation fails.
+    """
+    tag_id = _get_tag_cache()["ids"].get(tag)
+    if tag_id is not None:
+        return tag_id, False
+
+    sql = text(
+        """
+        WITH inserted AS (
+            INSERT INTO tags (name) VALUES (:tag)
+            ON CONFLICT (name) DO NOTHING
+            RETURNING id
+        )
+        SELECT id, TRUE AS created FROM inserted
+        UNION ALL
+        SELECT id, FALSE FROM tags WHERE name = :tag
+        LIMIT 1
+        """
+    )
+    try:
+        row = db.session.execute(sql, {"tag": tag}).first()
+        if row is None:
+            # Rinnakkainen lisäys commitoitiin tämän lauseen tilannekuvan jälkeen;
+            # uusi lause näkee sen (READ COMMITTED)
+            row = db.session.execute(
+                text("SELECT id, FALSE AS created FROM tags WHERE name = :tag"),
+                {"tag": tag},
+            ).one()
+        if row.created:
+            bump_tag_version()
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        raise TagError(f"Failed to add tag {tag}: {e}.")
+
+    if not row.created:
+        # Toinen prosessi lisäsi tagin; sen versio on jo kasvatettu
+        clear_tag_cache()
+    request_cache.invalidate()
+    return row.id, row.created
+
+
+def rename_tag(tag_id: int, new_name: str) -> None:
+    """Rename a tag and update the documents of its references.
+
+    Args:
+        tag_id: The ID of the tag to rename.
+        new_name: The new name.
+
+    Raises:
+        TagExistsError: If another tag already has the new name.
+        TagError: If the tag does not exist or the database operation fails.
+    """
+    try:
+        renamed = db.session.execute(
+            text("UPDATE tags SET name = :name WHERE id = :tag_id RETURNING id;"),
+            {"name": new_name, "tag_id": tag_id},
+        ).scalar()
+        if renamed is None:
+            raise TagError(f"Tag {tag_id} does not exist.")
+        reference_ids = (
+            db.session.execute(
+                text("SELECT reference_id FROM reference_tags WHERE tag_id = :tag_id"),
+                {"tag_id": tag_id},
+            )
+            .scalars()
+            .all()
+        )
+        refresh_reference_documents(reference_ids)
+        bump_tag_version()
+        db.session.commit()
+    except IntegrityError as e:
+        db.session.rollback()
+        raise TagExistsError(f"Failed to rename tag {tag_id} to {new_name}: {e}.")
+    except TagError:
+        db.session.rollback()
+        raise
+    except Exception as e:
+        db.session.rollback()
+        raise TagError(f"Failed to rename tag {tag_id} to {new_name}: {e}.")
+
+    request_cache.invalidate()
+
+
+def merge_tags(source_id: int, target_id: int) -> int:
+    """Move every reference of one tag to another and delete the first tag.
+
+    Args:
+        source_id: The ID of the tag to merge; it is deleted.
+        target_id: The ID of the tag that remains.
+
+    Returns:
+        int: Number of references moved to the target tag.
+
+    Raises:
+        TagError: If the tags are the same, either tag does not exist or the
+                  database operation fails.
+    """
+    if source_id == target_id:
+        raise TagError(f"Cannot merge tag {source_id} into itself.")
+    try:
+        # Lukitaan molemmat tagit, ettei kumpaakaan poisteta kesken siirron
+        found = set(
+            db.session.execute(
+                text(
+                    "SELECT id FROM tags WHERE id IN (:source_id, :target_id) "
+                    "FOR UPDATE"
+                ),
+                {"source_id": source_id, "target_id": target_id},
+            ).scalars()
+        )
+        for tag_id in (source_id, target_id):
+            if tag_id not in found:
+                raise TagError(f"Tag {tag_id} does not exist.")
+        # Siirto yhdellä lauseella; viitteellä voi jo olla kohdetagi
+        reference_ids = (
+            db.session.execute(
+                text(
+                    """
+                    WITH moved AS (
+                        DELETE FROM reference_tags
+                        WHERE tag_id = :source_id
+                        RETURNING reference_id
+                    ),
+                    inserted AS (
+                        INSERT INTO reference_tags (reference_id, tag_id)
+                        SELECT reference_id, :target_id FROM moved
+                        ON CONFLICT (reference_id, tag_id) DO NOTHING
+                    )
+                    SELECT reference_id FROM moved
+                    """
+                ),
+                {"source_id": source_id, "target_id": target_id},
+            )
+            .scalars()
+            .all()
+        )
+        db.session.execute(
+            text("DELETE FROM tags WHERE id = :source_id;"), {"source_id": source_id}
+        )
+        refresh_reference_documents(reference_ids)
+        bump_tag_version()
+        db.session.commit()
+    except TagError:
+        db.session.rollback()
+        raise
+    except Exception as e:
+        db.session.rollback()
+        raise TagError(f"Failed to merge tag {source_id} into {target_id}: {e}.")
+
+    request_cache.invalidate()
+    return len(reference_ids)
+
+
 def get_tags():
-    """Fetch all tags from the database.
+    """Fetch all tags.
+
+    The list is cached for the whole process and reloaded only after a tag
+    write in any process has bumped the tag version in the database.
 
     Returns:
         list: List of dictionaries containing tag id and name,
@@ -56,18 +314,15 @@ def get_tags():
     Raises:
         TagError: If the database query fails.
     """
-    sql = text("SELECT id, name FROM tags ORDER BY name;")
-    try:
-        result = db.session.execute(sql)
-        return [{"id": row[0], "name": row[1]} for row in result.fetchall()]
-
-    except Exception as e:
-        raise TagError(f"Failed to fetch tags: {e}.")
+    return [dict(tag) for tag in _get_tag_cache()["tags"]]
 
 
 def get_tag_id_by_name(tag_name: str):
     """Fetch a tag's ID by its name.
 
+    Names are looked up from the cached tag list. A name missing from it is
+    checked from the database, since another process may have added it.
+
     Args:
         tag_name: The name of the tag to fetch.
 
@@ -77,11 +332,17 @@ def get_tag_id_by_name(tag_name: str):
     Raises:
         TagError: If the database query fails.
     """
+    tag_id = _get_tag_cache()["ids"].get(tag_name)
+    if tag_id is not None:
+        return tag_id
+
     sql = text("SELECT id FROM tags WHERE name = :tag_name;")
     try:
         result = db.session.execute(sql, {"tag_name": tag_name})
         row = result.fetchone()
         if row:
+            # Välimuisti on vanhentunut
+            clear_tag_cache()
             return row[0]
         return None
 
@@ -103,6 +364,9 @@ def get_tag_by_reference(reference_id: int):
     Raises:
         TagError: If the database query fails.
     """
+    cached = request_cache.lookup(("reference_tag", reference_id))
+    if cached is not request_cache.MISSING:
+        return cached
     sql = text(
         "SELECT t.id, t.name "
         "FROM tags t "
@@ -112,43 +376,123 @@ def get_tag_by_reference(reference_id: int):
     try:
         result = db.session.execute(sql, {"reference_id": reference_id})
         row = result.fetchone()
-        if row:
-            return {"id": row[0], "name": row[1]}
-        return None
+        tag = {"id": row[0], "name": row[1]} if row else None
+        request_cache.remember(("reference_tag", reference_id), tag)
+        return tag
 
     except Exception as e:
         raise TagError(f"Failed to fetch tag for reference {reference_id}: {e}.")
 
 
-def add_tag_to_reference(tag_id: int, reference_id: int):
-    """Associate a tag with a reference, removing any existing tag associations first.
+def tag_references(tag_id: int, reference_ids: list) -> int:
+    """Set the tag of many references with one statement.
 
-    This function replaces any existing tag for the reference with the new one.
-    A reference can only have one tag at a time.
+    A reference can only have one tag at a time, so any other tag of the
+    references is removed. References that already have the tag are left
+    untouched.
 
     Args:
-        tag_id: The ID of the tag to associate with the reference.
-        reference_id: The ID of the reference to tag.
+        tag_id: The ID of the tag.
+        reference_ids: The IDs of the references to tag.
+
+    Returns:
+        int: Number of references whose tag changed.
 
     Raises:
         TagError: If the database operation fails.
     """
+    if not reference_ids:
+        return 0
+    sql = text(
+        """
+        WITH removed AS (
+            DELETE FROM reference_tags
+            WHERE reference_id = ANY(:reference_ids) AND tag_id <> :tag_id
+            RETURNING reference_id
+        ),
+        inserted AS (
+            INSERT INTO reference_tags (reference_id, tag_id)
+            SELECT DISTINCT reference_id, :tag_id
+            FROM unnest(CAST(:reference_ids AS int[])) AS reference_id
+            ON CONFLICT (reference_id, tag_id) DO NOTHING
+            RETURNING reference_id
+        )
+        SELECT reference_id FROM removed
+        UNION
+        SELECT reference_id FROM inserted
+        """
+    )
     try:
-        delete_sql = text(
-            "DELETE FROM reference_tags WHERE reference_id = :reference_id;"
+        changed = (
+            db.session.execute(
+                sql, {"tag_id": tag_id, "reference_ids": list(reference_ids)}
+            )
+            .scalars()
+            .all()
         )
-        db.session.execute(delete_sql, {"reference_id": reference_id})
+        refresh_reference_documents(changed)
+        db.session.commit()
+        request_cache.invalidate()
+        return len(changed)
+
+    except Exception as e:
+        db.session.rollback()
+        raise TagError(f"Failed to add tag {tag_id} to references: {e}.")
 
-        insert_sql = text(
-            "INSERT INTO reference_tags (tag_id, reference_id) "
-            "VALUES (:tag_id, :reference_id);"
+
+def untag_references(reference_ids: list) -> int:
+    """Remove the tags of many references with one statement.
+
+    Args:
+        reference_ids: The IDs of the references.
+
+    Returns:
+        int: Number of references that had a tag.
+
+    Raises:
+        TagError: If the database operation fails.
+    """
+    if not reference_ids:
+        return 0
+    sql = text(
+        "DELETE FROM reference_tags WHERE reference_id = ANY(:reference_ids) "
+        "RETURNING reference_id;"
+    )
+    try:
+        changed = (
+            db.session.execute(sql, {"reference_ids": list(reference_ids)})
+            .scalars()
+            .all()
         )
-        db.session.execute(insert_sql, {"tag_id": tag_id, "reference_id": reference_id})
+        refresh_reference_documents(changed)
         db.session.commit()
+        request_cache.invalidate()
+        return len(set(changed))
 
     except Exception as e:
         db.session.rollback()
-        raise TagError(f"Failed to add tag {tag_id} to reference {reference_id}: {e}.")
+        raise TagError(f"Failed to delete tags from references: {e}.")
+
+
+def add_tag_to_reference(tag_id: int, reference_id: int):
+    """Associate a tag with a reference, removing any existing tag associations first.
+
+    This function replaces any existing tag for the reference with the new one.
+    A reference can only have one tag at a time.
+
+    Args:
+        tag_id: The ID of the tag to associate with the reference.
+        reference_id: The ID of the reference to tag.
+
+    Raises:
+        TagError: If the database operation fails.
+    """
+    try:
+        tag_references(tag_id, [reference_id])
+    except TagError as e:
+        raise TagError(
+            f"Failed to add tag {tag_id} to reference {reference_id}: {e}"
+        ) from e
 
 
 def delete_tag_from_reference(reference_id: int):
@@ -163,12 +507,8 @@ def delete_tag_from_reference(reference_id: int):
         TagError: If the database operation fails.
     """
     try:
-        delete_sql = text(
-            "DELETE FROM reference_tags WHERE reference_id = :reference_id;"
-        )
-        db.session.execute(delete_sql, {"reference_id": reference_id})
-        db.session.commit()
-
-    except Exception as e:
-        db.session.rollback()
-        raise TagError(f"Failed to delete tag from reference {reference_id}: {e}.")
+        untag_references([reference_id])
+    except TagError as e:
+        raise TagError(
+            f"Failed to delete tag from reference {reference_id}: {e}"
+        ) from e
@@ -6,6 +6,7 @@ from sqlalchemy import text
 from werkzeug.security import check_password_hash, generate_password_hash
 
 from src.config import db
+from src.utils import request_cache
 
 
 class UserError(Exception):
@@ -125,19 +126,42 @@ def link_reference_to_user(user_id: int, reference_id: int) -> None:
         """
     )
     db.session.execute(sql, {"user_id": user_id, "reference_id": reference_id})
+    # Viite ilmestyy käyttäjän muutossyötteeseen
+    db.session.execute(
+        text(
+            """
+            UPDATE single_reference
+            SET updated_at = CURRENT_TIMESTAMP, change_xid = pg_current_xact_id()
+            WHERE id = :reference_id
+            """
+        ),
+        {"reference_id": reference_id},
+    )
     db.session.commit()
+    request_cache.invalidate()
 
 
 def unlink_reference_from_user(user_id: int, reference_id: int) -> None:
-    """Remove link between user and reference."""
+    """Remove link between user and reference.
+
+    Writes a tombstone so the reference leaves the user's change feed.
+    """
     sql = text(
         """
-        DELETE FROM user_ref
-        WHERE user_id = :user_id AND reference_id = :reference_id
+        WITH unlinked AS (
+            DELETE FROM user_ref
+            WHERE user_id = :user_id AND reference_id = :reference_id
+            RETURNING user_id, reference_id
+        )
+        INSERT INTO deleted_references (bib_key, user_id)
+        SELECT sr.bib_key, unlinked.user_id
+        FROM unlinked
+        JOIN single_reference sr ON sr.id = unlinked.reference_id
         """
     )
     db.session.execute(sql, {"user_id": user_id, "reference_id": reference_id})
     db.session.commit()
+    request_cache.invalidate()
 
 
 def ensure_user_tables() -> None:
@@ -210,6 +234,7 @@ def update_username(user_id: int, new_username: str) -> dict:
         .first()
     )
     db.session.commit()
+    request_cache.invalidate()
     return _row_to_user(result)
 
 